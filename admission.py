@@ -0,0 +1,221 @@
+"""
+Admission control for StudentTracker: rate limiting and load shedding
+
+Every API request is classified (auth, write, read, report) and charged to a
+token bucket for the caller - the JWT identity when a valid token is sent,
+otherwise the client IP - so one client cannot monopolise the workers.
+Logins and registrations are charged to the client IP plus the submitted
+email, so everyone behind one proxy or NAT does not share a single login
+bucket, and to a much larger per-IP bucket against password spraying.
+The client IP is the one TRUSTED_PROXY_HOPS reverse proxies forwarded.
+Independently, when this worker already has ADMISSION_MAX_IN_FLIGHT
+requests running or its database pool is exhausted, low-priority reads are
+shed with 503 and a Retry-After header so writes and logins still get
+through.
+
+Buckets and counters are per worker process; size RATE_LIMITS accordingly.
+"""
+import math
+import threading
+import time
+from collections import Counter
+
+from flask import current_app, g, jsonify, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+
+from models import db
+from utils import is_subrequest
+
+# Endpoints that are not classified by HTTP method alone
+ROUTE_CLASSES = {
+    'auth.login': 'auth',
+    'auth.register': 'auth',
+    'auth.refresh': 'auth',
+    'attendance.get_attendance_summary': 'report',
+    'attendance.get_student_monthly': 'report',
+    'admin.dashboard': 'report',
+}
+
+# Classes that may be shed under load
+LOW_PRIORITY = ('read', 'report')
+
+EXEMPT_ENDPOINTS = ('health_check', 'static', 'index')
+
+# Buckets idle this long are full again and can be dropped
+BUCKET_IDLE_SECONDS = 600
+
+
+class TokenBucket:
+    """Classic token bucket: `burst` tokens, refilled at `rate` per second"""
+
+    __slots__ = ('burst', 'rate', 'tokens', 'updated')
+
+    def __init__(self, burst, rate):
+        self.burst = burst
+        self.rate = rate
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self):
+        """Consume one token; returns seconds to wait, 0 when allowed"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class AdmissionController:
+    """Per-worker buckets, in-flight count and shed/limit counters"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._swept_at = time.monotonic()
+        self.in_flight = 0
+        self.counters = Counter()
+
+    def charge(self, key, route_class, limits):
+        """Charge one request to the caller's bucket for this route class"""
+        burst, rate = limits[route_class]
+        with self._lock:
+            bucket = self._buckets.get((key, route_class))
+            if bucket is None:
+                bucket = self._buckets[(key, route_class)] = TokenBucket(burst, rate)
+            wait = bucket.take()
+            self._sweep()
+        return wait
+
+    def _sweep(self):
+        now = time.monotonic()
+        if now - self._swept_at < BUCKET_IDLE_SECONDS:
+            return
+        self._swept_at = now
+        self._buckets = {
+            key: bucket for key, bucket in self._buckets.items()
+            if now - bucket.updated < BUCKET_IDLE_SECONDS
+        }
+
+    def enter(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def leave(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'in_flight': self.in_flight,
+                'tracked_buckets': len(self._buckets),
+                'counters': dict(self.counters),
+            }
+
+
+admission = AdmissionController()
+
+
+def classify(endpoint, method):
+    if endpoint in ROUTE_CLASSES:
+        return ROUTE_CLASSES[endpoint]
+    return 'read' if method in ('GET', 'HEAD') else 'write'
+
+
+def caller_key():
+    """Verified JWT identity, or the client address for anonymous calls"""
+    try:
+        verify_jwt_in_request(optional=True)
+        identity = get_jwt_identity()
+    except Exception:
+        identity = None  # the view's own jwt_required reports the error
+    if identity:
+        return f'user:{identity}'
+    return f'ip:{request.remote_addr}'
+
+
+def auth_key(key):
+    """Bucket key for an auth request: per address and submitted account"""
+    if not key.startswith('ip:'):
+        return key
+    data = request.get_json(silent=True)
+    email = data.get('email') if isinstance(data, dict) else None
+    if not isinstance(email, str) or not email.strip():
+        return key
+    return f'{key}:account:{email.strip().lower()}'
+
+
+def pool_saturated():
+    """True when every connection the pool may open (pool_size plus the
+    configured max_overflow) is checked out"""
+    pool = db.engine.pool
+    if not hasattr(pool, 'checkedout') or not hasattr(pool, 'size'):
+        return False
+    # overflow() is the overflow in use right now, not the limit
+    max_overflow = getattr(pool, '_max_overflow', 0)
+    if max_overflow < 0:
+        return False  # unbounded overflow never runs out
+    return pool.checkedout() >= pool.size() + max_overflow
+
+
+def _reject(status_code, message, retry_after):
+    response = jsonify({'success': False, 'message': message})
+    response.status_code = status_code
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def init_app(app):
+    """Install admission checks around every API request"""
+    if not app.config.get('RATE_LIMIT_ENABLED', True):
+        return
+
+    @app.before_request
+    def _admit():
+        if not request.path.startswith('/api/') or request.endpoint in EXEMPT_ENDPOINTS:
+            return None
+        config = current_app.config
+        route_class = classify(request.endpoint, request.method)
+
+        key = caller_key()
+        if route_class == 'auth':
+            key = auth_key(key)
+        wait = admission.charge(key, route_class, config['RATE_LIMITS'])
+        if route_class == 'auth' and 'auth_address' in config['RATE_LIMITS']:
+            # Every account tried from one address, shared by a NAT or proxy
+            wait = max(wait, admission.charge(
+                f'ip:{request.remote_addr}', 'auth_address', config['RATE_LIMITS']
+            ))
+        if wait:
+            admission.count(f'rate_limited.{route_class}')
+            return _reject(429, 'Too many requests', wait)
+
+        # Batched sub-requests are charged above, but run inside the
+        # batch request's in-flight slot
+        if is_subrequest():
+            return None
+
+        if route_class in LOW_PRIORITY and (
+            admission.in_flight >= config['ADMISSION_MAX_IN_FLIGHT'] or pool_saturated()
+        ):
+            admission.count(f'shed.{route_class}')
+            return _reject(503, 'Server busy, please retry', config['ADMISSION_RETRY_AFTER'])
+
+        admission.enter()
+        g._admitted = True
+        admission.count(f'admitted.{route_class}')
+        return None
+
+    @app.teardown_request
+    def _release(error=None):
+        # Sub-requests share the batch request's g; leave its flag alone
+        if is_subrequest():
+            return
+        if g.pop('_admitted', False):
+            admission.leave()
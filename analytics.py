@@ -0,0 +1,349 @@
+"""
+Institution-wide attendance analytics for StudentTracker
+
+Attendance is read in keyset-ordered chunks of ANALYTICS_CHUNK_ROWS rows as
+raw columns (16 byte keys, date, one byte status code) and folded into
+NumPy accumulators, so memory depends on the number of student/course
+pairs and calendar days seen, not on the number of attendance rows:
+
+- per (student, course) present and total counts, from which the
+  percentile bands per department, semester or course are computed
+- per calendar day counts by status, from which rolling 7/30-day rates
+  and day-of-week effects are computed
+
+A scan serves all three endpoints and is reused for ANALYTICS_CACHE_SECONDS
+per worker and filter combination. With sharded attendance each shard is
+scanned in turn into the same accumulators.
+"""
+import re
+import threading
+import time
+from datetime import date, datetime
+
+import numpy as np
+from flask import current_app
+from sqlalchemy import LargeBinary, SmallInteger, select, type_coerce
+
+from models import db, Attendance, Course, Student, ATTENDANCE_STATUS_CODES
+import metrics
+import sharding
+
+STATUS_CODES = dict(ATTENDANCE_STATUS_CODES)
+STATUS_SLOTS = max(STATUS_CODES.values()) + 1
+
+PERCENTILES = (10, 25, 50, 75, 90)
+
+GROUPINGS = ('department', 'semester', 'course')
+
+# 1970-01-01, day 0 of datetime64[D], was a Thursday; Monday is 0 below
+EPOCH_WEEKDAY = 3
+WEEKDAYS = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+
+_DEPARTMENT = re.compile(r'^[A-Za-z]+')
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def department_of(course_code):
+    """Department of a course: the letter prefix of its code (CS101 -> CS)"""
+    match = _DEPARTMENT.match(course_code or '')
+    return match.group(0).upper() if match else 'OTHER'
+
+
+def _rates(numerator, denominator):
+    """numerator / denominator as rounded percentages, None where undefined"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rates = np.round(numerator / denominator * 100, 2)
+    return [None if denominator_value == 0 else rate
+            for rate, denominator_value in zip(rates.tolist(), denominator.tolist())]
+
+
+class AttendanceAggregator:
+    """Chunk-at-a-time accumulators over attendance rows
+
+    Rows arrive as parallel arrays of student index, course index, day
+    (days since 1970-01-01) and status code.
+    """
+
+    def __init__(self, course_count):
+        self.course_count = max(course_count, 1)
+        self.pairs = np.empty(0, dtype=np.int64)
+        self.pair_present = np.empty(0, dtype=np.int64)
+        self.pair_total = np.empty(0, dtype=np.int64)
+        self.daily = np.zeros((0, STATUS_SLOTS), dtype=np.int64)
+        self.rows = 0
+        self.chunks = 0
+
+    def add(self, student_index, course_index, day, status):
+        if not len(status):
+            return
+        present = (status == STATUS_CODES['present']).astype(np.int64)
+        pairs = student_index.astype(np.int64) * self.course_count + course_index
+
+        # Merge this chunk into the running per-pair counts
+        keys, inverse = np.unique(np.concatenate((self.pairs, pairs)), return_inverse=True)
+        self.pair_present = np.bincount(
+            inverse, weights=np.concatenate((self.pair_present, present)), minlength=keys.size
+        ).astype(np.int64)
+        self.pair_total = np.bincount(
+            inverse, weights=np.concatenate((self.pair_total, np.ones_like(present))), minlength=keys.size
+        ).astype(np.int64)
+        self.pairs = keys
+
+        length = max(self.daily.size, (int(day.max()) + 1) * STATUS_SLOTS)
+        slots = np.bincount(day.astype(np.int64) * STATUS_SLOTS + status, minlength=length)
+        if slots.size > self.daily.size:
+            grown = np.zeros(slots.size, dtype=np.int64)
+            grown[:self.daily.size] = self.daily.ravel()
+            self.daily = grown.reshape(-1, STATUS_SLOTS)
+        self.daily += slots.reshape(-1, STATUS_SLOTS)
+
+        self.rows += len(status)
+        self.chunks += 1
+
+    def distribution(self, course_groups, group_count, at_risk_percent):
+        """Per group: students, mean and percentile bands of attendance %"""
+        percentage = self.pair_present / np.maximum(self.pair_total, 1) * 100
+        groups = course_groups[self.pairs % self.course_count]
+
+        order = np.lexsort((percentage, groups))
+        ordered = percentage[order]
+        counts = np.bincount(groups, minlength=group_count)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        last = np.maximum(counts - 1, 0)
+
+        bands = {}
+        for q in PERCENTILES:
+            position = starts + last * (q / 100)
+            low = np.floor(position).astype(np.int64)
+            high = np.minimum(low + 1, starts + last)
+            if ordered.size:
+                low = np.minimum(low, ordered.size - 1)
+                high = np.minimum(high, ordered.size - 1)
+                values = ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+            else:
+                values = np.zeros(group_count)
+            bands[f'p{q}'] = np.round(values, 2)
+
+        sums = np.bincount(groups, weights=percentage, minlength=group_count)
+        at_risk = np.bincount(groups[percentage < at_risk_percent], minlength=group_count)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            means = np.round(sums / counts, 2)
+        return counts, means, at_risk, bands
+
+    def _days(self):
+        """(first day, per-day status counts) trimmed to days with marks"""
+        totals = self.daily.sum(axis=1)
+        marked = np.flatnonzero(totals)
+        if not marked.size:
+            return 0, self.daily[:0]
+        return marked[0], self.daily[marked[0]:marked[-1] + 1]
+
+    def trends(self, windows, days):
+        """Daily marks and rolling present rates over the last `days` days"""
+        first, daily = self._days()
+        present = daily[:, STATUS_CODES['present']]
+        total = daily.sum(axis=1)
+        result = {}
+        present_sums = np.concatenate(([0], np.cumsum(present)))
+        total_sums = np.concatenate(([0], np.cumsum(total)))
+        for window in windows:
+            start = np.maximum(np.arange(1, len(total) + 1) - window, 0)
+            result[f'rate_{window}d'] = (
+                present_sums[1:] - present_sums[start],
+                total_sums[1:] - total_sums[start],
+            )
+
+        keep = slice(max(len(total) - days, 0), len(total))
+        dates = (np.arange(len(total)) + first).astype('datetime64[D]')[keep]
+        response = {
+            'dates': dates.astype(str).tolist(),
+            'marks': total[keep].tolist(),
+            'daily_rate': _rates(present[keep], total[keep]),
+        }
+        for name, (window_present, window_total) in result.items():
+            response[name] = _rates(window_present[keep], window_total[keep])
+        return response
+
+    def weekdays(self):
+        """Status rates per day of the week and their offset from the overall rate"""
+        first, daily = self._days()
+        weekday = (np.arange(len(daily)) + first + EPOCH_WEEKDAY) % 7
+        by_weekday = np.stack(
+            [np.bincount(weekday, weights=daily[:, slot], minlength=7) for slot in range(STATUS_SLOTS)],
+            axis=1,
+        )
+        total = by_weekday.sum(axis=1)
+        overall_total = total.sum()
+        overall = by_weekday[:, STATUS_CODES['present']].sum() / overall_total * 100 if overall_total else 0
+
+        rates = {status: _rates(by_weekday[:, code], total) for status, code in STATUS_CODES.items()}
+        return {
+            'overall_present_rate': round(float(overall), 2),
+            'weekdays': [
+                {
+                    'weekday': WEEKDAYS[index],
+                    'marks': int(total[index]),
+                    **{f'{status}_rate': rates[status][index] for status in STATUS_CODES},
+                    'effect': (
+                        round(rates['present'][index] - overall, 2)
+                        if rates['present'][index] is not None else None
+                    ),
+                }
+                for index in range(7)
+            ],
+        }
+
+
+class AttendanceAnalytics:
+    """One analytics scan: the accumulators plus the course metadata they index"""
+
+    def __init__(self, courses, aggregator, seconds):
+        self.courses = courses
+        self.aggregator = aggregator
+        self.seconds = seconds
+        self.generated_at = datetime.utcnow()
+
+    def meta(self):
+        return {
+            'rows': self.aggregator.rows,
+            'chunks': self.aggregator.chunks,
+            'scan_seconds': round(self.seconds, 3),
+            'generated_at': self.generated_at.isoformat(),
+        }
+
+    def distribution(self, group_by, at_risk_percent):
+        if group_by == 'course':
+            labels = [f"{course['course_code']} {course['course_name']}" for course in self.courses]
+        elif group_by == 'semester':
+            labels = [course['semester'] or 'Unassigned' for course in self.courses]
+        else:
+            labels = [department_of(course['course_code']) for course in self.courses]
+        names, course_groups = np.unique(np.array(labels or [''], dtype=object).astype(str), return_inverse=True)
+
+        counts, means, at_risk, bands = self.aggregator.distribution(course_groups, len(names), at_risk_percent)
+        groups = []
+        for index, name in enumerate(names.tolist()):
+            if not counts[index]:
+                continue
+            group = {
+                'group': name,
+                'students': int(counts[index]),
+                'mean': float(means[index]),
+                'at_risk': int(at_risk[index]),
+                **{band: float(values[index]) for band, values in bands.items()},
+            }
+            if group_by == 'course':
+                course = self.courses[int(np.flatnonzero(course_groups == index)[0])]
+                group['course_id'] = course['id']
+            groups.append(group)
+        return {'group_by': group_by, 'at_risk_percent': at_risk_percent, 'groups': groups}
+
+
+def _filtered_courses(department=None, semester=None, course_id=None):
+    query = db.session.query(
+        type_coerce(Course.id, LargeBinary), Course.id, Course.course_code, Course.course_name, Course.semester
+    )
+    if course_id:
+        query = query.filter(Course.id == course_id)
+    if semester:
+        query = query.filter(Course.semester == semester)
+    courses = [
+        {'key': key, 'id': course_id, 'course_code': code, 'course_name': name, 'semester': semester}
+        for key, course_id, code, name, semester in query.order_by(Course.course_code)
+    ]
+    if department:
+        courses = [course for course in courses if department_of(course['course_code']) == department.upper()]
+    return courses
+
+
+def scan(from_date=None, to_date=None, department=None, semester=None, course_id=None, chunk_rows=None):
+    """Read matching attendance in chunks and fold it into an AttendanceAnalytics"""
+    started = time.perf_counter()
+    chunk_rows = chunk_rows or current_app.config['ANALYTICS_CHUNK_ROWS']
+    courses = _filtered_courses(department, semester, course_id)
+    aggregator = AttendanceAggregator(len(courses))
+    if not courses:
+        return AttendanceAnalytics(courses, aggregator, time.perf_counter() - started)
+
+    course_keys = np.array([course['key'] for course in courses], dtype='S16')
+    course_order = np.argsort(course_keys)
+    sorted_courses = course_keys[course_order]
+    student_keys = np.sort(np.array(
+        db.session.execute(select(type_coerce(Student.id, LargeBinary))).scalars().all() or [b''], dtype='S16'
+    ))
+
+    table = Attendance.__table__
+    row_key = type_coerce(table.c.id, LargeBinary)
+    statement = select(
+        row_key,
+        type_coerce(table.c.student_id, LargeBinary),
+        type_coerce(table.c.course_id, LargeBinary),
+        table.c.attendance_date,
+        type_coerce(table.c.status, SmallInteger),
+    )
+    if from_date:
+        statement = statement.where(table.c.attendance_date >= from_date)
+    if to_date:
+        statement = statement.where(table.c.attendance_date <= to_date)
+    if department or semester or course_id:
+        statement = statement.where(table.c.course_id.in_([course['id'] for course in courses]))
+
+    for session in sharding.sessions_for(course_id):
+        last_key = None
+        while True:
+            chunk = statement if last_key is None else statement.where(row_key > last_key)
+            rows = session.execute(chunk.order_by(row_key).limit(chunk_rows)).all()
+            if not rows:
+                break
+            last_key = rows[-1][0]
+            _, students, course_ids, days, statuses = zip(*rows)
+
+            students = np.array(students, dtype='S16')
+            course_ids = np.array(course_ids, dtype='S16')
+            student_index = np.minimum(np.searchsorted(student_keys, students), student_keys.size - 1)
+            course_position = np.minimum(np.searchsorted(sorted_courses, course_ids), sorted_courses.size - 1)
+            # Drop rows whose student or course appeared after the key lists were read
+            known = (student_keys[student_index] == students) & (sorted_courses[course_position] == course_ids)
+
+            aggregator.add(
+                student_index[known],
+                course_order[course_position[known]],
+                np.array(days, dtype='datetime64[D]').astype(np.int64)[known],
+                np.array(statuses, dtype=np.int64)[known],
+            )
+            if len(rows) < chunk_rows:
+                break
+
+    return AttendanceAnalytics(courses, aggregator, time.perf_counter() - started)
+
+
+def _parse_date(value):
+    return date.fromisoformat(value) if value else None
+
+
+def analytics_for(args):
+    """Cached scan for the filters in a request's query string"""
+    filters = (
+        _parse_date(args.get('from_date')),
+        _parse_date(args.get('to_date')),
+        args.get('department') or None,
+        args.get('semester') or None,
+        args.get('course_id') or None,
+    )
+    ttl = current_app.config['ANALYTICS_CACHE_SECONDS']
+    now = time.monotonic()
+    with _cache_lock:
+        cached = _cache.get(filters)
+    hit = bool(cached and cached[0] > now)
+    metrics.cache_result('analytics', hit)
+    if hit:
+        return cached[1]
+
+    result = scan(*filters)
+    with _cache_lock:
+        for key in [key for key, (expires, _) in _cache.items() if expires <= now]:
+            del _cache[key]
+        _cache[filters] = (now + ttl, result)
+    return result
@@ -21,7 +21,19 @@ def create_app(config_name=None):
     # Load configuration
     app.config.from_object(config[config_name])
     
-    # Initialize extensions
+    # Client address and scheme as the trusted reverse proxy saw them
+    if app.config.get('TRUSTED_PROXY_HOPS'):
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        hops = app.config['TRUSTED_PROXY_HOPS']
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops)
+    
+    # Logging first, so everything below logs through the queue
+    import logging_setup
+    logging_setup.init_app(app)
+    
+    # Initialize extensions (attendance shards are extra binds, added first)
+    import sharding
+    sharding.init_app(app)
     db.init_app(app)
     CORS(app, resources={r"/api/*": {"origins": app.config.get('CORS_ORIGINS', '*')}})
     jwt = JWTManager(app)
@@ -53,16 +65,45 @@ def create_app(config_name=None):
             'message': 'Authorization header is missing'
         }), 401
     
+    import revocation
+    revocation.init_app(jwt)
+    
     # Register blueprints
     from routes.auth import auth_bp
     from routes.admin import admin_bp
     from routes.course import course_bp
     from routes.attendance import attendance_bp
+    from routes.batch import batch_bp
+    from routes.student import student_bp
+    from routes.jobs import jobs_bp
     
     app.register_blueprint(auth_bp)
     app.register_blueprint(admin_bp)
     app.register_blueprint(course_bp)
     app.register_blueprint(attendance_bp)
+    app.register_blueprint(batch_bp)
+    app.register_blueprint(student_bp)
+    app.register_blueprint(jobs_bp)
+
+    # First, so every request is counted, including rejected ones
+    import metrics
+    metrics.init_app(app)
+
+    import search_index
+    search_index.init_app(app)
+    
+    # Before admission control, so a profile covers the whole request
+    import profiling
+    profiling.init_app(app)
+    
+    import admission
+    admission.init_app(app)
+    
+    import write_behind
+    write_behind.init_app(app)
+    
+    import compression
+    compression.init_app(app)
 
     
     
@@ -81,7 +122,7 @@ def create_app(config_name=None):
     # Serve frontend
     @app.route('/')
     def index():
-        return app.send_static_file('index.html')
+        return compression.serve_page('index.html')
     @app.route('/test-page')
     def test_page():
         return '''
@@ -122,13 +163,32 @@ def create_app(config_name=None):
             'message': 'Internal server error'
         }), 500
     
-    # Database initialization
-    with app.app_context():
-        db.create_all()
-        print("Database tables created successfully!")
+    # Database initialization (production uses migrate.py instead); stamped
+    # like a migrated database, so a later migrate.py leaves it alone
+    if app.config.get('AUTO_CREATE_SCHEMA', True):
+        import migrations
+        with app.app_context():
+            migrations.create_schema()
+            app.logger.info("Database tables created successfully")
     
     return app
 
+def dispose_engines(app):
+    """Drop pooled connections inherited from a parent process
+
+    Called in each gunicorn worker after fork when the app is preloaded, so
+    workers never share a socket opened by the master.
+    """
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
 if __name__ == '__main__':
     app = create_app()
+    import metrics
+    metrics.reset(app.config['METRICS_DIR'])
+    # In the serving process, not the reloader's watcher
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        import write_behind
+        write_behind.start_flusher(app)
     app.run(debug=True, host='0.0.0.0', port=5000)
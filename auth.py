@@ -2,8 +2,9 @@
 Authentication utilities for JWT token handling
 """
 from functools import wraps
-from flask import request, jsonify, current_app
+from flask import request, jsonify, current_app, g
 from flask_jwt_extended import create_access_token, create_refresh_token, jwt_required, get_jwt_identity
+from sqlalchemy.orm import joinedload
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import timedelta
 
@@ -33,17 +34,47 @@ def generate_tokens(user_id, user_role):
         'token_type': 'Bearer'
     }
 
+class Principal:
+    """The authenticated user together with their teacher or student profile"""
+    
+    def __init__(self, user):
+        self.user = user
+        self.id = user.id
+        self.role = user.role
+        self.teacher = user.teacher
+        self.student = user.student
+
+def load_principal():
+    """Return the current request's Principal, or None if the user no longer exists
+    
+    Resolved lazily on first use with a single joined query and cached in
+    flask.g, so decorators and handlers share it instead of re-querying.
+    """
+    from models import User
+    current_user_id = get_jwt_identity()
+    cached = g.get('_principal')
+    if cached is not None and cached[0] == current_user_id:
+        return cached[1]
+    
+    user = (
+        User.query
+        .options(joinedload(User.teacher), joinedload(User.student))
+        .filter(User.id == current_user_id)
+        .first()
+    )
+    principal = Principal(user) if user else None
+    g._principal = (current_user_id, principal)
+    return principal
+
 def require_role(*roles):
     """Decorator to require specific roles"""
     def decorator(fn):
         @wraps(fn)
         @jwt_required()
         def wrapper(*args, **kwargs):
-            from models import User
-            current_user_id = get_jwt_identity()
-            user = User.query.get(current_user_id)
+            principal = load_principal()
             
-            if not user or user.role not in roles:
+            if not principal or principal.role not in roles:
                 return jsonify({'message': 'Insufficient permissions'}), 403
             
             return fn(*args, **kwargs)
@@ -0,0 +1,87 @@
+"""
+Attendance analytics benchmark
+
+Feeds synthetic attendance chunks (the arrays analytics.scan builds from
+each database chunk) into analytics.AttendanceAggregator and reports
+throughput and peak traced memory as the row count grows. Peak memory
+should level off once every student/course pair and day has been seen,
+however many rows follow. No database needed.
+
+Usage: python benchmarks/analytics_benchmark.py [--rows 10000000] [--chunk 100000]
+       [--students 20000] [--courses 400] [--days 365]
+"""
+import argparse
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np
+
+from analytics import AttendanceAggregator, STATUS_CODES
+
+# Courses each synthetic student takes
+COURSES_PER_STUDENT = 6
+
+
+def synthetic_chunks(rows, chunk, students, courses, days, seed=7):
+    rng = np.random.default_rng(seed)
+    timetable = rng.integers(0, courses, size=(students, COURSES_PER_STUDENT))
+    first_day = int(np.datetime64('2025-09-01', 'D').astype(np.int64))
+    codes = np.array([STATUS_CODES['present'], STATUS_CODES['absent'], STATUS_CODES['late']])
+    produced = 0
+    while produced < rows:
+        size = min(chunk, rows - produced)
+        student = rng.integers(0, students, size)
+        course = timetable[student, rng.integers(0, COURSES_PER_STUDENT, size)]
+        day = first_day + rng.integers(0, days, size)
+        status = codes[rng.choice(3, size, p=(0.8, 0.12, 0.08))]
+        yield student, course, day, status
+        produced += size
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=10_000_000)
+    parser.add_argument('--chunk', type=int, default=100_000)
+    parser.add_argument('--students', type=int, default=20_000)
+    parser.add_argument('--courses', type=int, default=400)
+    parser.add_argument('--days', type=int, default=365)
+    args = parser.parse_args()
+
+    aggregator = AttendanceAggregator(args.courses)
+    checkpoints = {args.rows // 10, args.rows // 4, args.rows // 2, args.rows}
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    fold_seconds = 0.0
+    for student, course, day, status in synthetic_chunks(
+        args.rows, args.chunk, args.students, args.courses, args.days
+    ):
+        fold_started = time.perf_counter()
+        aggregator.add(student, course, day, status)
+        fold_seconds += time.perf_counter() - fold_started
+        if aggregator.rows in checkpoints:
+            _, peak = tracemalloc.get_traced_memory()
+            print(f"{aggregator.rows:>12,} rows  {len(aggregator.pairs):>9,} pairs  "
+                  f"peak {peak / 2**20:6.1f} MiB  {time.perf_counter() - started:6.1f}s")
+
+    groups = np.arange(args.courses) % 20
+    timings = {}
+    for label, compute in {
+        'distribution': lambda: aggregator.distribution(groups, 20, 75),
+        'trends': lambda: aggregator.trends((7, 30), 90),
+        'weekdays': lambda: aggregator.weekdays(),
+    }.items():
+        compute_started = time.perf_counter()
+        compute()
+        timings[label] = (time.perf_counter() - compute_started) * 1000
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"folded {aggregator.rows:,} rows in {aggregator.chunks} chunks: "
+          f"{aggregator.rows / fold_seconds:,.0f} rows/s (aggregation only)")
+    print('  '.join(f"{label} {ms:.1f} ms" for label, ms in timings.items()))
+    print(f"peak traced memory {peak / 2**20:.1f} MiB")
@@ -0,0 +1,140 @@
+"""
+Attendance row size benchmark: VARCHAR status + inline TEXT remarks vs
+one byte status code + sparse remarks side table
+
+Builds both layouts as scratch tables on the configured MySQL database,
+grows them to the requested row count by doubling inside the server, and
+reports data and index size from information_schema.
+
+Usage: python benchmarks/attendance_row_size_benchmark.py [--rows 10000000] [--remark-ratio 0.02]
+"""
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import text
+
+SEED_ROWS = 1000
+
+OLD_LAYOUT = """
+CREATE TABLE bench_attendance_old (
+    id BINARY(16) PRIMARY KEY,
+    student_id BINARY(16) NOT NULL,
+    course_id BINARY(16) NOT NULL,
+    attendance_date DATE NOT NULL,
+    status VARCHAR(20) NOT NULL,
+    remarks TEXT,
+    INDEX ix_old_student (student_id),
+    INDEX ix_old_course_status (course_id, status)
+)
+"""
+
+NEW_LAYOUT = """
+CREATE TABLE bench_attendance_new (
+    id BINARY(16) PRIMARY KEY,
+    student_id BINARY(16) NOT NULL,
+    course_id BINARY(16) NOT NULL,
+    attendance_date DATE NOT NULL,
+    status TINYINT UNSIGNED NOT NULL,
+    INDEX ix_new_student (student_id),
+    INDEX ix_new_course_status (course_id, status)
+)
+"""
+
+NEW_REMARKS = """
+CREATE TABLE bench_attendance_new_remarks (
+    attendance_id BINARY(16) PRIMARY KEY,
+    remarks TEXT NOT NULL
+)
+"""
+
+TABLES = ('bench_attendance_old', 'bench_attendance_new', 'bench_attendance_new_remarks')
+
+
+def size_of(connection, table):
+    connection.execute(text(f"ANALYZE TABLE {table}"))
+    return connection.execute(text(
+        "SELECT DATA_LENGTH, INDEX_LENGTH FROM information_schema.TABLES "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :name"
+    ), {'name': table}).one()
+
+
+def run(engine, rows, remark_ratio):
+    if engine.dialect.name != 'mysql':
+        print("This benchmark measures InnoDB storage and needs a MySQL database")
+        return
+
+    with engine.begin() as connection:
+        for table in TABLES:
+            connection.execute(text(f"DROP TABLE IF EXISTS {table}"))
+        for ddl in (OLD_LAYOUT, NEW_LAYOUT, NEW_REMARKS):
+            connection.execute(text(ddl))
+
+        # Seed, then double in-server until the target row count is reached
+        for _ in range(SEED_ROWS):
+            connection.execute(text(
+                "INSERT INTO bench_attendance_old VALUES (UUID_TO_BIN(UUID(), 1), "
+                "UNHEX(MD5(RAND())), UNHEX(MD5(FLOOR(RAND() * 50))), "
+                "CURDATE() - INTERVAL FLOOR(RAND() * 120) DAY, "
+                "ELT(1 + FLOOR(RAND() * 3), 'present', 'absent', 'late'), '')"
+            ))
+        count = SEED_ROWS
+        while count < rows:
+            connection.execute(text(
+                "INSERT INTO bench_attendance_old "
+                "SELECT UUID_TO_BIN(UUID(), 1), student_id, course_id, attendance_date, status, remarks "
+                f"FROM bench_attendance_old LIMIT {rows - count}"
+            ))
+            count = connection.execute(text("SELECT COUNT(*) FROM bench_attendance_old")).scalar()
+
+        connection.execute(text(
+            "UPDATE bench_attendance_old SET remarks = 'arrived after roll call' "
+            "WHERE RAND() < :ratio"
+        ), {'ratio': remark_ratio})
+
+        connection.execute(text(
+            "INSERT INTO bench_attendance_new "
+            "SELECT id, student_id, course_id, attendance_date, "
+            "CASE status WHEN 'present' THEN 1 WHEN 'absent' THEN 2 WHEN 'late' THEN 3 END "
+            "FROM bench_attendance_old"
+        ))
+        connection.execute(text(
+            "INSERT INTO bench_attendance_new_remarks "
+            "SELECT id, remarks FROM bench_attendance_old WHERE remarks <> ''"
+        ))
+
+    try:
+        with engine.begin() as connection:
+            old_data, old_index = size_of(connection, 'bench_attendance_old')
+            new_data, new_index = size_of(connection, 'bench_attendance_new')
+            side_data, side_index = size_of(connection, 'bench_attendance_new_remarks')
+    finally:
+        with engine.begin() as connection:
+            for table in TABLES:
+                connection.execute(text(f"DROP TABLE IF EXISTS {table}"))
+
+    new_total = new_data + new_index + side_data + side_index
+    old_total = old_data + old_index
+    mib = 2 ** 20
+    print(f"rows: {count:,}")
+    print(f"old layout: data {old_data / mib:.1f} MiB, indexes {old_index / mib:.1f} MiB")
+    print(f"new layout: data {new_data / mib:.1f} MiB, indexes {new_index / mib:.1f} MiB, "
+          f"remarks table {(side_data + side_index) / mib:.1f} MiB")
+    print(f"reduction: {(1 - new_total / old_total) * 100:.1f}%")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=10_000_000)
+    parser.add_argument('--remark-ratio', type=float, default=0.02)
+    parser.add_argument('--config', default='development')
+    args = parser.parse_args()
+
+    from app import create_app
+    from models import db
+
+    app = create_app(args.config)
+    with app.app_context():
+        run(db.engine, args.rows, args.remark_ratio)
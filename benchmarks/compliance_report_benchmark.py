@@ -0,0 +1,126 @@
+"""
+Compliance report benchmark: process-pool scaling
+
+Builds (or reuses) a SQLite database with synthetic students, courses,
+enrollments and attendance, then runs reports.compliance_rows() over all
+courses with 1, 2, 4, ... processes up to the CPU count and reports the
+time and speed-up of each run. Generation happens inside SQLite, so the
+10M row default takes a few minutes the first time; pass the same
+--database again to skip it.
+
+Usage: python benchmarks/compliance_report_benchmark.py [--rows 10000000] [--students 20000]
+       [--courses 400] [--database /tmp/compliance_bench.db] [--max-processes N]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import create_engine, text
+
+from models import db
+from reports import compliance_rows
+
+# Courses each synthetic student is enrolled in
+COURSES_PER_STUDENT = 5
+
+GENERATE = (
+    """
+    WITH RECURSIVE n(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM n WHERE i < :students)
+    INSERT INTO users (id, email, password_hash, first_name, last_name, role, is_active, created_at, updated_at)
+    SELECT randomblob(16), 'user' || i || '@bench.edu', 'x', 'First' || i, 'Last' || i,
+           CASE WHEN i = 0 THEN 'teacher' ELSE 'student' END, 1, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP
+    FROM n
+    """,
+    """
+    INSERT INTO teachers (id, user_id, employee_id, joining_date, is_active, created_at, updated_at)
+    SELECT randomblob(16), id, 'EMP0', CURRENT_TIMESTAMP, 1, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP
+    FROM users WHERE role = 'teacher'
+    """,
+    """
+    INSERT INTO students (id, user_id, roll_number, enrollment_date, is_active, created_at, updated_at)
+    SELECT randomblob(16), id, printf('R%07d', rowid), CURRENT_TIMESTAMP, 1, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP
+    FROM users WHERE role = 'student'
+    """,
+    """
+    WITH RECURSIVE n(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM n WHERE i < :courses - 1)
+    INSERT INTO courses (id, course_code, course_name, teacher_id, credits, max_students, is_active, created_at, updated_at)
+    SELECT randomblob(16), printf('D%02d%04d', i % 12, i), 'Course ' || i, (SELECT id FROM teachers), 3, 1000, 1,
+           CURRENT_TIMESTAMP, CURRENT_TIMESTAMP
+    FROM n
+    """,
+    """
+    WITH RECURSIVE k(j) AS (SELECT 0 UNION ALL SELECT j + 1 FROM k WHERE j < :per_student - 1)
+    INSERT INTO enrollments (id, student_id, course_id, enrollment_date, is_active, created_at, updated_at)
+    SELECT randomblob(16), s.id, c.id, CURRENT_TIMESTAMP, 1, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP
+    FROM students s, k JOIN courses c ON c.rowid = (s.rowid * 7 + k.j * 53) % :courses + 1
+    """,
+    """
+    WITH RECURSIVE d(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM d WHERE i < :days - 1)
+    INSERT INTO attendance (id, student_id, course_id, teacher_id, attendance_date, status, created_at, updated_at)
+    SELECT randomblob(16), e.student_id, e.course_id, (SELECT id FROM teachers), date('2025-09-01', '+' || d.i || ' days'),
+           CASE abs(random()) % 8 WHEN 0 THEN 2 WHEN 1 THEN 3 ELSE 1 END, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP
+    FROM enrollments e, d
+    """,
+)
+
+
+def build(engine, rows, students, courses):
+    enrollments = students * COURSES_PER_STUDENT
+    days = max(1, rows // enrollments)
+    db.metadata.create_all(engine)
+    with engine.begin() as connection:
+        for statement in GENERATE:
+            connection.execute(text(statement), {
+                'students': students, 'courses': courses, 'per_student': COURSES_PER_STUDENT, 'days': days,
+            })
+        connection.execute(text('ANALYZE'))
+    return enrollments * days
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=10_000_000)
+    parser.add_argument('--students', type=int, default=20_000)
+    parser.add_argument('--courses', type=int, default=400)
+    parser.add_argument('--database', default=os.path.join(tempfile.gettempdir(), 'compliance_bench.db'))
+    parser.add_argument('--max-processes', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    url = f'sqlite:///{args.database}'
+    engine = create_engine(url)
+    if not os.path.exists(args.database) or os.path.getsize(args.database) == 0:
+        started = time.perf_counter()
+        built = build(engine, args.rows, args.students, args.courses)
+        print(f"generated {built:,} attendance rows in {time.perf_counter() - started:.0f}s")
+    with engine.connect() as connection:
+        attendance_rows = connection.execute(text('SELECT COUNT(*) FROM attendance')).scalar()
+        weights = dict(connection.execute(text(
+            'SELECT c.id, COUNT(e.id) FROM courses c LEFT JOIN enrollments e ON e.course_id = c.id '
+            'AND e.is_active = 1 WHERE c.is_active = 1 GROUP BY c.id'
+        )).all())
+    # Course ids as the models see them (canonical UUID strings)
+    weights = {str(uuid.UUID(bytes=bytes(key))): weight for key, weight in weights.items()}
+    print(f"{attendance_rows:,} attendance rows, {len(weights)} courses, {sum(weights.values()):,} enrollments")
+
+    params = {'cutoff': 75, 'from_date': None, 'to_date': None}
+    process_counts = [1]
+    while process_counts[-1] * 2 <= args.max_processes:
+        process_counts.append(process_counts[-1] * 2)
+    if process_counts[-1] != args.max_processes:
+        process_counts.append(args.max_processes)
+
+    baseline = None
+    for processes in process_counts:
+        with tempfile.TemporaryDirectory() as scratch_dir:
+            started = time.perf_counter()
+            report_rows = sum(1 for _ in compliance_rows(url, weights, params, processes, scratch_dir))
+            seconds = time.perf_counter() - started
+        baseline = baseline or seconds
+        print(f"{processes:>3} processes: {seconds:7.2f}s  {report_rows:,} report rows  "
+              f"speed-up {baseline / seconds:4.2f}x (ideal {processes}x)")
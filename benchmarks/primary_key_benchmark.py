@@ -0,0 +1,135 @@
+"""
+Primary key benchmark: random UUID4 strings vs time-ordered binary UUID7
+
+Creates two scratch tables shaped like `attendance` in the configured
+database, inserts the same number of rows into each and reports insert and
+lookup throughput. On MySQL it also reports InnoDB page splits and the
+data/index size of each table.
+
+Usage: python benchmarks/primary_key_benchmark.py [--rows 200000] [--config development]
+"""
+import argparse
+import random
+import sys
+import time
+import uuid
+from datetime import date
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import Column, Date, Index, MetaData, String, Table, text
+
+from db_types import BinaryUUID, uuid7
+
+BATCH_SIZE = 1000
+
+
+def build_tables(metadata):
+    """Same columns and indexes as `attendance`, once per key type"""
+    tables = {}
+    for name, key_type, new_key in (
+        ('bench_pk_uuid4_string', String(36), lambda: str(uuid.uuid4())),
+        ('bench_pk_uuid7_binary', BinaryUUID, lambda: str(uuid7())),
+    ):
+        table = Table(
+            name, metadata,
+            Column('id', key_type, primary_key=True),
+            Column('student_id', key_type, nullable=False),
+            Column('course_id', key_type, nullable=False),
+            Column('attendance_date', Date, nullable=False),
+            Column('status', String(20), nullable=False),
+        )
+        Index(f'ix_{name}_student_id', table.c.student_id)
+        Index(f'ix_{name}_course_id', table.c.course_id)
+        tables[name] = (table, new_key)
+    return tables
+
+
+def page_splits(connection):
+    if connection.dialect.name != 'mysql':
+        return None
+    return connection.execute(text(
+        "SELECT COUNT FROM information_schema.INNODB_METRICS WHERE NAME = 'index_page_splits'"
+    )).scalar()
+
+
+def table_size(connection, name):
+    if connection.dialect.name != 'mysql':
+        return None
+    connection.execute(text(f"ANALYZE TABLE {name}"))
+    return connection.execute(text(
+        "SELECT DATA_LENGTH, INDEX_LENGTH FROM information_schema.TABLES "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :name"
+    ), {'name': name}).one()
+
+
+def run(engine, rows):
+    metadata = MetaData()
+    tables = build_tables(metadata)
+    metadata.drop_all(engine)
+    metadata.create_all(engine)
+
+    if engine.dialect.name == 'mysql':
+        with engine.begin() as connection:
+            connection.execute(text("SET GLOBAL innodb_monitor_enable = 'index_page_splits'"))
+
+    students = [uuid.uuid4() for _ in range(2000)]
+    courses = [uuid.uuid4() for _ in range(50)]
+
+    try:
+        for name, (table, new_key) in tables.items():
+            keys = []
+            with engine.begin() as connection:
+                splits_before = page_splits(connection)
+            started = time.perf_counter()
+            for offset in range(0, rows, BATCH_SIZE):
+                batch = []
+                for _ in range(min(BATCH_SIZE, rows - offset)):
+                    key = new_key()
+                    keys.append(key)
+                    batch.append({
+                        'id': key,
+                        'student_id': str(random.choice(students)),
+                        'course_id': str(random.choice(courses)),
+                        'attendance_date': date.today(),
+                        'status': 'present',
+                    })
+                with engine.begin() as connection:
+                    connection.execute(table.insert(), batch)
+            insert_seconds = time.perf_counter() - started
+
+            sample = random.sample(keys, min(5000, len(keys)))
+            started = time.perf_counter()
+            with engine.connect() as connection:
+                for key in sample:
+                    connection.execute(table.select().where(table.c.id == key)).one()
+            lookup_seconds = time.perf_counter() - started
+
+            with engine.begin() as connection:
+                splits_after = page_splits(connection)
+                size = table_size(connection, name)
+
+            print(name)
+            print(f"  inserts: {rows / insert_seconds:,.0f} rows/s")
+            print(f"  lookups: {len(sample) / lookup_seconds:,.0f} per s")
+            if splits_before is not None:
+                print(f"  page splits: {splits_after - splits_before:,}")
+            if size is not None:
+                print(f"  data: {size[0] / 2**20:.1f} MiB, indexes: {size[1] / 2**20:.1f} MiB")
+    finally:
+        metadata.drop_all(engine)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument('--config', default='development')
+    args = parser.parse_args()
+
+    from app import create_app
+    from models import db
+
+    app = create_app(args.config)
+    with app.app_context():
+        run(db.engine, args.rows)
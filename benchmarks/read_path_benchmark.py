@@ -0,0 +1,139 @@
+"""
+List endpoint read path benchmark: ORM objects versus Core rows
+
+Fills a temporary SQLite database with one course's attendance, then reads
+pages of it the way GET /api/attendance/course/<id> used to (ORM query
+with fieldsets.load_options, then to_dict) and the way it does now
+(readers.ATTENDANCE, Core select() rows straight into dicts). Reports
+rows per second and peak traced memory for each page size, also for the
+users list. The Core figures include the COUNT the endpoints run for
+`total`. No Flask app needed.
+
+Usage: python benchmarks/read_path_benchmark.py [--students 2000] [--days 60]
+       [--page-sizes 50,500,5000] [--repeat 5]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+import readers
+from db_types import uuid7
+from fieldsets import load_options
+from models import db, Attendance, User
+
+
+def build(engine, student_count, days):
+    """One teacher and course, `student_count` students with `days` days of attendance"""
+    db.metadata.create_all(engine)
+    now = datetime.utcnow()
+    teacher_user, teacher, course = str(uuid7()), str(uuid7()), str(uuid7())
+    users = [dict(id=teacher_user, email='teacher@bench.edu', password_hash='x', first_name='Bench',
+                  last_name='Teacher', role='teacher', is_active=True, created_at=now, updated_at=now)]
+    students = []
+    for number in range(student_count):
+        user_id = str(uuid7())
+        users.append(dict(id=user_id, email=f'student{number}@bench.edu', password_hash='x', first_name='Student',
+                          last_name=str(number), role='student', is_active=True, created_at=now, updated_at=now))
+        students.append(dict(id=str(uuid7()), user_id=user_id, roll_number=f'B{number:06d}', enrollment_date=now,
+                             is_active=True, created_at=now, updated_at=now))
+    rows, notes = [], []
+    for day in range(days):
+        attendance_date = date(2025, 9, 1) + timedelta(days=day)
+        for student in students:
+            attendance_id = str(uuid7())
+            rows.append(dict(id=attendance_id, student_id=student['id'], course_id=course, teacher_id=teacher,
+                             attendance_date=attendance_date, status=random.choice(('present', 'absent', 'late')),
+                             created_at=now, updated_at=now))
+            if random.random() < 0.05:
+                notes.append(dict(attendance_id=attendance_id, remarks='Left early'))
+    with engine.begin() as connection:
+        connection.execute(readers.users.insert(), users)
+        connection.execute(readers.teachers.insert(), [dict(
+            id=teacher, user_id=teacher_user, employee_id='EMP-BENCH', joining_date=now,
+            is_active=True, created_at=now, updated_at=now,
+        )])
+        connection.execute(readers.courses.insert(), [dict(
+            id=course, course_code='BENCH101', course_name='Read path', teacher_id=teacher,
+            max_students=student_count, is_active=True, created_at=now, updated_at=now,
+        )])
+        connection.execute(readers.students.insert(), students)
+        connection.execute(readers.attendance.insert(), rows)
+        connection.execute(readers.remarks.insert(), notes)
+    return course, len(rows)
+
+
+def orm_attendance(engine, course_id, page_size):
+    with Session(engine) as session:
+        records = (
+            session.query(Attendance).filter_by(course_id=course_id)
+            .options(*load_options(Attendance)).limit(page_size).all()
+        )
+        return [record.to_dict() for record in records]
+
+
+def core_attendance(engine, course_id, page_size):
+    with engine.connect() as connection:
+        return readers.ATTENDANCE.page(connection, [readers.attendance.c.course_id == course_id], 1, page_size)[1]
+
+
+def orm_users(engine, course_id, page_size):
+    with Session(engine) as session:
+        return [user.to_dict() for user in session.query(User).limit(page_size).all()]
+
+
+def core_users(engine, course_id, page_size):
+    with engine.connect() as connection:
+        return readers.USERS.page(connection, [], 1, page_size)[1]
+
+
+def measure(read, engine, course_id, page_size, repeat):
+    """(rows per second, peak traced MiB) of the best of `repeat` reads"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows = len(read(engine, course_id, page_size))
+        seconds = time.perf_counter() - started
+        best = seconds if best is None else min(best, seconds)
+    tracemalloc.start()
+    read(engine, course_id, page_size)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return rows / best, peak / 2 ** 20
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--students', type=int, default=2000)
+    parser.add_argument('--days', type=int, default=60)
+    parser.add_argument('--page-sizes', default='50,500,5000')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        engine = create_engine('sqlite:///' + os.path.join(scratch_dir, 'read_path.db'))
+        started = time.perf_counter()
+        course_id, total = build(engine, args.students, args.days)
+        print(f"generated {total:,} attendance rows in {time.perf_counter() - started:.1f}s")
+
+        page_sizes = [int(size) for size in args.page_sizes.split(',')]
+        for label, orm_read, core_read in (
+            ('attendance', orm_attendance, core_attendance),
+            ('users', orm_users, core_users),
+        ):
+            for page_size in page_sizes:
+                orm_rate, orm_peak = measure(orm_read, engine, course_id, page_size, args.repeat)
+                core_rate, core_peak = measure(core_read, engine, course_id, page_size, args.repeat)
+                print(f"{label:>10} page {page_size:>6}: ORM {orm_rate:>9,.0f} rows/s {orm_peak:6.1f} MiB   "
+                      f"Core {core_rate:>9,.0f} rows/s {core_peak:6.1f} MiB   {core_rate / orm_rate:4.1f}x")
+        engine.dispose()
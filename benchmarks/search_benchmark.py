@@ -0,0 +1,90 @@
+"""
+People search benchmark
+
+Loads synthetic people into search_index.PeopleIndex (no database needed)
+and reports build time, memory and query latency percentiles.
+
+Usage: python benchmarks/search_benchmark.py [--people 200000] [--queries 2000]
+"""
+import argparse
+import random
+import string
+import sys
+import time
+import tracemalloc
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from search_index import PeopleIndex
+
+FIRST_NAMES = ['James', 'Mary', 'Aarav', 'Priya', 'Wei', 'Fatima', 'Lucas', 'Sofia', 'Kenji',
+               'Amara', 'Noah', 'Olivia', 'Mateo', 'Zara', 'Ivan', 'Leila', 'Omar', 'Chloe']
+LAST_NAMES = ['Smith', 'Garcia', 'Patel', 'Chen', 'Nguyen', 'Okafor', 'Kowalski', 'Rossi',
+              'Tanaka', 'Haddad', 'Silva', 'Muller', 'Johansson', 'Kaur', 'Ahmed', 'Brown']
+
+
+def synthetic_people(count):
+    for number in range(count):
+        first = random.choice(FIRST_NAMES) + random.choice(['', 'a', 'e', 'o', 'ie'])
+        last = random.choice(LAST_NAMES) + ''.join(random.choices(string.ascii_lowercase, k=2))
+        student = number % 20 != 0
+        yield {
+            'user_id': str(uuid.uuid4()),
+            'role': 'student' if student else 'teacher',
+            'first_name': first,
+            'last_name': last,
+            'email': f'{first}.{last}{number}@example.edu'.lower(),
+            'is_active': True,
+            'student_id': str(uuid.uuid4()) if student else None,
+            'roll_number': f'R{number:07d}' if student else None,
+            'teacher_id': None if student else str(uuid.uuid4()),
+            'employee_id': None if student else f'EMP{number:06d}',
+        }
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--people', type=int, default=200_000)
+    parser.add_argument('--queries', type=int, default=2000)
+    args = parser.parse_args()
+
+    people = list(synthetic_people(args.people))
+    index = PeopleIndex()
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    index.load(people)
+    build_seconds = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"indexed {len(index):,} people in {build_seconds:.2f}s (peak {peak / 2**20:.0f} MiB)")
+
+    samples = random.sample(people, args.queries)
+    workloads = {
+        'name prefix': lambda p: p['last_name'][:4],
+        'full name': lambda p: f"{p['first_name']} {p['last_name']}",
+        'roll/employee number': lambda p: p['roll_number'] or p['employee_id'],
+        'email': lambda p: p['email'],
+        'misspelled name': lambda p: p['last_name'][1:],
+    }
+    for label, make_query in workloads.items():
+        timings = []
+        for person in samples:
+            query = make_query(person)
+            started = time.perf_counter()
+            index.search(query, limit=20)
+            timings.append((time.perf_counter() - started) * 1000)
+        print(f"{label:>22}: p50 {percentile(timings, 0.5):.2f} ms, "
+              f"p99 {percentile(timings, 0.99):.2f} ms, max {max(timings):.2f} ms")
+
+    started = time.perf_counter()
+    for person in samples[:500]:
+        index.upsert(dict(person, first_name=person['first_name'] + 'x'))
+    print(f"incremental upsert: {(time.perf_counter() - started) * 1000 / 500:.2f} ms each")
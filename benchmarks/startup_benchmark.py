@@ -0,0 +1,84 @@
+"""
+Startup benchmark for StudentTracker
+
+Starts gunicorn with and without --preload, measures time until the first
+successful /api/health response and reports RSS/PSS of every worker.
+
+Usage: python benchmarks/startup_benchmark.py [--workers 4] [--port 8765]
+Linux only (reads /proc for memory figures).
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def wait_for_first_request(url, timeout=60):
+    """Poll url until it answers 200, return the elapsed seconds"""
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return time.perf_counter() - start
+        except OSError:
+            time.sleep(0.05)
+    raise TimeoutError(f'{url} did not answer within {timeout}s')
+
+
+def worker_pids(master_pid):
+    """Child processes of the gunicorn master"""
+    children = Path(f'/proc/{master_pid}/task/{master_pid}/children')
+    return [int(pid) for pid in children.read_text().split()]
+
+
+def memory_kb(pid):
+    """(RSS, PSS) of a process in kB"""
+    rss = pss = 0
+    for line in Path(f'/proc/{pid}/smaps_rollup').read_text().splitlines():
+        if line.startswith('Rss:'):
+            rss = int(line.split()[1])
+        elif line.startswith('Pss:'):
+            pss = int(line.split()[1])
+    return rss, pss
+
+
+def run(preload, workers, port):
+    env = dict(os.environ, GUNICORN_PRELOAD=str(preload), GUNICORN_WORKERS=str(workers),
+               GUNICORN_BIND=f'127.0.0.1:{port}')
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:create_app()'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_for_first_request(f'http://127.0.0.1:{port}/api/health')
+        first_request = time.perf_counter() - started
+        time.sleep(1)  # let the remaining workers finish booting
+        stats = [memory_kb(pid) for pid in worker_pids(proc.pid)]
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        proc.wait(timeout=30)
+
+    print(f"preload={preload}")
+    print(f"  time to first request: {first_request * 1000:.0f} ms")
+    for index, (rss, pss) in enumerate(stats):
+        print(f"  worker {index}: RSS {rss / 1024:.1f} MiB, PSS {pss / 1024:.1f} MiB")
+    if stats:
+        print(f"  total PSS: {sum(pss for _, pss in stats) / 1024:.1f} MiB")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    for preload in (False, True):
+        run(preload, args.workers, args.port)
@@ -0,0 +1,205 @@
+"""
+Waitlist contention benchmark
+
+Creates one course with a few seats and thousands of students, fires an
+enroll request for every student at once from a thread pool (through the
+Flask test client, so the real route and locking run), then drops some of
+the enrolled students concurrently. Reports request latency and checks
+that the course was never overbooked, every student ended up either
+enrolled or waitlisted exactly once, and freed seats went to the head of
+the waitlist. Finally the teacher bulk-enrolls disjoint cohorts into a
+second course at once, which must end up with whole cohorts only and
+never more than its seats.
+
+SQLite has no row locks, so on SQLite every transaction starts with
+BEGIN IMMEDIATE (one writer at a time) to get the same serialisation the
+course row lock gives on MySQL. Pass --database to run against MySQL,
+where it also checks that the reads made under the course lock see the
+latest commits rather than the snapshot of the request's first query.
+
+Usage: python benchmarks/waitlist_contention_benchmark.py [--students 2000] [--seats 50]
+       [--drops 20] [--threads 32] [--database URL]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import event
+
+import config as config_module
+from app import create_app
+from auth import generate_tokens
+from models import db, User, Student, Teacher, Course, Enrollment, WaitlistEntry, UserRole
+
+
+def serialise_sqlite(engine):
+    """Open every SQLite transaction with BEGIN IMMEDIATE (pysqlite recipe)"""
+    @event.listens_for(engine, 'connect')
+    def _connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, 'begin')
+    def _begin(connection):
+        connection.exec_driver_sql('BEGIN IMMEDIATE')
+
+    engine.dispose()
+
+
+def seed(students, seats):
+    """One teacher, one course and `students` students; returns (course_id, [(student_id, headers)])"""
+    teacher_user = User(email='teacher@bench.edu', password_hash='x', first_name='Bench', last_name='Teacher',
+                        role=UserRole.TEACHER.value)
+    teacher = Teacher(user=teacher_user, employee_id='EMP-BENCH')
+    course = Course(course_code='BENCH101', course_name='Contention', teacher=teacher, max_students=seats)
+    db.session.add_all([teacher_user, teacher, course])
+    people = []
+    for number in range(students):
+        user = User(email=f'student{number}@bench.edu', password_hash='x', first_name='Student',
+                    last_name=str(number), role=UserRole.STUDENT.value)
+        people.append(Student(user=user, roll_number=f'B{number:06d}'))
+    db.session.add_all(people)
+    db.session.commit()
+    return course.id, [
+        (student.id, {'Authorization': 'Bearer ' + generate_tokens(student.user_id, UserRole.STUDENT.value)['access_token']})
+        for student in people
+    ]
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def storm(app, url, headers, threads, bodies=None):
+    """POST url once per headers entry (with the matching JSON body), all at once; [(status, seconds)]"""
+    def call(request_headers, body):
+        started = time.perf_counter()
+        response = app.test_client().post(url, headers=request_headers, json=body)
+        return response.status_code, time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        results = list(executor.map(call, headers, bodies or [None] * len(headers)))
+    elapsed = time.perf_counter() - started
+    latencies = [seconds for _, seconds in results]
+    codes = {}
+    for status, _ in results:
+        codes[status] = codes.get(status, 0) + 1
+    print(f"  {len(results)} requests in {elapsed:.2f}s ({len(results) / elapsed:.0f}/s), "
+          f"p50 {percentile(latencies, 0.5) * 1000:.1f}ms p99 {percentile(latencies, 0.99) * 1000:.1f}ms, "
+          f"status {dict(sorted(codes.items()))}")
+    return results
+
+
+def check(course_id, students, seats):
+    """Check the seat and waitlist invariants; returns (enrolled ids, waitlist ids in queue order, ok)"""
+    enrolled = {row.student_id for row in Enrollment.query.filter_by(course_id=course_id, is_active=True)}
+    queue = WaitlistEntry.query.filter_by(course_id=course_id).order_by(WaitlistEntry.sequence).all()
+    waiting = [entry.student_id for entry in queue]
+    sequences = [entry.sequence for entry in queue]
+    failures = []
+    if len(enrolled) > seats:
+        failures.append(f'overbooked: {len(enrolled)} enrolled for {seats} seats')
+    if len(enrolled) < min(seats, students) and waiting:
+        failures.append(f'{len(waiting)} waiting while only {len(enrolled)} of {seats} seats are taken')
+    if len(set(waiting)) != len(waiting) or enrolled & set(waiting):
+        failures.append('a student is on the waitlist twice or both enrolled and waiting')
+    if len(set(sequences)) != len(sequences):
+        failures.append('duplicate waitlist sequence numbers')
+    elif sequences and sequences[-1] - sequences[0] + 1 != len(sequences):
+        failures.append('gaps in the waitlist sequence numbers')
+    print(f"  {len(enrolled)} enrolled / {seats} seats, {len(waiting)} waitlisted: "
+          f"{'OK' if not failures else 'FAILED'}")
+    for failure in failures:
+        print(f"    {failure}")
+    return enrolled, waiting, not failures
+
+
+def cohort_course(seats):
+    """A second course of the benchmark teacher; returns (course_id, teacher headers)"""
+    teacher = Teacher.query.filter_by(employee_id='EMP-BENCH').one()
+    course = Course(course_code='BENCH102', course_name='Cohorts', teacher=teacher, max_students=seats)
+    db.session.add(course)
+    db.session.commit()
+    token = generate_tokens(teacher.user_id, UserRole.TEACHER.value)['access_token']
+    return course.id, {'Authorization': 'Bearer ' + token}
+
+
+def check_cohorts(course_id, seats, cohort_size, accepted):
+    """Whole accepted cohorts enrolled and the course not overbooked"""
+    enrolled = Enrollment.query.filter_by(course_id=course_id, is_active=True).count()
+    ok = enrolled <= seats and enrolled == accepted * cohort_size
+    print(f"  {enrolled} enrolled / {seats} seats from {accepted} accepted cohorts of {cohort_size}: "
+          f"{'OK' if ok else 'FAILED'}")
+    return ok
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--students', type=int, default=2000)
+    parser.add_argument('--seats', type=int, default=50)
+    parser.add_argument('--drops', type=int, default=20)
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--database', help='SQLAlchemy URL of an empty database (default: temporary SQLite file)')
+    args = parser.parse_args()
+
+    scratch_dir = tempfile.mkdtemp(prefix='waitlist_bench_')
+
+    class BenchConfig(config_module.TestingConfig):
+        SQLALCHEMY_DATABASE_URI = args.database or 'sqlite:///' + os.path.join(scratch_dir, 'bench.db')
+        SQLALCHEMY_ENGINE_OPTIONS = {'connect_args': {'timeout': 60}} if not args.database else {}
+        ROSTER_EVENTS_PATH = os.path.join(scratch_dir, 'roster_events.db')
+        ATTENDANCE_JOURNAL_PATH = os.path.join(scratch_dir, 'attendance_journal.db')
+        JOBS_DB_PATH = os.path.join(scratch_dir, 'jobs.db')
+        JOBS_RESULTS_DIR = os.path.join(scratch_dir, 'job_results')
+        METRICS_DIR = os.path.join(scratch_dir, 'metrics')
+
+    config_module.config['waitlist_bench'] = BenchConfig
+    app = create_app('waitlist_bench')
+
+    with app.app_context():
+        db.create_all()
+        if db.engine.dialect.name == 'sqlite':
+            serialise_sqlite(db.engine)
+        started = time.perf_counter()
+        course_id, students = seed(args.students, args.seats)
+        print(f"seeded {args.students} students for {args.seats} seats in {time.perf_counter() - started:.1f}s")
+
+    enroll_url = f'/api/courses/{course_id}/enroll'
+    print(f"enroll storm ({args.threads} threads)")
+    storm(app, enroll_url, [headers for _, headers in students], args.threads)
+    with app.app_context():
+        enrolled, waiting, ok = check(course_id, args.students, args.seats)
+
+    headers_by_student = dict(students)
+    dropped = sorted(enrolled)[:args.drops]
+    print(f"unenroll storm ({len(dropped)} students)")
+    storm(app, f'/api/courses/{course_id}/unenroll', [headers_by_student[student] for student in dropped], args.threads)
+    with app.app_context():
+        enrolled_after, waiting_after, ok_after = check(course_id, args.students, args.seats)
+    promoted = enrolled_after - enrolled
+    expected = set(waiting[:len(dropped)])
+    in_order = promoted == expected and waiting_after == waiting[len(dropped):]
+    print(f"  {len(promoted)} promoted from the waitlist, head first: {'OK' if in_order else 'FAILED'}")
+
+    cohort_size = max(1, args.seats // 4)
+    cohorts = [
+        [student_id for student_id, _ in students[start:start + cohort_size]]
+        for start in range(0, len(students) - cohort_size + 1, cohort_size)
+    ]
+    with app.app_context():
+        cohort_course_id, teacher_headers = cohort_course(args.seats)
+    print(f"bulk enroll storm ({len(cohorts)} cohorts of {cohort_size})")
+    results = storm(app, f'/api/courses/{cohort_course_id}/enroll/bulk', [teacher_headers] * len(cohorts),
+                    args.threads, [{'student_ids': cohort} for cohort in cohorts])
+    with app.app_context():
+        ok_cohorts = check_cohorts(cohort_course_id, args.seats, cohort_size,
+                                   sum(1 for status, _ in results if status == 200))
+
+    sys.exit(0 if ok and ok_after and in_order and ok_cohorts else 1)
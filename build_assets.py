@@ -0,0 +1,107 @@
+"""
+Static asset build step for StudentTracker
+Run once per deployment (Dockerfile, startup.sh) after the code is in place
+
+Copies every stylesheet and script in static/ to static/dist/ under a
+content-hashed name (app.js -> app.3f9c2a1b7d.js), rewrites the HTML pages
+to reference those names, and writes .gz and .br (brotli, from requirements.txt) variants next to each
+file. compression.py then serves the
+hashed files with immutable caching and picks the encoding per request.
+"""
+import gzip
+import hashlib
+import json
+import re
+import shutil
+import sys
+from pathlib import Path
+
+try:
+    import brotli
+except ImportError:  # pip install brotli to also emit .br files
+    brotli = None
+
+ROOT = Path(__file__).parent
+STATIC_DIR = ROOT / 'static'
+DIST_DIR = STATIC_DIR / 'dist'
+
+HASHED_SUFFIXES = ('.css', '.js')
+PAGE_SUFFIX = '.html'
+
+# Compressing tiny files saves nothing over the extra headers
+MIN_COMPRESS_BYTES = 256
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()[:10]
+
+
+def write_compressed(path, data):
+    """Write precompressed siblings of `path`; returns the encodings written"""
+    encodings = []
+    if len(data) < MIN_COMPRESS_BYTES:
+        return encodings
+    # mtime=0 keeps the output byte-identical between builds
+    gz = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(gz) < len(data):
+        Path(f'{path}.gz').write_bytes(gz)
+        encodings.append('gzip')
+    if brotli is not None:
+        br = brotli.compress(data, quality=11)
+        if len(br) < len(data):
+            Path(f'{path}.br').write_bytes(br)
+            encodings.append('br')
+    return encodings
+
+
+def build(static_dir=STATIC_DIR, dist_dir=DIST_DIR):
+    """Rebuild dist_dir from static_dir and return the manifest"""
+    if dist_dir.exists():
+        shutil.rmtree(dist_dir)
+    dist_dir.mkdir(parents=True)
+
+    assets = {}
+    for source in sorted(static_dir.iterdir()):
+        if source.suffix not in HASHED_SUFFIXES or not source.is_file():
+            continue
+        data = source.read_bytes()
+        hashed = f'{source.stem}.{content_hash(data)}{source.suffix}'
+        (dist_dir / hashed).write_bytes(data)
+        assets[source.name] = {
+            'path': hashed,
+            'encodings': write_compressed(dist_dir / hashed, data),
+        }
+
+    # Pages refer to assets as /name or /static/name
+    reference = re.compile(
+        r'(["\'])/(?:static/)?(' + '|'.join(re.escape(name) for name in assets) + r')\1'
+    ) if assets else None
+
+    pages = {}
+    for source in sorted(static_dir.iterdir()):
+        if source.suffix != PAGE_SUFFIX or not source.is_file():
+            continue
+        html = source.read_text(encoding='utf-8')
+        if reference is not None:
+            html = reference.sub(
+                lambda m: f"{m.group(1)}/assets/{assets[m.group(2)]['path']}{m.group(1)}", html
+            )
+        data = html.encode('utf-8')
+        (dist_dir / source.name).write_bytes(data)
+        pages[source.name] = {
+            'path': source.name,
+            'encodings': write_compressed(dist_dir / source.name, data),
+        }
+
+    manifest = {'assets': assets, 'pages': pages}
+    (dist_dir / 'manifest.json').write_text(json.dumps(manifest, indent=2), encoding='utf-8')
+    return manifest
+
+
+if __name__ == '__main__':
+    manifest = build()
+    for name, entry in {**manifest['assets'], **manifest['pages']}.items():
+        encodings = ', '.join(entry['encodings']) or 'uncompressed'
+        print(f"{name} -> dist/{entry['path']} ({encodings})")
+    if brotli is None:
+        print('brotli not installed; only gzip variants were written', file=sys.stderr)
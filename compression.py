@@ -0,0 +1,113 @@
+"""
+Compressed, cacheable responses for StudentTracker
+
+Static files: once build_assets.py has produced static/dist/, pages and
+content-hashed assets are served from there. Hashed assets live under
+/assets/ with a one-year immutable Cache-Control; pages are revalidated by
+ETag. Each request gets the smallest precompressed variant it accepts (br,
+then gzip), so nothing is compressed at request time. Without a build the
+plain files in static/ are served as before.
+
+API responses: JSON bodies of at least API_GZIP_MIN_BYTES are gzipped on
+the fly for clients that send Accept-Encoding: gzip. Sub-requests of
+/api/batch are left alone; the batch response is compressed as a whole.
+"""
+import gzip
+import json
+import mimetypes
+import os
+
+from flask import abort, current_app, request, send_file
+
+from utils import is_subrequest
+
+# Preferred first
+PRECOMPRESSED = (('br', '.br'), ('gzip', '.gz'))
+
+IMMUTABLE_MAX_AGE = 31536000
+
+_manifest = None
+
+
+def load_manifest(dist_dir):
+    path = os.path.join(dist_dir, 'manifest.json')
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _send_built(entry, immutable):
+    """Send a dist/ file in the best encoding this client accepts"""
+    dist_dir = current_app.config['ASSETS_DIST_DIR']
+    encoding, suffix = None, ''
+    for candidate, candidate_suffix in PRECOMPRESSED:
+        if candidate in entry['encodings'] and request.accept_encodings[candidate]:
+            encoding, suffix = candidate, candidate_suffix
+            break
+
+    response = send_file(
+        os.path.join(dist_dir, entry['path'] + suffix),
+        mimetype=mimetypes.guess_type(entry['path'])[0],
+        download_name=entry['path'],
+        conditional=True,
+        max_age=IMMUTABLE_MAX_AGE if immutable else 0,
+    )
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    if immutable:
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+
+def serve_page(name):
+    """Built copy of an HTML page when available, else the file in static/"""
+    if _manifest and name in _manifest['pages']:
+        return _send_built(_manifest['pages'][name], immutable=False)
+    return current_app.send_static_file(name)
+
+
+def init_app(app):
+    """Serve built assets and gzip large JSON responses"""
+    global _manifest
+    _manifest = load_manifest(app.config['ASSETS_DIST_DIR'])
+
+    if _manifest:
+        hashed = {entry['path']: entry for entry in _manifest['assets'].values()}
+
+        @app.route('/assets/<path:filename>')
+        def hashed_asset(filename):
+            if filename not in hashed:
+                abort(404)
+            return _send_built(hashed[filename], immutable=True)
+
+        # Pages other than index.html keep their URL but use the built copy
+        for name in _manifest['pages']:
+            if name != 'index.html':
+                app.add_url_rule(f'/{name}', f'page_{name}', lambda name=name: serve_page(name))
+
+    min_bytes = app.config.get('API_GZIP_MIN_BYTES')
+    if not min_bytes:
+        return
+    level = app.config['API_GZIP_LEVEL']
+
+    @app.after_request
+    def _gzip_json(response):
+        if (is_subrequest()
+                or response.mimetype != 'application/json'
+                or response.direct_passthrough
+                or response.is_streamed
+                or 'Content-Encoding' in response.headers
+                or not request.accept_encodings['gzip']):
+            return response
+        data = response.get_data()
+        if len(data) < min_bytes:
+            return response
+        response.set_data(gzip.compress(data, compresslevel=level))
+        response.headers['Content-Encoding'] = 'gzip'
+        response.vary.add('Accept-Encoding')
+        return response
@@ -2,6 +2,7 @@
 Configuration module for StudentTracker application
 MySQL version
 """
+import json
 import os
 from datetime import timedelta
 
@@ -35,9 +36,180 @@ class Config:
         'pool_pre_ping': True,
     }
 
+    # Attendance sharding (sharding.py): comma-separated database URLs that
+    # hold attendance instead of the main database, and optional JSON
+    # {"<course id>": <shard index>} pins, e.g. to keep a campus's courses
+    # on its own database. Neither may change once attendance is written.
+    ATTENDANCE_SHARDS = [url.strip() for url in os.getenv('ATTENDANCE_SHARDS', '').split(',') if url.strip()]
+    ATTENDANCE_SHARD_PINS = json.loads(os.getenv('ATTENDANCE_SHARD_PINS', '{}'))
+
     # CORS Configuration
     CORS_ORIGINS = os.getenv('CORS_ORIGINS', '*')
 
+    # Startup: create missing tables inside create_app (convenient locally,
+    # but production runs `python migrate.py` once instead of every worker)
+    AUTO_CREATE_SCHEMA = os.getenv('AUTO_CREATE_SCHEMA', 'True').lower() == 'true'
+
+    # People search: per-worker in-memory index, caught up from the database
+    # at most every SEARCH_INDEX_SYNC_SECONDS
+    SEARCH_INDEX_ENABLED = os.getenv('SEARCH_INDEX_ENABLED', 'True').lower() == 'true'
+    SEARCH_INDEX_SYNC_SECONDS = int(os.getenv('SEARCH_INDEX_SYNC_SECONDS', '5'))
+
+    # Token revocation: revocations made by other workers are picked up
+    # within REVOCATION_REFRESH_SECONDS. Each refresh re-reads the last
+    # REVOCATION_OVERLAP_SECONDS, for rows committed after later-stamped ones
+    # (slow commits, clock skew between app hosts)
+    REVOCATION_REFRESH_SECONDS = int(os.getenv('REVOCATION_REFRESH_SECONDS', '2'))
+    REVOCATION_OVERLAP_SECONDS = int(os.getenv('REVOCATION_OVERLAP_SECONDS', '60'))
+    REVOCATION_BLOOM_CAPACITY = int(os.getenv('REVOCATION_BLOOM_CAPACITY', '100000'))
+
+    # Reverse proxies in front of the app whose X-Forwarded-For and
+    # X-Forwarded-Proto are trusted (0: none, use the socket's address)
+    TRUSTED_PROXY_HOPS = int(os.getenv('TRUSTED_PROXY_HOPS', '0'))
+
+    # Admission control (per worker): token buckets per caller and route
+    # class as (burst, refill per second), and the in-flight ceiling above
+    # which low-priority reads are shed with 503. Logins are limited per
+    # address and account ('auth') and, more loosely, per address alone
+    # ('auth_address'), which a NAT or campus network shares
+    RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'True').lower() == 'true'
+    RATE_LIMITS = {
+        'auth': (10, 0.2),
+        'auth_address': (200, 5.0),
+        'write': (60, 2.0),
+        'read': (120, 10.0),
+        'report': (20, 0.5),
+    }
+    ADMISSION_MAX_IN_FLIGHT = int(os.getenv('ADMISSION_MAX_IN_FLIGHT', '16'))
+    ADMISSION_RETRY_AFTER = 2
+
+    # Idempotency-Key: how long stored responses are replayed, how many are
+    # cached per worker, and when an unfinished request counts as abandoned
+    IDEMPOTENCY_TTL_SECONDS = int(os.getenv('IDEMPOTENCY_TTL_SECONDS', '86400'))
+    IDEMPOTENCY_CACHE_SIZE = int(os.getenv('IDEMPOTENCY_CACHE_SIZE', '10000'))
+    IDEMPOTENCY_PENDING_TIMEOUT = 60
+
+    # Write-behind attendance (POST /api/attendance?async=1): local journal
+    # shared by the workers of one host, and how its flushers batch writes
+    ATTENDANCE_ASYNC_ENABLED = os.getenv('ATTENDANCE_ASYNC_ENABLED', 'True').lower() == 'true'
+    ATTENDANCE_JOURNAL_PATH = os.getenv(
+        'ATTENDANCE_JOURNAL_PATH',
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'attendance_journal.db')
+    )
+    ATTENDANCE_FLUSH_INTERVAL = 1.0
+    ATTENDANCE_COALESCE_DELAY = 0.2
+    ATTENDANCE_FLUSH_BATCH = 500
+    ATTENDANCE_CLAIM_TIMEOUT = 60
+
+    # Live roster updates (SSE): event log shared by the workers of one host,
+    # how often each worker tails it, how long one stream stays open and how
+    # many streams one worker holds threads for (keep it below GUNICORN_THREADS)
+    ROSTER_EVENTS_ENABLED = os.getenv('ROSTER_EVENTS_ENABLED', 'True').lower() == 'true'
+    ROSTER_EVENTS_PATH = os.getenv(
+        'ROSTER_EVENTS_PATH',
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'roster_events.db')
+    )
+    ROSTER_EVENTS_POLL_INTERVAL = 0.25
+    ROSTER_EVENTS_KEEPALIVE_SECONDS = 15
+    ROSTER_EVENTS_MAX_STREAM_SECONDS = 300
+    ROSTER_EVENTS_RETRY_MS = 3000
+    ROSTER_EVENTS_MAX_STREAMS = int(os.getenv('ROSTER_EVENTS_MAX_STREAMS', '4'))
+
+    # Delta sync (?since=): how far behind "now" results stop so late
+    # commits are not skipped, rows per response, and tombstone retention
+    SYNC_SETTLE_SECONDS = 2
+    SYNC_MAX_CHANGES = 1000
+    SYNC_TOMBSTONE_RETENTION_DAYS = 30
+
+    # Compression: output of build_assets.py, and the smallest JSON body
+    # worth gzipping on the fly (0 disables it)
+    ASSETS_DIST_DIR = os.getenv(
+        'ASSETS_DIST_DIR',
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'dist')
+    )
+    API_GZIP_MIN_BYTES = int(os.getenv('API_GZIP_MIN_BYTES', '1024'))
+    API_GZIP_LEVEL = 6
+
+    # /api/batch: sub-requests per batch, and threads for parallel reads
+    # (each takes its own pooled connection)
+    BATCH_MAX_REQUESTS = 20
+    BATCH_MAX_PARALLEL = 4
+
+    # POST /api/courses/<id>/enroll/bulk: students per request
+    BULK_ENROLL_MAX_STUDENTS = 1000
+
+    # /api/students/me/overview: latest marks listed per course
+    STUDENT_OVERVIEW_RECENT_MARKS = 5
+
+    # /api/admin/analytics: attendance rows read per columnar chunk, how
+    # long one scan's results are reused, and the at-risk threshold (%)
+    ANALYTICS_CHUNK_ROWS = int(os.getenv('ANALYTICS_CHUNK_ROWS', '100000'))
+    ANALYTICS_CACHE_SECONDS = int(os.getenv('ANALYTICS_CACHE_SECONDS', '300'))
+    ANALYTICS_AT_RISK_PERCENT = 75
+    ANALYTICS_MAX_TREND_DAYS = 730
+
+    # Background jobs (POST /api/jobs): queue shared with job_worker.py on
+    # the same host, where results are written and for how long, and how
+    # the worker processes poll and heartbeat
+    JOBS_DB_PATH = os.getenv(
+        'JOBS_DB_PATH',
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'jobs.db')
+    )
+    JOBS_RESULTS_DIR = os.getenv(
+        'JOBS_RESULTS_DIR',
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'job_results')
+    )
+    JOB_RESULT_RETENTION_HOURS = 24
+    JOB_WORKER_PROCESSES = int(os.getenv('JOB_WORKER_PROCESSES', '2'))
+    JOB_POLL_INTERVAL = 1.0
+    JOB_HEARTBEAT_SECONDS = 10
+    JOB_CLAIM_TIMEOUT = 120
+    JOB_MAX_ACTIVE_PER_USER = 3
+
+    # Logging: JSON lines on stdout written by a background thread; when
+    # LOG_QUEUE_SIZE records are waiting, new ones are dropped (and counted)
+    # instead of blocking. Errors and requests slower than
+    # LOG_SLOW_REQUEST_MS are always access-logged, successful ones at
+    # LOG_SUCCESS_SAMPLE_RATE unless LOG_ROUTE_SAMPLE_RATES has their endpoint
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+    LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+    LOG_SUCCESS_SAMPLE_RATE = float(os.getenv('LOG_SUCCESS_SAMPLE_RATE', '1.0'))
+    LOG_ROUTE_SAMPLE_RATES = {
+        'health_check': 0.0,
+        'metrics': 0.0,
+        'static': 0.1,
+    }
+    LOG_SLOW_REQUEST_MS = 1000
+
+    # Prometheus metrics (GET /metrics): per-worker files summed at scrape
+    # time (gunicorn clears them on start), an optional bearer token the
+    # scraper must send, and the latency histogram buckets in seconds
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True').lower() == 'true'
+    METRICS_DIR = os.getenv(
+        'METRICS_DIR',
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'metrics')
+    )
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+    METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    # Request profiling (off unless enabled): share of requests sampled,
+    # sampling interval, and where the newest PROFILE_MAX_FILES profiles are
+    # kept for /api/admin/profiles (admins can also send X-Profile: 1)
+    PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'False').lower() == 'true'
+    PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+    PROFILE_INTERVAL_MS = 5
+    PROFILE_DIR = os.getenv(
+        'PROFILE_DIR',
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'profiles')
+    )
+    PROFILE_MAX_FILES = int(os.getenv('PROFILE_MAX_FILES', '200'))
+
+    # Reports: attendance % needed for eligibility, processes for the
+    # compliance report (0 = one per CPU), and rows per chunk when exporting
+    REPORT_ELIGIBILITY_CUTOFF = 75
+    REPORT_PROCESSES = int(os.getenv('REPORT_PROCESSES', '0'))
+    REPORT_EXPORT_CHUNK_ROWS = 5000
+
 
 class DevelopmentConfig(Config):
     """Development configuration"""
@@ -45,16 +217,32 @@ class DevelopmentConfig(Config):
     FLASK_ENV = 'development'
 
 
+class LocalShardedConfig(DevelopmentConfig):
+    """Development on SQLite files, with attendance split over three shards"""
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'instance', 'studenttracker.db'
+    )
+    SQLALCHEMY_ENGINE_OPTIONS = {}
+    ATTENDANCE_SHARDS = [
+        'sqlite:///' + os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', f'attendance_shard_{index}.db')
+        for index in range(3)
+    ]
+
+
 class ProductionConfig(Config):
     """Production configuration"""
     DEBUG = False
     FLASK_ENV = 'production'
+    # Deployed behind one reverse proxy (App Service front end, nginx)
+    TRUSTED_PROXY_HOPS = int(os.getenv('TRUSTED_PROXY_HOPS', '1'))
+    AUTO_CREATE_SCHEMA = os.getenv('AUTO_CREATE_SCHEMA', 'False').lower() == 'true'
 
 
 class TestingConfig(Config):
     """Testing configuration"""
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    RATE_LIMIT_ENABLED = False
 
 
 # Configuration dictionary
@@ -62,5 +250,6 @@ config = {
     'development': DevelopmentConfig,
     'production': ProductionConfig,
     'testing': TestingConfig,
+    'local_sharded': LocalShardedConfig,
     'default': DevelopmentConfig
 }
@@ -0,0 +1,97 @@
+"""
+Custom column types for StudentTracker models
+"""
+import os
+import time
+import uuid
+
+from sqlalchemy.dialects import mysql
+from sqlalchemy.types import LargeBinary, SmallInteger, TypeDecorator
+
+
+def uuid7():
+    """Generate a time-ordered UUID (version 7)
+
+    The first 48 bits are the Unix time in milliseconds, so keys generated
+    later sort after earlier ones and new rows append to the end of the
+    clustered index instead of splitting random pages.
+    """
+    timestamp_ms = time.time_ns() // 1_000_000
+    value = (timestamp_ms & 0xFFFFFFFFFFFF) << 80
+    value |= int.from_bytes(os.urandom(10), 'big')
+    value &= ~(0xF << 76)
+    value |= 0x7 << 76          # version 7
+    value &= ~(0x3 << 62)
+    value |= 0x2 << 62          # RFC 4122 variant
+    return uuid.UUID(int=value)
+
+
+def parse_uuid(value):
+    """uuid.UUID of an identifier in any form uuid.UUID accepts (any case,
+    with or without hyphens); ValueError for anything else"""
+    if isinstance(value, uuid.UUID):
+        return value
+    try:
+        return uuid.UUID(str(value))
+    except ValueError:
+        raise ValueError(f"Invalid identifier: {value}")
+
+
+class BinaryUUID(TypeDecorator):
+    """UUID stored as 16 raw bytes, exposed to Python as the canonical string
+
+    Models, to_dict() and URLs keep working with '8-4-4-4-12' strings while
+    MySQL stores BINARY(16) (other databases use a 16 byte blob).
+    """
+    impl = LargeBinary(16)
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == 'mysql':
+            return dialect.type_descriptor(mysql.BINARY(16))
+        return dialect.type_descriptor(LargeBinary(16))
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return parse_uuid(value).bytes
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return str(uuid.UUID(bytes=bytes(value)))
+
+
+class CodedString(TypeDecorator):
+    """Short string values stored as small integer codes
+
+    `codes` is a tuple of (value, code) pairs. Python code and JSON keep
+    using the strings; the column holds a one byte code on MySQL, and
+    filters such as filter_by(status='present') compare on the code.
+    """
+    impl = SmallInteger
+    cache_ok = True
+
+    def __init__(self, codes):
+        super().__init__()
+        self.codes = tuple(codes)
+        self._by_value = dict(self.codes)
+        self._by_code = {code: value for value, code in self.codes}
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == 'mysql':
+            return dialect.type_descriptor(mysql.TINYINT(unsigned=True))
+        return dialect.type_descriptor(SmallInteger())
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        try:
+            return self._by_value[value]
+        except KeyError:
+            raise ValueError(f"Invalid value: {value}")
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return self._by_code[int(value)]
@@ -0,0 +1,110 @@
+"""
+Delta sync ("changes since") for list endpoints
+
+Responses of the syncable reads carry a `watermark`; a client that keeps a
+cached view sends it back as ?since= and receives only rows whose
+updated_at moved past it, plus tombstones for rows that were deactivated
+(is_active=False) or, for attendance, hard-deleted (deleted_records).
+
+Watermarks are keyset cursors over (updated_at, id), so rows sharing a
+timestamp are never skipped when a sync is split into pages. Results stop
+at a horizon SYNC_SETTLE_SECONDS in the past: a transaction that stamped
+updated_at but committed a moment later is still picked up next time.
+"""
+from datetime import datetime, timedelta
+
+from flask import current_app, request
+from sqlalchemy import and_, or_
+
+from models import db, DeletedRecord
+
+EXPIRED_MESSAGE = 'Watermark expired, reload the full list'
+
+
+def parse_watermark(value):
+    """'<iso timestamp>[|<row id>]' -> (datetime, id or None)"""
+    stamp, _, row_id = value.partition('|')
+    try:
+        return datetime.fromisoformat(stamp), row_id or None
+    except ValueError:
+        raise ValueError('Invalid since watermark')
+
+
+def format_watermark(stamp, row_id=None):
+    return f'{stamp.isoformat()}|{row_id}' if row_id else stamp.isoformat()
+
+
+def settle_horizon():
+    return datetime.utcnow() - timedelta(seconds=current_app.config['SYNC_SETTLE_SECONDS'])
+
+
+def initial_watermark():
+    """Watermark for a full (non-delta) response, taken before it is read"""
+    return format_watermark(settle_horizon())
+
+
+class SyncWindow:
+    """One ?since= request: which rows and tombstones to return"""
+
+    def __init__(self, since):
+        config = current_app.config
+        self.since, self.since_id = parse_watermark(since)
+        self.until = settle_horizon()
+        self.limit = config['SYNC_MAX_CHANGES']
+        self.expired = self.since < datetime.utcnow() - timedelta(days=config['SYNC_TOMBSTONE_RETENTION_DAYS'])
+        self.has_more = False
+        self.watermark = format_watermark(max(self.since, self.until))
+        self._tombstones_until = self.until
+
+    def rows(self, query, model):
+        """Rows of `query` changed inside the window, oldest change first"""
+        updated_at = model.updated_at
+        after = updated_at > self.since
+        if self.since_id:
+            after = or_(after, and_(updated_at == self.since, model.id > self.since_id))
+        rows = query.filter(after, updated_at <= self.until).order_by(
+            updated_at, model.id
+        ).limit(self.limit + 1).all()
+        if len(rows) > self.limit:
+            rows = rows[:self.limit]
+            last = rows[-1]
+            self.has_more = True
+            self.watermark = format_watermark(last.updated_at, last.id)
+            self._tombstones_until = last.updated_at
+        return rows
+
+    def deleted(self, entity, scope_id=None):
+        """Ids of hard-deleted rows recorded inside the window (call after rows())"""
+        query = DeletedRecord.query.filter(
+            DeletedRecord.entity == entity,
+            DeletedRecord.deleted_at > self.since,
+            DeletedRecord.deleted_at <= self._tombstones_until,
+        )
+        if scope_id is not None:
+            query = query.filter(DeletedRecord.scope_id == scope_id)
+        return [record.entity_id for record in query.order_by(DeletedRecord.deleted_at)]
+
+    def response(self, changed, deleted):
+        return {
+            'changed': changed,
+            'deleted': deleted,
+            'watermark': self.watermark,
+            'has_more': self.has_more,
+        }
+
+
+def sync_window():
+    """SyncWindow for this request's ?since=, or None for a full read"""
+    since = request.args.get('since', None, type=str)
+    return SyncWindow(since) if since else None
+
+
+def record_deletion(entity, entity_id, scope_id=None):
+    """Add a tombstone for a hard delete (part of the caller's transaction)
+
+    Tombstones older than SYNC_TOMBSTONE_RETENTION_DAYS are pruned on the
+    way; clients holding older watermarks get 410 and reload.
+    """
+    horizon = datetime.utcnow() - timedelta(days=current_app.config['SYNC_TOMBSTONE_RETENTION_DAYS'])
+    DeletedRecord.query.filter(DeletedRecord.deleted_at < horizon).delete(synchronize_session=False)
+    db.session.add(DeletedRecord(entity=entity, entity_id=entity_id, scope_id=scope_id))
@@ -0,0 +1,77 @@
+"""
+Sparse fieldsets: ?fields=id,status on list and detail endpoints
+
+Models declare their to_dict() output in DICT_FIELDS, with the columns and
+relationship paths each field reads. The requested fields decide the
+query's load_only() columns and which relationships are eagerly loaded, so
+a field nobody asked for costs no column, join or lazy load. Without
+?fields= every field is returned and every relationship the full output
+needs is loaded eagerly up front.
+"""
+from flask import request
+from sqlalchemy import inspect
+from sqlalchemy.orm import joinedload, load_only, selectinload
+
+
+def requested_fields(model, extra=()):
+    """Field names from ?fields=, or None for all; unknown names are a 400
+
+    `extra` lists names an endpoint adds to the model's own fields.
+    """
+    raw = request.args.get('fields', '', type=str)
+    fields = {name.strip() for name in raw.split(',') if name.strip()}
+    if not fields:
+        return None
+    unknown = fields - set(model.DICT_FIELDS) - set(extra)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    return fields
+
+
+def _relationship_option(model, path):
+    """joinedload/selectinload chain for a dotted relationship path"""
+    option = None
+    current = model
+    for name in path.split('.'):
+        relationship = inspect(current).relationships[name]
+        attribute = getattr(current, name)
+        # Collections via a second SELECT, so LIMIT still applies to rows
+        if relationship.uselist:
+            option = selectinload(attribute) if option is None else option.selectinload(attribute)
+        else:
+            option = joinedload(attribute) if option is None else option.joinedload(attribute)
+        current = relationship.mapper.class_
+    return option
+
+
+def load_options(model, fields=None, columns=(), exclude=()):
+    """Loader options for serialising `model` rows with to_dict(fields)
+
+    `columns` names extra columns the endpoint itself reads (for example
+    is_active to tell tombstones apart). Relationships named in `exclude`
+    are not loaded, only their foreign key columns; the caller fills them
+    in (see sharding.attach_related).
+    """
+    if fields is None:
+        specs = list(model.DICT_FIELDS.values())
+    else:
+        specs = [model.DICT_FIELDS[name] for name in fields if name in model.DICT_FIELDS]
+
+    mapper = inspect(model)
+    needed = {column.key for column in mapper.primary_key} | set(columns)
+    paths = set()
+    for spec in specs:
+        needed.update(spec.columns)
+        paths.update(spec.relations)
+
+    options = []
+    for path in sorted(paths):
+        first = mapper.relationships[path.split('.')[0]]
+        # Many-to-one loads need the foreign key column
+        needed.update(column.key for column in first.local_columns if column.table is mapper.local_table)
+        if first.key not in exclude:
+            options.append(_relationship_option(model, path))
+
+    if fields is not None:
+        options.append(load_only(*[getattr(model, name) for name in sorted(needed)]))
+    return options
@@ -0,0 +1,52 @@
+"""
+Gunicorn configuration for StudentTracker
+
+Loads the application once in the master (preload_app) so workers share its
+memory copy-on-write, then gives every worker its own database connections.
+Workers are threaded so long-lived attendance streams (server-sent events)
+occupy a thread rather than a whole worker; keep GUNICORN_THREADS at or
+below the database pool size.
+"""
+import gc
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('GUNICORN_WORKERS', '4'))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '8'))
+timeout = 60
+# The app writes its own access log through the non-blocking logging
+# pipeline (logging_setup.py); set GUNICORN_ACCESSLOG=- to get gunicorn's too
+accesslog = os.getenv('GUNICORN_ACCESSLOG') or None
+errorlog = '-'
+preload_app = os.getenv('GUNICORN_PRELOAD', 'True').lower() == 'true'
+
+# Keep the collector from touching (and so copying) preloaded objects until
+# they are frozen just before the first fork
+if preload_app:
+    gc.disable()
+
+
+def on_starting(server):
+    """Start /metrics from zero: drop the files of the previous run's workers"""
+    import metrics
+    from config import config
+    metrics.reset(config[os.getenv('FLASK_ENV', 'production')].METRICS_DIR)
+
+
+def pre_fork(server, worker):
+    """Move everything allocated so far into the permanent generation"""
+    if preload_app:
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    """Re-enable GC, drop database connections inherited from the master and
+    start the worker's attendance flusher (replaying a crashed run's journal)"""
+    gc.enable()
+    import write_behind
+    app = server.app.wsgi()
+    if preload_app:
+        from app import dispose_engines
+        dispose_engines(app)
+    write_behind.start_flusher(app)
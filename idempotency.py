@@ -0,0 +1,206 @@
+"""
+Idempotency-Key support for write endpoints
+
+A client may send an `Idempotency-Key` header with a write. The first
+request with a key is processed normally and its response stored; retries
+with the same key (from the same user, to the same URL) get the stored
+response replayed instead of being processed again. Anonymous callers are
+told apart by client address. Credentials in a response (the tokens handed
+out by /register) are never stored, so a replay carries everything but
+them. Stored responses live in the `idempotency_records` table, so they
+survive worker restarts, with a bounded in-memory TTL cache in front so
+most retries cost no query at all.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import current_app, make_response, request
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy.exc import IntegrityError
+
+import metrics
+from models import db, IdempotencyRecord
+from utils import api_response
+
+MAX_KEY_LENGTH = 255
+
+# Expired records are purged by every Nth new key a worker claims
+PURGE_EVERY = 1000
+
+# Response data keys that hold credentials and are left out of stored bodies
+SECRET_FIELDS = ('tokens',)
+
+
+class TTLCache:
+    """Bounded LRU mapping whose entries expire after `ttl` seconds"""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+_cache = None
+_claims = 0
+
+
+def response_cache():
+    global _cache
+    if _cache is None:
+        config = current_app.config
+        _cache = TTLCache(config['IDEMPOTENCY_CACHE_SIZE'], config['IDEMPOTENCY_TTL_SECONDS'])
+    return _cache
+
+
+def _scope_hash(key):
+    try:
+        identity = get_jwt_identity()
+    except RuntimeError:
+        identity = None  # endpoint without jwt_required
+    if identity is None:
+        identity = f'anonymous@{request.remote_addr}'
+    scope = f"{identity}\n{request.method} {request.path}\n{key}"
+    return hashlib.sha256(scope.encode()).hexdigest()
+
+
+def _replay(stored, fingerprint):
+    request_hash, status_code, body, content_type = stored
+    if request_hash != fingerprint:
+        return api_response('Idempotency-Key was already used with a different request', status_code=422)
+    response = make_response(body, status_code)
+    response.content_type = content_type
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _stored_body(response):
+    """The response body as it may be kept, without any credentials"""
+    body = response.get_data(as_text=True)
+    payload = response.get_json(silent=True)
+    data = payload.get('data') if isinstance(payload, dict) else None
+    if not isinstance(data, dict) or not any(field in data for field in SECRET_FIELDS):
+        return body
+    for field in SECRET_FIELDS:
+        data.pop(field, None)
+    return json.dumps(payload)
+
+
+def _discard(key_hash):
+    db.session.query(IdempotencyRecord).filter_by(key_hash=key_hash).delete()
+    db.session.commit()
+
+
+def _purge_expired(now):
+    global _claims
+    _claims += 1
+    if _claims % PURGE_EVERY == 0:
+        db.session.query(IdempotencyRecord).filter(IdempotencyRecord.expires_at <= now).delete()
+        db.session.commit()
+
+
+def idempotent(fn):
+    """Honour the Idempotency-Key header on a write endpoint
+
+    Apply below the auth decorator (so the caller is known) and above
+    handle_exceptions (so the final response is what gets stored).
+    """
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if not key:
+            return fn(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return api_response('Idempotency-Key is too long', status_code=400)
+
+        config = current_app.config
+        key_hash = _scope_hash(key)
+        fingerprint = hashlib.sha256(request.get_data()).hexdigest()
+
+        stored = response_cache().get(key_hash)
+        metrics.cache_result('idempotency', stored is not None)
+        if stored is not None:
+            return _replay(stored, fingerprint)
+
+        now = datetime.utcnow()
+        record = db.session.get(IdempotencyRecord, key_hash)
+        if record is not None:
+            if record.expires_at <= now:
+                db.session.delete(record)
+                db.session.commit()
+            elif record.status_code is None:
+                # Another request with this key is still running, or died
+                pending_for = (now - record.created_at).total_seconds()
+                if pending_for < config['IDEMPOTENCY_PENDING_TIMEOUT']:
+                    return api_response('A request with this Idempotency-Key is in progress', status_code=409)
+                db.session.delete(record)
+                db.session.commit()
+            else:
+                stored = (record.request_hash, record.status_code, record.response_body, record.content_type)
+                response_cache().put(key_hash, stored)
+                return _replay(stored, fingerprint)
+
+        # Claim the key before doing the work so concurrent retries back off
+        db.session.add(IdempotencyRecord(
+            key_hash=key_hash,
+            request_hash=fingerprint,
+            created_at=now,
+            expires_at=now + timedelta(seconds=config['IDEMPOTENCY_TTL_SECONDS']),
+        ))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return api_response('A request with this Idempotency-Key is in progress', status_code=409)
+        _purge_expired(now)
+
+        try:
+            response = make_response(fn(*args, **kwargs))
+        except Exception:
+            db.session.rollback()
+            _discard(key_hash)
+            raise
+
+        if response.status_code >= 500:
+            # Let the client retry failures for real
+            db.session.rollback()
+            _discard(key_hash)
+            return response
+        if response.status_code >= 400:
+            # Keep the stored 4xx, not what the handler flushed before refusing
+            db.session.rollback()
+
+        body = _stored_body(response)
+        db.session.query(IdempotencyRecord).filter_by(key_hash=key_hash).update({
+            'status_code': response.status_code,
+            'response_body': body,
+            'content_type': response.content_type,
+        })
+        db.session.commit()
+        response_cache().put(key_hash, (fingerprint, response.status_code, body, response.content_type))
+        return response
+    return wrapper
@@ -0,0 +1,86 @@
+"""
+Background job worker for StudentTracker
+Run next to the web server on the same host: python job_worker.py [config] [--processes N]
+
+Starts JOB_WORKER_PROCESSES processes that take reports queued through
+POST /api/jobs from the local job queue (jobs.py) and run them one at a
+time. A process that dies is restarted; the job it was running is requeued
+by the next recovery pass.
+"""
+import argparse
+import multiprocessing
+import os
+import signal
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+
+def work(config_name):
+    """One worker process: recover stale jobs now and then, otherwise run the next job"""
+    from app import create_app
+    from jobs import job_queue, run_next
+
+    # The parent stops us with SIGTERM; Ctrl-C reaches the whole group, leave it to the parent
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    app = create_app(config_name)
+    config = app.config
+    queue = job_queue(app)
+    recovered_at = None
+    while True:
+        try:
+            if recovered_at is None or time.monotonic() - recovered_at > config['JOB_CLAIM_TIMEOUT']:
+                queue.recover(config['JOB_CLAIM_TIMEOUT'])
+                queue.purge(config['JOB_RESULT_RETENTION_HOURS'] * 3600)
+                recovered_at = time.monotonic()
+            if run_next(app):
+                continue
+        except Exception:
+            app.logger.exception('Job worker error')
+        time.sleep(config['JOB_POLL_INTERVAL'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('config', nargs='?', default=os.getenv('FLASK_ENV', 'production'))
+    parser.add_argument('--processes', type=int, default=None)
+    args = parser.parse_args()
+
+    from config import config
+    processes = args.processes or config[args.config].JOB_WORKER_PROCESSES
+
+    workers = {}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    print(f"Starting {processes} job worker processes")
+    while not stopping:
+        for slot in range(processes):
+            process = workers.get(slot)
+            if process is None or not process.is_alive():
+                if process is not None:
+                    print(f"Job worker {process.pid} exited with {process.exitcode}, restarting")
+                process = multiprocessing.Process(target=work, args=(args.config,), name=f'job-worker-{slot}')
+                process.start()
+                workers[slot] = process
+        time.sleep(1)
+
+    for process in workers.values():
+        process.terminate()
+    for process in workers.values():
+        process.join(10)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
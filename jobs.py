@@ -0,0 +1,321 @@
+"""
+Background jobs for long-running reports
+
+POST /api/jobs validates a report request and appends it to a SQLite queue
+in WAL mode (JOBS_DB_PATH) shared by every process on the host. Reports run
+in job_worker.py, a separate pool of processes, so no gunicorn worker is
+held past its timeout. A running job reports progress as it goes, which is
+also where a cancellation request is noticed, and writes its output to
+JOBS_RESULTS_DIR for GET /api/jobs/<id>/download.
+
+Running jobs heartbeat every JOB_HEARTBEAT_SECONDS. When a worker process
+dies (or stops heartbeating for JOB_CLAIM_TIMEOUT) its job is requeued, up
+to MAX_ATTEMPTS times.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from flask import current_app
+
+from models import db
+from workers import claimant_alive, worker_name
+
+MAX_ATTEMPTS = 3
+
+# Progress writes closer together than this are skipped
+PROGRESS_INTERVAL = 0.5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    params TEXT NOT NULL,
+    owner_user_id TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    progress REAL NOT NULL DEFAULT 0,
+    message TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    claimed_by TEXT,
+    heartbeat_at REAL,
+    result_path TEXT,
+    result_name TEXT,
+    content_type TEXT,
+    result_bytes INTEGER,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS ix_jobs_status ON jobs (status, created_at);
+CREATE INDEX IF NOT EXISTS ix_jobs_owner ON jobs (owner_user_id, created_at);
+"""
+
+PUBLIC_COLUMNS = (
+    'id', 'kind', 'params', 'owner_user_id', 'status', 'progress', 'message', 'attempts',
+    'cancel_requested', 'result_path', 'result_name', 'content_type', 'result_bytes', 'error',
+    'created_at', 'started_at', 'finished_at',
+)
+
+
+class JobCancelled(Exception):
+    """Raised inside a report when its job has been cancelled"""
+
+
+def _timestamp(value):
+    return datetime.utcfromtimestamp(value).isoformat() if value else None
+
+
+class JobQueue:
+    """Durable job queue in a SQLite file (one connection per thread)"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=FULL')
+            connection.executescript(SCHEMA)
+            self._local.connection = connection
+        return connection
+
+    def enqueue(self, owner_user_id, kind, params):
+        job_id = str(uuid.uuid4())
+        self._connection().execute(
+            "INSERT INTO jobs (id, kind, params, owner_user_id, created_at) VALUES (?, ?, ?, ?, ?)",
+            (job_id, kind, json.dumps(params), owner_user_id, time.time()),
+        )
+        return job_id
+
+    def active_count(self, owner_user_id):
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM jobs WHERE owner_user_id = ? AND status IN ('queued', 'running')",
+            (owner_user_id,),
+        ).fetchone()[0]
+
+    def claim(self, worker):
+        """Take the oldest queued job, or None"""
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute(
+                "SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if row:
+                now = time.time()
+                connection.execute(
+                    "UPDATE jobs SET status = 'running', claimed_by = ?, heartbeat_at = ?, "
+                    "started_at = ?, attempts = attempts + 1, progress = 0, message = NULL WHERE id = ?",
+                    (worker, now, now, row[0]),
+                )
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        return self.get(row[0]) if row else None
+
+    def _should_stop(self, job_id, worker):
+        row = self._connection().execute(
+            "SELECT cancel_requested FROM jobs WHERE id = ? AND claimed_by = ?", (job_id, worker),
+        ).fetchone()
+        # A job no longer claimed by this worker was requeued elsewhere; stop too
+        return row is None or bool(row[0])
+
+    def heartbeat(self, job_id, worker):
+        """Refresh a running job's claim; returns True once it should stop"""
+        self._connection().execute(
+            "UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND claimed_by = ?",
+            (time.time(), job_id, worker),
+        )
+        return self._should_stop(job_id, worker)
+
+    def progress(self, job_id, worker, fraction, message):
+        """Record progress; returns True once the job should stop"""
+        self._connection().execute(
+            "UPDATE jobs SET progress = ?, message = ?, heartbeat_at = ? WHERE id = ? AND claimed_by = ?",
+            (round(min(max(fraction, 0.0), 1.0), 4), message, time.time(), job_id, worker),
+        )
+        return self._should_stop(job_id, worker)
+
+    def finish(self, job_id, worker, path, name, content_type):
+        self._connection().execute(
+            "UPDATE jobs SET status = 'succeeded', progress = 1, result_path = ?, result_name = ?, "
+            "content_type = ?, result_bytes = ?, claimed_by = NULL, finished_at = ? "
+            "WHERE id = ? AND claimed_by = ?",
+            (path, name, content_type, os.path.getsize(path), time.time(), job_id, worker),
+        )
+
+    def fail(self, job_id, worker, error, status='failed'):
+        self._connection().execute(
+            "UPDATE jobs SET status = ?, error = ?, claimed_by = NULL, finished_at = ? "
+            "WHERE id = ? AND claimed_by = ?",
+            (status, error, time.time(), job_id, worker),
+        )
+
+    def cancel(self, job_id):
+        """Cancel a queued job at once, or ask its worker to stop a running one"""
+        connection = self._connection()
+        connection.execute(
+            "UPDATE jobs SET status = 'cancelled', cancel_requested = 1, finished_at = ? "
+            "WHERE id = ? AND status = 'queued'",
+            (time.time(), job_id),
+        )
+        connection.execute(
+            "UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = 'running'", (job_id,),
+        )
+        return self.get(job_id)
+
+    def recover(self, claim_timeout):
+        """Requeue running jobs whose worker died; give up after MAX_ATTEMPTS"""
+        connection = self._connection()
+        stale = [
+            (job_id,) for job_id, claimed_by, heartbeat_at in connection.execute(
+                "SELECT id, claimed_by, heartbeat_at FROM jobs WHERE status = 'running'"
+            ).fetchall()
+            if heartbeat_at < time.time() - claim_timeout or not claimant_alive(claimed_by)
+        ]
+        connection.executemany(
+            "UPDATE jobs SET status = CASE WHEN cancel_requested THEN 'cancelled' "
+            "WHEN attempts >= ? THEN 'failed' ELSE 'queued' END, "
+            "error = CASE WHEN attempts >= ? THEN 'Worker stopped while running the job' END, "
+            "claimed_by = NULL, finished_at = CASE WHEN attempts >= ? OR cancel_requested THEN ? END "
+            "WHERE id = ? AND status = 'running'",
+            [(MAX_ATTEMPTS, MAX_ATTEMPTS, MAX_ATTEMPTS, time.time(), job_id) for (job_id,) in stale],
+        )
+        return len(stale)
+
+    def purge(self, retention_seconds):
+        """Forget finished jobs older than the retention and delete their files"""
+        connection = self._connection()
+        cutoff = time.time() - retention_seconds
+        for (path,) in connection.execute(
+            "SELECT result_path FROM jobs WHERE finished_at < ? AND result_path IS NOT NULL", (cutoff,)
+        ).fetchall():
+            if os.path.exists(path):
+                os.remove(path)
+        connection.execute("DELETE FROM jobs WHERE finished_at < ?", (cutoff,))
+
+    def get(self, job_id):
+        row = self._connection().execute(
+            f"SELECT {', '.join(PUBLIC_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        return self._job(row) if row else None
+
+    def for_owner(self, owner_user_id, limit):
+        rows = self._connection().execute(
+            f"SELECT {', '.join(PUBLIC_COLUMNS)} FROM jobs WHERE owner_user_id = ? "
+            "ORDER BY created_at DESC LIMIT ?",
+            (owner_user_id, limit),
+        ).fetchall()
+        return [self._job(row) for row in rows]
+
+    @staticmethod
+    def _job(row):
+        job = dict(zip(PUBLIC_COLUMNS, row))
+        job['params'] = json.loads(job['params'])
+        job['cancel_requested'] = bool(job['cancel_requested'])
+        for column in ('created_at', 'started_at', 'finished_at'):
+            job[column] = _timestamp(job[column])
+        return job
+
+
+def public_job(job):
+    """API view of a job (no owner or server file path)"""
+    view = {key: value for key, value in job.items() if key not in ('owner_user_id', 'result_path')}
+    view['status_url'] = f"/api/jobs/{job['id']}"
+    if job['status'] == 'succeeded':
+        view['download_url'] = f"/api/jobs/{job['id']}/download"
+    return view
+
+
+_queue = None
+
+
+def job_queue(app=None):
+    global _queue
+    if _queue is None:
+        _queue = JobQueue((app or current_app).config['JOBS_DB_PATH'])
+    return _queue
+
+
+class JobContext:
+    """What a running report sees of its job"""
+
+    def __init__(self, queue, job, worker, results_dir):
+        self.queue = queue
+        self.id = job['id']
+        self.params = job['params']
+        self.worker = worker
+        self.results_dir = results_dir
+        self.path = None
+        self._reported_at = 0.0
+
+    def progress(self, fraction, message=None):
+        """Report progress (0..1); raises JobCancelled if the job was cancelled"""
+        now = time.monotonic()
+        if now - self._reported_at < PROGRESS_INTERVAL and fraction < 1:
+            return
+        self._reported_at = now
+        if self.queue.progress(self.id, self.worker, fraction, message):
+            raise JobCancelled()
+
+    def output_path(self, extension):
+        """Where the report writes its result (removed again unless the job succeeds)"""
+        os.makedirs(self.results_dir, exist_ok=True)
+        self.path = os.path.join(self.results_dir, f'{self.id}.{extension}')
+        return self.path
+
+
+def _heartbeat(queue, job_id, worker, interval, done):
+    while not done.wait(interval):
+        try:
+            queue.heartbeat(job_id, worker)
+        except sqlite3.Error:
+            pass
+
+
+def run_next(app, worker=None):
+    """Claim one queued job and run it to the end; returns False if none was queued"""
+    from reports import REPORT_KINDS
+
+    config = app.config
+    worker = worker or worker_name()
+    queue = job_queue(app)
+    job = queue.claim(worker)
+    if job is None:
+        return False
+
+    context = JobContext(queue, job, worker, config['JOBS_RESULTS_DIR'])
+    done = threading.Event()
+    threading.Thread(
+        target=_heartbeat, args=(queue, job['id'], worker, config['JOB_HEARTBEAT_SECONDS'], done),
+        name='job-heartbeat', daemon=True,
+    ).start()
+    try:
+        with app.app_context():
+            try:
+                name, content_type = REPORT_KINDS[job['kind']].run(context, job['params'])
+            finally:
+                db.session.remove()
+        queue.finish(job['id'], worker, context.path, name, content_type)
+    except JobCancelled:
+        queue.fail(job['id'], worker, None, status='cancelled')
+    except Exception as e:
+        app.logger.exception('Job %s (%s) failed', job['id'], job['kind'])
+        queue.fail(job['id'], worker, str(e))
+    finally:
+        done.set()
+        current = queue.get(job['id'])
+        if context.path and os.path.exists(context.path) and (current is None or current['status'] != 'succeeded'):
+            os.remove(context.path)
+    return True
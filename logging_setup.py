@@ -0,0 +1,203 @@
+"""
+Non-blocking structured logging for StudentTracker
+
+Every log record (application, access and library loggers alike) goes to
+a QueueHandler on the root logger; a background thread per process takes
+records off the queue and writes them to stdout as JSON lines. A request
+thread never waits for stdout: when LOG_QUEUE_SIZE records are already
+waiting, new ones are dropped and counted (log_records_dropped_total in
+/metrics) rather than blocking.
+
+Each request gets an id - the caller's X-Request-ID when it looks sane,
+otherwise a new one - that is attached to every record logged while it
+runs and returned in the X-Request-ID response header. The app writes its
+own access log: errors and slow requests always, successful ones sampled
+per endpoint.
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from flask import current_app, g, has_request_context, request
+from flask.logging import default_handler
+
+import metrics
+from utils import is_subrequest
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+
+REQUEST_ID = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+access_logger = logging.getLogger('studenttracker.access')
+
+# Per-request attributes copied onto records, in output order
+CONTEXT_FIELDS = ('request_id', 'method', 'path', 'route', 'status', 'duration_ms', 'sample_rate')
+
+
+class RequestContextFilter(logging.Filter):
+    """Stamp records with the current request's id, method, path and route
+
+    Runs in the logging thread, before the record is queued, since the
+    writer thread has no request context.
+    """
+
+    def filter(self, record):
+        if has_request_context() and not hasattr(record, 'request_id'):
+            record.request_id = g.get('request_id')
+            record.method = request.method
+            record.path = request.path
+            record.route = request.endpoint
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'pid': record.process,
+        }
+        for name in CONTEXT_FIELDS:
+            value = getattr(record, name, None)
+            if value is not None:
+                entry[name] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops and counts records instead of blocking
+
+    The queue and its writer thread belong to one process: after a fork
+    (gunicorn workers of a preloaded app) the first record starts new ones.
+    """
+
+    def __init__(self, size, targets):
+        super().__init__(queue.Queue(size))
+        self.size = size
+        self.dropped = 0
+        self._targets = targets
+        self._writer = None
+        self._writer_pid = None
+        self._writer_lock = threading.Lock()
+
+    def _ensure_writer(self):
+        pid = os.getpid()
+        if self._writer_pid == pid:
+            return
+        with self._writer_lock:
+            if self._writer_pid != pid:
+                self.queue = queue.Queue(self.size)
+                self._writer = logging.handlers.QueueListener(
+                    self.queue, *self._targets, respect_handler_level=True
+                )
+                self._writer.start()
+                self._writer_pid = pid
+
+    def enqueue(self, record):
+        self._ensure_writer()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            metrics.inc('log_records_dropped_total')
+
+    def prepare(self, record):
+        # Render the message and traceback now, while the arguments and the
+        # exception still describe this moment
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def flush_and_stop(self):
+        """Write what is queued and stop the writer (this process only)"""
+        if self._writer is not None and self._writer_pid == os.getpid():
+            self._writer.stop()
+            self._writer = None
+            self._writer_pid = None
+
+
+_handler = None
+
+
+def configure(level, queue_size, stream=None):
+    """Route the root logger through one bounded queue (once per process)"""
+    global _handler
+    root = logging.getLogger()
+    if _handler is None:
+        output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(JsonFormatter())
+        _handler = BoundedQueueHandler(queue_size, [output])
+        _handler.addFilter(RequestContextFilter())
+        root.addHandler(_handler)
+        atexit.register(_handler.flush_and_stop)
+    root.setLevel(level)
+    return _handler
+
+
+def _request_id():
+    supplied = request.headers.get(REQUEST_ID_HEADER, '')
+    return supplied if REQUEST_ID.match(supplied) else uuid.uuid4().hex
+
+
+def _sample_rate(config):
+    return config['LOG_ROUTE_SAMPLE_RATES'].get(request.endpoint, config['LOG_SUCCESS_SAMPLE_RATE'])
+
+
+def init_app(app):
+    """Install the logging pipeline, request ids and the access log"""
+    configure(app.config['LOG_LEVEL'], app.config['LOG_QUEUE_SIZE'])
+    # Flask's own stderr handler would write synchronously, next to ours
+    app.logger.removeHandler(default_handler)
+
+    @app.before_request
+    def _start_request():
+        if is_subrequest():
+            return None
+        g.request_id = _request_id()
+        g._log_started = time.perf_counter()
+        return None
+
+    @app.after_request
+    def _log_request(response):
+        started = g.get('_log_started')
+        if started is None or is_subrequest():
+            return response
+        response.headers[REQUEST_ID_HEADER] = g.request_id
+        config = current_app.config
+        duration_ms = round((time.perf_counter() - started) * 1000, 3)
+        status = response.status_code
+        rate = 1.0
+        if status < 400 and duration_ms < config['LOG_SLOW_REQUEST_MS']:
+            rate = _sample_rate(config)
+            if rate <= 0 or random.random() >= rate:
+                return response
+        access_logger.log(
+            logging.ERROR if status >= 500 else logging.WARNING if status >= 400 else logging.INFO,
+            '%s %s %s %.1fms', request.method, request.path, status, duration_ms,
+            extra={'status': status, 'duration_ms': duration_ms, 'sample_rate': rate},
+        )
+        return response
@@ -0,0 +1,330 @@
+"""
+Prometheus metrics for StudentTracker, consistent across gunicorn workers
+
+Every worker process writes its counters and histograms into its own small
+memory-mapped file in METRICS_DIR (metrics_<pid>.db): updating a value is
+a lock and an in-place write, with no syscalls or cross-process
+coordination. GET /metrics reads the files of all workers and adds them
+up, so whichever worker answers the scrape reports the same totals.
+Counters of workers that have exited keep counting towards the totals;
+their in-flight gauge does not. gunicorn.conf.py clears the directory when
+the master starts.
+
+Exposed series: request counts by route, method and status; latency
+histograms by route and method; SQL time and statement counts by route;
+in-flight requests; cache lookups by cache and result, with the derived
+hit ratio.
+"""
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from functools import lru_cache
+
+from flask import Response, current_app, g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from utils import is_subrequest
+from workers import pid_alive
+
+# name: (type, help)
+METRICS = {
+    'http_requests_total': ('counter', 'Requests served, by route, method and status'),
+    'http_request_duration_seconds': ('histogram', 'Request latency, by route and method'),
+    'http_requests_in_flight': ('gauge', 'Requests being served right now'),
+    'db_query_seconds_total': ('counter', 'Time spent executing SQL, by route'),
+    'db_queries_total': ('counter', 'SQL statements executed, by route'),
+    'cache_requests_total': ('counter', 'Cache lookups, by cache and result (hit or miss)'),
+    'log_records_dropped_total': ('counter', 'Log records dropped because the log queue was full'),
+}
+
+# Summed over live workers only
+LIVE_GAUGES = ('http_requests_in_flight',)
+
+FILE_PREFIX = 'metrics_'
+FILE_SUFFIX = '.db'
+INITIAL_FILE_SIZE = 64 * 1024
+
+# File header: bytes in use (entries start after it)
+_HEADER = struct.Struct('<Q')
+_KEY_LENGTH = struct.Struct('<I')
+_VALUE = struct.Struct('<d')
+
+
+@lru_cache(maxsize=4096)
+def _key(name, labels):
+    return json.dumps([name, list(labels)])
+
+
+class MmapValues:
+    """float values by key for one process, in a file other processes read
+
+    Entries are appended as <key length><key, padded to 8 bytes><double> and
+    the header's used-bytes count is moved past an entry only once it is
+    complete, so a reader never sees half an entry.
+    """
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._file = open(path, 'a+b')
+        size = os.fstat(self._file.fileno()).st_size
+        if size < INITIAL_FILE_SIZE:
+            self._file.truncate(INITIAL_FILE_SIZE)
+            size = INITIAL_FILE_SIZE
+        self._map = mmap.mmap(self._file.fileno(), size)
+        self._used = _HEADER.unpack_from(self._map, 0)[0] or _HEADER.size
+        self._positions = {key: position for key, _, position in _entries(self._map, self._used)}
+
+    def add(self, key, amount):
+        with self._lock:
+            position = self._positions.get(key)
+            if position is None:
+                position = self._append(key)
+            _VALUE.pack_into(self._map, position, _VALUE.unpack_from(self._map, position)[0] + amount)
+
+    def _append(self, key):
+        encoded = key.encode('utf-8')
+        padded = _KEY_LENGTH.size + len(encoded)
+        padded += -padded % 8
+        needed = self._used + padded + _VALUE.size
+        if needed > len(self._map):
+            size = len(self._map)
+            while size < needed:
+                size *= 2
+            self._map.close()
+            self._file.truncate(size)
+            self._map = mmap.mmap(self._file.fileno(), size)
+        _KEY_LENGTH.pack_into(self._map, self._used, len(encoded))
+        self._map[self._used + _KEY_LENGTH.size:self._used + _KEY_LENGTH.size + len(encoded)] = encoded
+        position = self._used + padded
+        _VALUE.pack_into(self._map, position, 0.0)
+        self._used = position + _VALUE.size
+        _HEADER.pack_into(self._map, 0, self._used)
+        self._positions[key] = position
+        return position
+
+
+def _entries(data, used=None):
+    """(key, value, value position) of every complete entry"""
+    if used is None:
+        used = _HEADER.unpack_from(data, 0)[0]
+    position = _HEADER.size
+    while position < used:
+        length = _KEY_LENGTH.unpack_from(data, position)[0]
+        start = position + _KEY_LENGTH.size
+        key = bytes(data[start:start + length]).decode('utf-8')
+        position = start + length
+        position += -position % 8
+        yield key, _VALUE.unpack_from(data, position)[0], position
+        position += _VALUE.size
+
+
+_values = None
+_values_pid = None
+_values_lock = threading.Lock()
+_directory = None
+_buckets = ()
+_local = threading.local()
+_listening = False
+
+
+def _store():
+    """This process's values (a new file after fork), None when disabled"""
+    global _values, _values_pid
+    if _directory is None:
+        return None
+    pid = os.getpid()
+    if _values_pid != pid:
+        with _values_lock:
+            if _values_pid != pid:
+                os.makedirs(_directory, exist_ok=True)
+                _values = MmapValues(os.path.join(_directory, f'{FILE_PREFIX}{pid}{FILE_SUFFIX}'))
+                _values_pid = pid
+    return _values
+
+
+def inc(name, labels=(), amount=1.0):
+    """Add to a counter or gauge; labels as ((name, value), ...)"""
+    store = _store()
+    if store is not None:
+        store.add(_key(name, labels), amount)
+
+
+def observe(name, labels, value):
+    """Record one observation in a histogram"""
+    store = _store()
+    if store is None:
+        return
+    bound = next((bound for bound in _buckets if value <= bound), None)
+    le = '+Inf' if bound is None else repr(bound)
+    store.add(_key(name + '_bucket', labels + (('le', le),)), 1)
+    store.add(_key(name + '_sum', labels), value)
+
+
+def cache_result(cache, hit):
+    """Count one lookup in a named cache"""
+    inc('cache_requests_total', (('cache', cache), ('result', 'hit' if hit else 'miss')))
+
+
+def reset(directory):
+    """Delete every worker's file (on server start)"""
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return
+    for name in names:
+        if name.startswith(FILE_PREFIX) and name.endswith(FILE_SUFFIX):
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass  # still open in a running process (Windows)
+
+
+def collect(directory):
+    """{key: value} summed over the files of all workers"""
+    totals = {}
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return totals
+    for name in names:
+        if not (name.startswith(FILE_PREFIX) and name.endswith(FILE_SUFFIX)):
+            continue
+        try:
+            with open(os.path.join(directory, name), 'rb') as handle:
+                data = handle.read()
+        except FileNotFoundError:
+            continue
+        if len(data) < _HEADER.size:
+            continue
+        alive = pid_alive(int(name[len(FILE_PREFIX):-len(FILE_SUFFIX)]))
+        for key, value, _ in _entries(data):
+            if not alive and json.loads(key)[0] in LIVE_GAUGES:
+                continue
+            totals[key] = totals.get(key, 0.0) + value
+    return totals
+
+
+def _labels_text(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def _number(value):
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+def render(totals, buckets):
+    """Prometheus text exposition format (0.0.4) of collect() output"""
+    series = {}
+    for key, value in totals.items():
+        name, labels = json.loads(key)
+        series.setdefault(name, []).append((tuple(tuple(pair) for pair in labels), value))
+
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind != 'histogram':
+            for labels, value in sorted(series.get(name, [])):
+                lines.append(f'{name}{_labels_text(labels)} {_number(value)}')
+            continue
+        counts = {}
+        for labels, value in series.get(name + '_bucket', []):
+            le = dict(labels)['le']
+            counts.setdefault(tuple(pair for pair in labels if pair[0] != 'le'), {})[le] = value
+        sums = dict(series.get(name + '_sum', []))
+        for labels in sorted(counts):
+            cumulative = 0
+            for le in [repr(bound) for bound in buckets] + ['+Inf']:
+                cumulative += counts[labels].get(le, 0)
+                lines.append(f'{name}_bucket{_labels_text(labels + (("le", le),))} {_number(cumulative)}')
+            lines.append(f'{name}_sum{_labels_text(labels)} {_number(sums.get(labels, 0.0))}')
+            lines.append(f'{name}_count{_labels_text(labels)} {_number(cumulative)}')
+
+    lookups = {}
+    for labels, value in series.get('cache_requests_total', []):
+        labels = dict(labels)
+        hits, total = lookups.get(labels['cache'], (0, 0))
+        lookups[labels['cache']] = (hits + (value if labels['result'] == 'hit' else 0), total + value)
+    lines.append('# HELP cache_hit_ratio Share of cache lookups that were hits')
+    lines.append('# TYPE cache_hit_ratio gauge')
+    for cache, (hits, total) in sorted(lookups.items()):
+        lines.append(f'cache_hit_ratio{_labels_text((("cache", cache),))} {_number(round(hits / total, 6) if total else 0)}')
+    return '\n'.join(lines) + '\n'
+
+
+def _route():
+    return request.endpoint or 'unmatched'
+
+
+def init_app(app):
+    """Record request metrics and serve GET /metrics (when METRICS_ENABLED)"""
+    global _directory, _buckets, _listening
+    if not app.config.get('METRICS_ENABLED', True):
+        return
+    _directory = app.config['METRICS_DIR']
+    _buckets = tuple(app.config['METRICS_LATENCY_BUCKETS'])
+
+    # Engine-wide listeners, installed once however many apps are created
+    if not _listening:
+        _listening = True
+
+        @event.listens_for(Engine, 'before_cursor_execute')
+        def _before_sql(conn, cursor, statement, parameters, context, executemany):
+            if getattr(_local, 'db_seconds', None) is not None:
+                _local.sql_started = time.perf_counter()
+
+        @event.listens_for(Engine, 'after_cursor_execute')
+        def _after_sql(conn, cursor, statement, parameters, context, executemany):
+            started = getattr(_local, 'sql_started', None)
+            if started is not None and _local.db_seconds is not None:
+                _local.db_seconds += time.perf_counter() - started
+                _local.db_queries += 1
+                _local.sql_started = None
+
+    @app.before_request
+    def _start_timer():
+        if is_subrequest():
+            return None
+        g._metrics_started = time.perf_counter()
+        _local.db_seconds = 0.0
+        _local.db_queries = 0
+        inc('http_requests_in_flight')
+        return None
+
+    @app.after_request
+    def _record(response):
+        started = g.get('_metrics_started')
+        if started is None or is_subrequest():
+            return response
+        route = (('route', _route()), ('method', request.method))
+        inc('http_requests_total', route + (('status', str(response.status_code)),))
+        observe('http_request_duration_seconds', route, time.perf_counter() - started)
+        if _local.db_queries:
+            inc('db_query_seconds_total', route[:1], _local.db_seconds)
+            inc('db_queries_total', route[:1], _local.db_queries)
+        return response
+
+    @app.teardown_request
+    def _finish(error=None):
+        if is_subrequest() or g.pop('_metrics_started', None) is None:
+            return
+        _local.db_seconds = None
+        inc('http_requests_in_flight', amount=-1)
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        token = current_app.config.get('METRICS_TOKEN')
+        if token and request.headers.get('Authorization') != f'Bearer {token}':
+            return Response('Unauthorized\n', status=401, mimetype='text/plain')
+        body = render(collect(_directory), _buckets)
+        return Response(body, mimetype='text/plain; version=0.0.4')
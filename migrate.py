@@ -0,0 +1,50 @@
+"""
+Explicit schema migration step for StudentTracker
+Run once per deployment (startup.sh) instead of in every worker boot
+"""
+import os
+import sys
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+# The app must not create tables itself, or a new database would look like
+# an old one that needs migrating
+os.environ['AUTO_CREATE_SCHEMA'] = 'False'
+
+def migrate(config_name=None):
+    """Apply pending migrations, then create any missing tables"""
+    from app import create_app
+    from models import db
+    from migrations import create_schema, is_fresh, load_migrations, metadata, schema_migrations
+
+    app = create_app(config_name or os.getenv('FLASK_ENV', 'production'))
+
+    with app.app_context():
+        engine = db.engine
+        if not is_fresh(engine):
+            metadata.create_all(engine)
+            with engine.connect() as connection:
+                applied = {row.version for row in connection.execute(schema_migrations.select())}
+
+            for migration in load_migrations():
+                if migration.VERSION in applied:
+                    continue
+                with engine.begin() as connection:
+                    print(f"Applying migration {migration.__name__}")
+                    migration.upgrade(connection)
+                    connection.execute(schema_migrations.insert().values(
+                        version=migration.VERSION, applied_at=datetime.utcnow()
+                    ))
+
+        # A fresh database is built from the models and stamped
+        create_schema()
+        print("Database schema is up to date")
+
+    return True
+
+
+if __name__ == '__main__':
+    config_name = sys.argv[1] if len(sys.argv) > 1 else None
+    sys.exit(0 if migrate(config_name) else 1)
@@ -0,0 +1,60 @@
+"""
+Versioned schema migrations, applied in order by migrate.py
+
+Each module defines VERSION and upgrade(connection). Migrations only run
+against databases created before they were written; a fresh database is
+built from the current models and every migration is marked as applied.
+Both migrate.py and the app's AUTO_CREATE_SCHEMA build databases through
+create_schema(), so one the app created is never mistaken for an old one.
+"""
+import importlib
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, MetaData, String, Table, inspect
+
+metadata = MetaData()
+
+schema_migrations = Table(
+    'schema_migrations', metadata,
+    Column('version', String(20), primary_key=True),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+MIGRATIONS = [
+    'm0001_binary_uuid_keys',
+    'm0002_attendance_status_codes',
+    'm0003_users_fulltext_index',
+    'm0004_sync_watermarks',
+    'm0005_gapless_waitlists',
+]
+
+
+def load_migrations():
+    """Import migration modules in application order"""
+    return [importlib.import_module(f'migrations.{name}') for name in MIGRATIONS]
+
+
+def is_fresh(engine):
+    """True for a database without the application's tables"""
+    return not inspect(engine).has_table('users')
+
+
+def create_schema():
+    """Create missing tables (in an app context); a fresh database is
+    stamped with every migration"""
+    from models import db
+    import sharding
+
+    engine = db.engine
+    fresh = is_fresh(engine)
+    metadata.create_all(engine)
+    db.create_all()
+    sharding.create_schema()
+    if fresh:
+        with engine.begin() as connection:
+            applied = {row.version for row in connection.execute(schema_migrations.select())}
+            now = datetime.utcnow()
+            for migration in load_migrations():
+                if migration.VERSION not in applied:
+                    connection.execute(schema_migrations.insert().values(version=migration.VERSION, applied_at=now))
+    return fresh
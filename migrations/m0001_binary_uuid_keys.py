@@ -0,0 +1,61 @@
+"""
+Convert VARCHAR(36) UUID keys to 16 byte binary (see db_types.BinaryUUID)
+
+Existing ids keep their value; only rows created afterwards get time-ordered
+UUIDv7 keys. On MySQL the DDL is not transactional - take a backup first.
+"""
+import uuid
+
+from sqlalchemy import text
+
+VERSION = '0001'
+
+KEY_COLUMNS = {
+    'users': ['id'],
+    'students': ['id', 'user_id'],
+    'teachers': ['id', 'user_id'],
+    'courses': ['id', 'teacher_id'],
+    'enrollments': ['id', 'student_id', 'course_id'],
+    'attendance': ['id', 'student_id', 'course_id', 'teacher_id'],
+}
+
+
+def upgrade(connection):
+    if connection.dialect.name == 'mysql':
+        _upgrade_mysql(connection)
+    else:
+        _upgrade_generic(connection)
+
+
+def _upgrade_mysql(connection):
+    """Rewrite key columns in place with UNHEX, one table rebuild per step"""
+    connection.exec_driver_sql('SET FOREIGN_KEY_CHECKS = 0')
+    try:
+        for table, columns in KEY_COLUMNS.items():
+            connection.exec_driver_sql(
+                f"ALTER TABLE {table} "
+                + ', '.join(f"MODIFY {column} VARBINARY(36) NOT NULL" for column in columns)
+            )
+            connection.exec_driver_sql(
+                f"UPDATE {table} SET "
+                + ', '.join(f"{column} = UNHEX(REPLACE({column}, '-', ''))" for column in columns)
+            )
+            connection.exec_driver_sql(
+                f"ALTER TABLE {table} "
+                + ', '.join(f"MODIFY {column} BINARY(16) NOT NULL" for column in columns)
+            )
+    finally:
+        connection.exec_driver_sql('SET FOREIGN_KEY_CHECKS = 1')
+
+
+def _upgrade_generic(connection):
+    """Row-by-row rewrite for databases with dynamic column types (SQLite)"""
+    for table, columns in KEY_COLUMNS.items():
+        rows = connection.execute(text(f"SELECT {', '.join(columns)} FROM {table}")).fetchall()
+        for row in rows:
+            if not isinstance(row[0], str):
+                continue  # already converted
+            values = {column: uuid.UUID(value).bytes for column, value in zip(columns, row)}
+            values['old_id'] = row[0]
+            assignments = ', '.join(f"{column} = :{column}" for column in columns)
+            connection.execute(text(f"UPDATE {table} SET {assignments} WHERE id = :old_id"), values)
@@ -0,0 +1,37 @@
+"""
+Store Attendance.status as a one byte code and move remarks to a side table
+
+Only non-empty remarks are copied to attendance_remarks; the TEXT column is
+then dropped from attendance. Codes match models.ATTENDANCE_STATUS_CODES.
+"""
+from sqlalchemy import text
+
+VERSION = '0002'
+
+STATUS_CASE = (
+    "CASE status WHEN 'present' THEN 1 WHEN 'absent' THEN 2 WHEN 'late' THEN 3 END"
+)
+
+
+def upgrade(connection):
+    from models import AttendanceRemark
+
+    AttendanceRemark.__table__.create(connection, checkfirst=True)
+    connection.execute(text(
+        "INSERT INTO attendance_remarks (attendance_id, remarks) "
+        "SELECT id, remarks FROM attendance WHERE remarks IS NOT NULL AND remarks <> ''"
+    ))
+
+    if connection.dialect.name == 'mysql':
+        connection.exec_driver_sql(
+            "ALTER TABLE attendance ADD COLUMN status_code TINYINT UNSIGNED NOT NULL DEFAULT 1"
+        )
+        connection.exec_driver_sql(f"UPDATE attendance SET status_code = {STATUS_CASE}")
+        connection.exec_driver_sql(
+            "ALTER TABLE attendance DROP COLUMN status, DROP COLUMN remarks, "
+            "CHANGE status_code status TINYINT UNSIGNED NOT NULL"
+        )
+    else:
+        # SQLite keeps the declared type but stores whatever value it is given
+        connection.execute(text(f"UPDATE attendance SET status = {STATUS_CASE}"))
+        connection.execute(text("ALTER TABLE attendance DROP COLUMN remarks"))
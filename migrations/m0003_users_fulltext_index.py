@@ -0,0 +1,12 @@
+"""
+FULLTEXT index on user names and email for the people search fallback
+(MySQL only; other databases fall back to LIKE prefix queries)
+"""
+VERSION = '0003'
+
+
+def upgrade(connection):
+    if connection.dialect.name == 'mysql':
+        connection.exec_driver_sql(
+            "CREATE FULLTEXT INDEX ix_users_fulltext_name ON users (first_name, last_name, email)"
+        )
@@ -0,0 +1,31 @@
+"""
+Indexes for ?since= delta sync, and Enrollment.updated_at
+
+Existing enrollments take their created_at as updated_at. The
+deleted_records tombstone table is new and is created by migrate.py.
+"""
+from sqlalchemy import text
+
+VERSION = '0004'
+
+INDEXES = [
+    "CREATE INDEX ix_courses_updated_at ON courses (updated_at)",
+    "CREATE INDEX ix_students_updated_at ON students (updated_at)",
+    "CREATE INDEX ix_enrollments_course_updated ON enrollments (course_id, updated_at)",
+    "CREATE INDEX ix_attendance_course_updated ON attendance (course_id, updated_at)",
+]
+
+
+def upgrade(connection):
+    if connection.dialect.name == 'mysql':
+        connection.exec_driver_sql("ALTER TABLE enrollments ADD COLUMN updated_at DATETIME NULL")
+        connection.exec_driver_sql("UPDATE enrollments SET updated_at = created_at")
+        connection.exec_driver_sql("ALTER TABLE enrollments MODIFY updated_at DATETIME NOT NULL")
+    else:
+        # SQLite cannot add a NOT NULL column without a default; the ORM
+        # always sets it
+        connection.execute(text("ALTER TABLE enrollments ADD COLUMN updated_at DATETIME"))
+        connection.execute(text("UPDATE enrollments SET updated_at = created_at"))
+
+    for statement in INDEXES:
+        connection.execute(text(statement))
@@ -0,0 +1,31 @@
+"""
+Gapless waitlist sequence numbers
+
+waitlist.position() now reads a student's place as their sequence minus
+the head's, which needs each course's sequence numbers to be consecutive.
+Queues left with gaps by students who left them are renumbered, keeping
+their order. Run while the app is stopped.
+"""
+from sqlalchemy import text
+
+VERSION = '0005'
+
+
+def upgrade(connection):
+    rows = connection.execute(text(
+        "SELECT id, course_id, sequence FROM waitlist_entries ORDER BY course_id, sequence"
+    )).all()
+
+    moves, course_id, expected = [], None, None
+    for row in rows:
+        if row.course_id != course_id:
+            course_id, expected = row.course_id, row.sequence
+        if row.sequence != expected:
+            moves.append({'id': row.id, 'sequence': -expected})
+        expected += 1
+    if not moves:
+        return
+
+    # Through negative numbers, so no row ever takes a number still in use
+    connection.execute(text("UPDATE waitlist_entries SET sequence = :sequence WHERE id = :id"), moves)
+    connection.execute(text("UPDATE waitlist_entries SET sequence = -sequence WHERE sequence < 0"))
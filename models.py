@@ -4,10 +4,41 @@ Database models for StudentTracker application
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
 from enum import Enum
-import uuid
+from db_types import BinaryUUID, CodedString, uuid7
 
 db = SQLAlchemy()
 
+# Stored codes for Attendance.status; never renumber existing entries
+ATTENDANCE_STATUS_CODES = (
+    ('present', 1),
+    ('absent', 2),
+    ('late', 3),
+)
+
+class DictField:
+    """One to_dict() field: how it is read, and the columns and relationship
+    paths it needs loaded (see fieldsets.py)"""
+    __slots__ = ('get', 'columns', 'relations')
+    
+    def __init__(self, get, columns=(), relations=()):
+        self.get = get
+        self.columns = columns
+        self.relations = relations
+
+def column_field(name):
+    return DictField(lambda obj: getattr(obj, name), columns=(name,))
+
+def isoformat_field(name):
+    return DictField(lambda obj: getattr(obj, name).isoformat(), columns=(name,))
+
+def fields_to_dict(obj, fields=None):
+    """obj.DICT_FIELDS rendered for `fields` (all of them when None)"""
+    return {
+        name: field.get(obj)
+        for name, field in obj.DICT_FIELDS.items()
+        if fields is None or name in fields
+    }
+
 class UserRole(Enum):
     """User roles in the system"""
     ADMIN = 'admin'
@@ -18,7 +49,7 @@ class User(db.Model):
     """User model for authentication"""
     __tablename__ = 'users'
     
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    id = db.Column(BinaryUUID, primary_key=True, default=lambda: str(uuid7()))
     email = db.Column(db.String(120), unique=True, nullable=False, index=True)
     password_hash = db.Column(db.String(255), nullable=False)
     first_name = db.Column(db.String(100), nullable=False)
@@ -32,6 +63,12 @@ class User(db.Model):
     teacher = db.relationship('Teacher', uselist=False, backref='user', cascade='all, delete-orphan')
     student = db.relationship('Student', uselist=False, backref='user', cascade='all, delete-orphan')
     
+    # Used by the people search fallback while the in-memory index is cold
+    __table_args__ = (
+        db.Index('ix_users_fulltext_name', 'first_name', 'last_name', 'email',
+                 mysql_prefix='FULLTEXT').ddl_if(dialect='mysql'),
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -47,41 +84,43 @@ class Student(db.Model):
     """Student model"""
     __tablename__ = 'students'
     
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False, index=True)
+    id = db.Column(BinaryUUID, primary_key=True, default=lambda: str(uuid7()))
+    user_id = db.Column(BinaryUUID, db.ForeignKey('users.id'), nullable=False, index=True)
     roll_number = db.Column(db.String(50), unique=True, nullable=False, index=True)
     phone = db.Column(db.String(20))
     address = db.Column(db.Text)
     enrollment_date = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     is_active = db.Column(db.Boolean, default=True, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False, index=True)
     
     # Relationships
     enrollments = db.relationship('Enrollment', backref='student', cascade='all, delete-orphan')
     attendance_records = db.relationship('Attendance', backref='student', cascade='all, delete-orphan')
     
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'user_id': self.user_id,
-            'roll_number': self.roll_number,
-            'first_name': self.user.first_name,
-            'last_name': self.user.last_name,
-            'email': self.user.email,
-            'phone': self.phone,
-            'address': self.address,
-            'enrollment_date': self.enrollment_date.isoformat(),
-            'is_active': self.is_active,
-            'created_at': self.created_at.isoformat(),
-        }
+    DICT_FIELDS = {
+        'id': column_field('id'),
+        'user_id': column_field('user_id'),
+        'roll_number': column_field('roll_number'),
+        'first_name': DictField(lambda s: s.user.first_name, relations=('user',)),
+        'last_name': DictField(lambda s: s.user.last_name, relations=('user',)),
+        'email': DictField(lambda s: s.user.email, relations=('user',)),
+        'phone': column_field('phone'),
+        'address': column_field('address'),
+        'enrollment_date': isoformat_field('enrollment_date'),
+        'is_active': column_field('is_active'),
+        'created_at': isoformat_field('created_at'),
+    }
+    
+    def to_dict(self, fields=None):
+        return fields_to_dict(self, fields)
 
 class Teacher(db.Model):
     """Teacher model"""
     __tablename__ = 'teachers'
     
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    user_id = db.Column(db.String(36), db.ForeignKey('users.id'), nullable=False, index=True)
+    id = db.Column(BinaryUUID, primary_key=True, default=lambda: str(uuid7()))
+    user_id = db.Column(BinaryUUID, db.ForeignKey('users.id'), nullable=False, index=True)
     employee_id = db.Column(db.String(50), unique=True, nullable=False, index=True)
     specialization = db.Column(db.String(100))
     phone = db.Column(db.String(20))
@@ -95,70 +134,80 @@ class Teacher(db.Model):
     courses = db.relationship('Course', backref='teacher', cascade='all, delete-orphan')
     attendance_records = db.relationship('Attendance', backref='teacher', cascade='all, delete-orphan')
     
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'user_id': self.user_id,
-            'employee_id': self.employee_id,
-            'first_name': self.user.first_name,
-            'last_name': self.user.last_name,
-            'email': self.user.email,
-            'specialization': self.specialization,
-            'phone': self.phone,
-            'office_number': self.office_number,
-            'joining_date': self.joining_date.isoformat(),
-            'is_active': self.is_active,
-            'created_at': self.created_at.isoformat(),
-        }
+    DICT_FIELDS = {
+        'id': column_field('id'),
+        'user_id': column_field('user_id'),
+        'employee_id': column_field('employee_id'),
+        'first_name': DictField(lambda t: t.user.first_name, relations=('user',)),
+        'last_name': DictField(lambda t: t.user.last_name, relations=('user',)),
+        'email': DictField(lambda t: t.user.email, relations=('user',)),
+        'specialization': column_field('specialization'),
+        'phone': column_field('phone'),
+        'office_number': column_field('office_number'),
+        'joining_date': isoformat_field('joining_date'),
+        'is_active': column_field('is_active'),
+        'created_at': isoformat_field('created_at'),
+    }
+    
+    def to_dict(self, fields=None):
+        return fields_to_dict(self, fields)
 
 class Course(db.Model):
     """Course model"""
     __tablename__ = 'courses'
     
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    id = db.Column(BinaryUUID, primary_key=True, default=lambda: str(uuid7()))
     course_code = db.Column(db.String(50), unique=True, nullable=False, index=True)
     course_name = db.Column(db.String(150), nullable=False)
     description = db.Column(db.Text)
-    teacher_id = db.Column(db.String(36), db.ForeignKey('teachers.id'), nullable=False, index=True)
+    teacher_id = db.Column(BinaryUUID, db.ForeignKey('teachers.id'), nullable=False, index=True)
     credits = db.Column(db.Integer, default=3)
     semester = db.Column(db.String(50))
     max_students = db.Column(db.Integer, default=50)
     is_active = db.Column(db.Boolean, default=True, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False, index=True)
     
     # Relationships
     enrollments = db.relationship('Enrollment', backref='course', cascade='all, delete-orphan')
     attendance_records = db.relationship('Attendance', backref='course', cascade='all, delete-orphan')
     
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'course_code': self.course_code,
-            'course_name': self.course_name,
-            'description': self.description,
-            'teacher_id': self.teacher_id,
-            'teacher_name': f"{self.teacher.user.first_name} {self.teacher.user.last_name}",
-            'credits': self.credits,
-            'semester': self.semester,
-            'max_students': self.max_students,
-            'enrolled_students': len(self.enrollments),
-            'is_active': self.is_active,
-            'created_at': self.created_at.isoformat(),
-        }
+    DICT_FIELDS = {
+        'id': column_field('id'),
+        'course_code': column_field('course_code'),
+        'course_name': column_field('course_name'),
+        'description': column_field('description'),
+        'teacher_id': column_field('teacher_id'),
+        'teacher_name': DictField(
+            lambda c: f"{c.teacher.user.first_name} {c.teacher.user.last_name}", relations=('teacher.user',)
+        ),
+        'credits': column_field('credits'),
+        'semester': column_field('semester'),
+        'max_students': column_field('max_students'),
+        'enrolled_students': DictField(lambda c: len(c.enrollments), relations=('enrollments',)),
+        'is_active': column_field('is_active'),
+        'created_at': isoformat_field('created_at'),
+    }
+    
+    def to_dict(self, fields=None):
+        return fields_to_dict(self, fields)
 
 class Enrollment(db.Model):
     """Student enrollment in courses"""
     __tablename__ = 'enrollments'
     
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    student_id = db.Column(db.String(36), db.ForeignKey('students.id'), nullable=False, index=True)
-    course_id = db.Column(db.String(36), db.ForeignKey('courses.id'), nullable=False, index=True)
+    id = db.Column(BinaryUUID, primary_key=True, default=lambda: str(uuid7()))
+    student_id = db.Column(BinaryUUID, db.ForeignKey('students.id'), nullable=False, index=True)
+    course_id = db.Column(BinaryUUID, db.ForeignKey('courses.id'), nullable=False, index=True)
     enrollment_date = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     is_active = db.Column(db.Boolean, default=True, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
     
-    __table_args__ = (db.UniqueConstraint('student_id', 'course_id', name='unique_student_course'),)
+    __table_args__ = (
+        db.UniqueConstraint('student_id', 'course_id', name='unique_student_course'),
+        db.Index('ix_enrollments_course_updated', 'course_id', 'updated_at'),
+    )
     
     def to_dict(self):
         return {
@@ -170,31 +219,119 @@ class Enrollment(db.Model):
             'is_active': self.is_active,
         }
 
+class WaitlistEntry(db.Model):
+    """A student waiting for a seat in a full course (see waitlist.py)"""
+    __tablename__ = 'waitlist_entries'
+    
+    id = db.Column(BinaryUUID, primary_key=True, default=lambda: str(uuid7()))
+    course_id = db.Column(BinaryUUID, db.ForeignKey('courses.id'), nullable=False)
+    student_id = db.Column(BinaryUUID, db.ForeignKey('students.id'), nullable=False, index=True)
+    sequence = db.Column(db.BigInteger, nullable=False)  # per course, lowest is promoted first
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    student = db.relationship('Student')
+    
+    __table_args__ = (
+        db.UniqueConstraint('course_id', 'student_id', name='unique_waitlist_student'),
+        # Also the index the queue is read in order from, and its head found by
+        db.UniqueConstraint('course_id', 'sequence', name='unique_waitlist_sequence'),
+    )
+    
+    def to_dict(self):
+        return {
+            'course_id': self.course_id,
+            'student_id': self.student_id,
+            'joined_at': self.created_at.isoformat(),
+        }
+
 class Attendance(db.Model):
     """Attendance tracking model"""
     __tablename__ = 'attendance'
     
-    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    student_id = db.Column(db.String(36), db.ForeignKey('students.id'), nullable=False, index=True)
-    course_id = db.Column(db.String(36), db.ForeignKey('courses.id'), nullable=False, index=True)
-    teacher_id = db.Column(db.String(36), db.ForeignKey('teachers.id'), nullable=False, index=True)
+    id = db.Column(BinaryUUID, primary_key=True, default=lambda: str(uuid7()))
+    student_id = db.Column(BinaryUUID, db.ForeignKey('students.id'), nullable=False, index=True)
+    course_id = db.Column(BinaryUUID, db.ForeignKey('courses.id'), nullable=False, index=True)
+    teacher_id = db.Column(BinaryUUID, db.ForeignKey('teachers.id'), nullable=False, index=True)
     attendance_date = db.Column(db.Date, nullable=False, index=True)
-    status = db.Column(db.String(20), default='present', nullable=False)  # present, absent, late
-    remarks = db.Column(db.Text)
+    status = db.Column(CodedString(ATTENDANCE_STATUS_CODES), default='present', nullable=False)  # present, absent, late
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
     
-    __table_args__ = (db.UniqueConstraint('student_id', 'course_id', 'attendance_date', name='unique_attendance'),)
+    # Remarks are rare, so they live in a side table instead of widening every row
+    remark = db.relationship('AttendanceRemark', uselist=False, cascade='all, delete-orphan')
     
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'student_id': self.student_id,
-            'student_name': f"{self.student.user.first_name} {self.student.user.last_name}",
-            'course_id': self.course_id,
-            'course_name': self.course.course_name,
-            'teacher_id': self.teacher_id,
-            'attendance_date': self.attendance_date.isoformat(),
-            'status': self.status,
-            'remarks': self.remarks,
-        }
+    __table_args__ = (
+        db.UniqueConstraint('student_id', 'course_id', 'attendance_date', name='unique_attendance'),
+        db.Index('ix_attendance_course_updated', 'course_id', 'updated_at'),
+    )
+    
+    @property
+    def remarks(self):
+        return self.remark.remarks if self.remark else None
+    
+    @remarks.setter
+    def remarks(self, value):
+        if not value:
+            self.remark = None
+        elif self.remark:
+            self.remark.remarks = value
+        else:
+            self.remark = AttendanceRemark(remarks=value)
+    
+    DICT_FIELDS = {
+        'id': column_field('id'),
+        'student_id': column_field('student_id'),
+        'student_name': DictField(
+            lambda a: f"{a.student.user.first_name} {a.student.user.last_name}", relations=('student.user',)
+        ),
+        'course_id': column_field('course_id'),
+        'course_name': DictField(lambda a: a.course.course_name, relations=('course',)),
+        'teacher_id': column_field('teacher_id'),
+        'attendance_date': isoformat_field('attendance_date'),
+        'status': column_field('status'),
+        'remarks': DictField(lambda a: a.remarks, relations=('remark',)),
+    }
+    
+    def to_dict(self, fields=None):
+        return fields_to_dict(self, fields)
+
+class RevokedToken(db.Model):
+    """JWT revoked before it expired (logout); checked via revocation.py"""
+    __tablename__ = 'revoked_tokens'
+    
+    jti = db.Column(BinaryUUID, primary_key=True)
+    token_type = db.Column(db.String(10), nullable=False)
+    user_id = db.Column(BinaryUUID, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    revoked_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+class IdempotencyRecord(db.Model):
+    """Stored response for an Idempotency-Key; status_code is NULL while in progress"""
+    __tablename__ = 'idempotency_records'
+    
+    key_hash = db.Column(db.String(64), primary_key=True)  # sha256 of user, method, path and key
+    request_hash = db.Column(db.String(64), nullable=False)
+    status_code = db.Column(db.Integer)
+    response_body = db.Column(db.Text)
+    content_type = db.Column(db.String(100))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+class AttendanceRemark(db.Model):
+    """Free-text remark for an attendance record, only stored when non-empty"""
+    __tablename__ = 'attendance_remarks'
+    
+    attendance_id = db.Column(BinaryUUID, db.ForeignKey('attendance.id', ondelete='CASCADE'), primary_key=True)
+    remarks = db.Column(db.Text, nullable=False)
+
+class DeletedRecord(db.Model):
+    """Tombstone for a hard-deleted row, served to ?since= delta syncs"""
+    __tablename__ = 'deleted_records'
+    
+    id = db.Column(BinaryUUID, primary_key=True, default=lambda: str(uuid7()))
+    entity = db.Column(db.String(30), nullable=False)  # e.g. 'attendance'
+    entity_id = db.Column(BinaryUUID, nullable=False)
+    scope_id = db.Column(BinaryUUID)  # e.g. the course of a deleted attendance row
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    
+    __table_args__ = (db.Index('ix_deleted_records_scope', 'entity', 'scope_id', 'deleted_at'),)
@@ -0,0 +1,279 @@
+"""
+On-demand request profiling
+
+Off unless PROFILING_ENABLED is set; then nothing is installed and requests
+pay nothing. When enabled, a request is profiled if an admin sends the
+X-Profile: 1 header, or at random with probability PROFILE_SAMPLE_RATE.
+
+A profiled request's thread is sampled every PROFILE_INTERVAL_MS by one
+background thread per worker (sys._current_frames), so the request itself
+runs unmodified. SQL statements run on that thread are timed through
+SQLAlchemy cursor events, and samples taken while a statement is executing
+get it as their innermost frame, so database time shows up in the flame
+graph next to the Python code waiting on it. Queries run on other threads
+(sharded fan-out reads) are not attributed.
+
+Each profile is written to PROFILE_DIR as <id>.folded (collapsed stacks,
+the input of flamegraph.pl and speedscope) plus <id>.json (request, timing
+and per-statement SQL totals). Only the newest PROFILE_MAX_FILES are kept.
+The response carries the profile id in X-Profile-Id.
+"""
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import current_app, g, request
+from flask_jwt_extended import get_jwt, verify_jwt_in_request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from utils import is_subrequest
+
+PROFILE_HEADER = 'X-Profile'
+
+PROFILE_ID = re.compile(r'^\d{13}-\d+-\d+$')
+
+# Longest SQL text kept per statement (frames and totals)
+SQL_TEXT_LENGTH = 160
+
+
+def _sql_label(statement):
+    return ' '.join(statement.split())[:SQL_TEXT_LENGTH].replace(';', ',')
+
+
+class RequestProfile:
+    """Samples and SQL timings of one request"""
+
+    def __init__(self, thread_id):
+        self.thread_id = thread_id
+        self.started = time.perf_counter()
+        self.stacks = Counter()
+        self.sql = {}
+        self.current_sql = None
+        self._sql_started = None
+
+    def sample(self, frame, labels):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            label = labels.get(code)
+            if label is None:
+                label = labels[code] = (
+                    f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(';', ',')
+                )
+            stack.append(label)
+            frame = frame.f_back
+        stack.reverse()
+        current_sql = self.current_sql
+        if current_sql:
+            stack.append(f'SQL {current_sql}')
+        self.stacks[';'.join(stack)] += 1
+
+    def begin_sql(self, statement):
+        self.current_sql = _sql_label(statement)
+        self._sql_started = time.perf_counter()
+
+    def end_sql(self):
+        if self.current_sql is None:
+            return
+        totals = self.sql.setdefault(self.current_sql, [0, 0.0])
+        totals[0] += 1
+        totals[1] += time.perf_counter() - self._sql_started
+        self.current_sql = None
+
+
+class Sampler:
+    """One thread per worker sampling the stacks of profiled requests"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active = {}
+        self._labels = {}
+        self._thread = None
+        self.interval = 0.005
+
+    def profile_for(self, thread_id):
+        return self._active.get(thread_id)
+
+    def start(self, interval):
+        profile = RequestProfile(threading.get_ident())
+        with self._lock:
+            self.interval = interval
+            self._active[profile.thread_id] = profile
+            # Started lazily, so each forked worker gets its own
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+                self._thread.start()
+        return profile
+
+    def stop(self, profile):
+        with self._lock:
+            self._active.pop(profile.thread_id, None)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            profiles = list(self._active.values())
+            if not profiles:
+                continue
+            frames = sys._current_frames()
+            for profile in profiles:
+                frame = frames.get(profile.thread_id)
+                if frame is not None:
+                    profile.sample(frame, self._labels)
+
+
+sampler = Sampler()
+
+_sequence = 0
+_sequence_lock = threading.Lock()
+_listening = False
+
+
+def _next_id():
+    global _sequence
+    with _sequence_lock:
+        _sequence += 1
+        return f'{int(time.time() * 1000):013d}-{os.getpid()}-{_sequence}'
+
+
+def _write_atomic(path, text):
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w', encoding='utf-8') as handle:
+        handle.write(text)
+    os.replace(temporary, path)
+
+
+def save(profile, metadata, directory, keep):
+    """Write a finished profile and drop the oldest beyond `keep`"""
+    os.makedirs(directory, exist_ok=True)
+    profile_id = _next_id()
+    folded = ''.join(f'{stack} {count}\n' for stack, count in profile.stacks.items())
+    _write_atomic(os.path.join(directory, f'{profile_id}.folded'), folded)
+    metadata = dict(metadata, id=profile_id, samples=sum(profile.stacks.values()), sql=[
+        {'statement': statement, 'count': count, 'total_ms': round(seconds * 1000, 3)}
+        for statement, (count, seconds) in sorted(profile.sql.items(), key=lambda item: -item[1][1])
+    ])
+    metadata['sql_ms'] = round(sum(entry['total_ms'] for entry in metadata['sql']), 3)
+    _write_atomic(os.path.join(directory, f'{profile_id}.json'), json.dumps(metadata))
+
+    for old_id in list_ids(directory)[keep:]:
+        for suffix in ('.json', '.folded'):
+            try:
+                os.remove(os.path.join(directory, old_id + suffix))
+            except FileNotFoundError:
+                pass  # another worker trimmed it first
+    return profile_id
+
+
+def list_ids(directory):
+    """Stored profile ids, newest first"""
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return sorted((name[:-5] for name in names if name.endswith('.json')), reverse=True)
+
+
+def _path(directory, profile_id, suffix):
+    if not PROFILE_ID.match(profile_id or ''):
+        return None
+    path = os.path.join(directory, profile_id + suffix)
+    return path if os.path.exists(path) else None
+
+
+def load_metadata(directory, profile_id):
+    """A stored profile's metadata, or None"""
+    path = _path(directory, profile_id, '.json')
+    if path is None:
+        return None
+    try:
+        with open(path, encoding='utf-8') as handle:
+            return json.load(handle)
+    except FileNotFoundError:
+        return None
+
+
+def folded_path(directory, profile_id):
+    """Path of a stored profile's collapsed stacks, or None"""
+    return _path(directory, profile_id, '.folded')
+
+
+def _admin_asked():
+    if request.headers.get(PROFILE_HEADER) != '1':
+        return False
+    try:
+        verify_jwt_in_request(optional=True)
+        return get_jwt().get('role') == 'admin'
+    except Exception:
+        return False  # the view's own jwt_required reports the error
+
+
+def init_app(app):
+    """Install the profiling hooks (only when PROFILING_ENABLED)"""
+    global _listening
+    if not app.config.get('PROFILING_ENABLED'):
+        return
+
+    # Engine-wide listeners, installed once however many apps are created
+    if not _listening:
+        _listening = True
+
+        @event.listens_for(Engine, 'before_cursor_execute')
+        def _before_sql(conn, cursor, statement, parameters, context, executemany):
+            profile = sampler.profile_for(threading.get_ident())
+            if profile is not None:
+                profile.begin_sql(statement)
+
+        @event.listens_for(Engine, 'after_cursor_execute')
+        def _after_sql(conn, cursor, statement, parameters, context, executemany):
+            profile = sampler.profile_for(threading.get_ident())
+            if profile is not None:
+                profile.end_sql()
+
+    @app.before_request
+    def _start_profile():
+        if is_subrequest() or not request.path.startswith('/api/'):
+            return None
+        config = current_app.config
+        sampled = random.random() < config['PROFILE_SAMPLE_RATE']
+        if sampled or _admin_asked():
+            g._profile = sampler.start(config['PROFILE_INTERVAL_MS'] / 1000)
+            g._profile_reason = 'sampled' if sampled else 'header'
+        return None
+
+    @app.after_request
+    def _finish_profile(response):
+        if is_subrequest():
+            return response
+        profile = g.pop('_profile', None)
+        if profile is None:
+            return response
+        sampler.stop(profile)
+        config = current_app.config
+        profile_id = save(profile, {
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            'reason': g.pop('_profile_reason', None),
+            'duration_ms': round((time.perf_counter() - profile.started) * 1000, 3),
+            'interval_ms': config['PROFILE_INTERVAL_MS'],
+            'recorded_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        }, config['PROFILE_DIR'], config['PROFILE_MAX_FILES'])
+        response.headers['X-Profile-Id'] = profile_id
+        return response
+
+    @app.teardown_request
+    def _abandon_profile(error=None):
+        # Only left over when the response was never finished
+        if is_subrequest():
+            return
+        profile = g.pop('_profile', None)
+        if profile is not None:
+            sampler.stop(profile)
@@ -0,0 +1,218 @@
+"""
+Lightweight read path for list endpoints
+
+List endpoints only turn rows into JSON, so they have no use for ORM
+objects: building them, registering them in the session's identity map
+and tracking their changes costs CPU and memory per row. A RowShape
+describes a response record as SQL expressions over the tables, with the
+same field names as the model's DICT_FIELDS (so ?fields= works the same),
+and reads pages with Core select() statements whose rows go straight into
+dicts. Only the columns and joins the requested fields need are selected.
+
+Writes, ?since= windows and detail endpoints keep using the models.
+"""
+from sqlalchemy import func, select
+
+from models import Attendance, AttendanceRemark, Course, Enrollment, Student, Teacher, User
+
+users = User.__table__
+students = Student.__table__
+teachers = Teacher.__table__
+courses = Course.__table__
+enrollments = Enrollment.__table__
+attendance = Attendance.__table__
+remarks = AttendanceRemark.__table__
+
+
+def _isoformat(value):
+    return value.isoformat()
+
+
+def _full_name(table):
+    return table.c.first_name + ' ' + table.c.last_name
+
+
+class RowField:
+    """One response field: its SQL expression, the joins it needs and how
+    the value read is converted
+
+    A field whose joins reach another database (sharded attendance) names
+    the local `key` column and a `lookup(connection, keys)` that returns
+    {key: value} from the database that has them.
+    """
+    __slots__ = ('expression', 'joins', 'convert', 'key', 'lookup')
+
+    def __init__(self, expression, joins=(), convert=None, key=None, lookup=None):
+        self.expression = expression
+        self.joins = joins
+        self.convert = convert
+        self.key = key
+        self.lookup = lookup
+
+
+class RowShape:
+    """Response records of one list endpoint, read with Core select()"""
+
+    def __init__(self, table, fields, joins=()):
+        self.table = table
+        self.fields = fields
+        # (name, table, on clause, outer) in the order they are joined
+        self.joins = joins
+
+    def _specs(self, fields):
+        return [(name, spec) for name, spec in self.fields.items() if fields is None or name in fields]
+
+    def select(self, fields=None, remote=False):
+        """select() of the requested fields (all when None)
+
+        With remote=True, fields that have a lookup select their key
+        instead of joining; resolve() swaps the keys for values.
+        """
+        needed = set()
+        columns = []
+        for name, spec in self._specs(fields):
+            if remote and spec.lookup:
+                columns.append(spec.key.label(name))
+            else:
+                columns.append(spec.expression.label(name))
+                needed.update(spec.joins)
+        source = self.table
+        for name, table, onclause, outer in self.joins:
+            if name in needed:
+                source = source.join(table, onclause, isouter=outer)
+        return select(*columns).select_from(source)
+
+    def records(self, rows, fields=None):
+        """Plain dicts for the rows of a select() of the same fields"""
+        specs = self._specs(fields)
+        names = [name for name, _ in specs]
+        converts = [(name, spec.convert) for name, spec in specs if spec.convert]
+        records = []
+        for row in rows:
+            record = dict(zip(names, row))
+            for name, convert in converts:
+                record[name] = convert(record[name])
+            records.append(record)
+        return records
+
+    def resolve(self, connection, records, fields=None):
+        """Fill in the fields a remote=True select() read as keys"""
+        if not records:
+            return records
+        for name, spec in self._specs(fields):
+            if spec.lookup is None:
+                continue
+            values = spec.lookup(connection, {record[name] for record in records})
+            for record in records:
+                record[name] = values.get(record[name])
+        return records
+
+    def page(self, connection, conditions, page, per_page, fields=None, remote=False):
+        """(total, records) of one page of the rows matching `conditions`"""
+        total = connection.execute(
+            select(func.count()).select_from(self.table).where(*conditions)
+        ).scalar()
+        statement = self.select(fields, remote).where(*conditions).offset((page - 1) * per_page).limit(per_page)
+        return total, self.records(connection.execute(statement), fields)
+
+
+def _student_names(connection, student_ids):
+    return dict(connection.execute(
+        select(students.c.id, _full_name(users))
+        .join(users, users.c.id == students.c.user_id)
+        .where(students.c.id.in_(student_ids))
+    ).all())
+
+
+def _course_names(connection, course_ids):
+    return dict(connection.execute(
+        select(courses.c.id, courses.c.course_name).where(courses.c.id.in_(course_ids))
+    ).all())
+
+
+USERS = RowShape(users, {
+    'id': RowField(users.c.id),
+    'email': RowField(users.c.email),
+    'first_name': RowField(users.c.first_name),
+    'last_name': RowField(users.c.last_name),
+    'role': RowField(users.c.role),
+    'is_active': RowField(users.c.is_active),
+    'created_at': RowField(users.c.created_at, convert=_isoformat),
+})
+
+STUDENTS = RowShape(students, {
+    'id': RowField(students.c.id),
+    'user_id': RowField(students.c.user_id),
+    'roll_number': RowField(students.c.roll_number),
+    'first_name': RowField(users.c.first_name, joins=('user',)),
+    'last_name': RowField(users.c.last_name, joins=('user',)),
+    'email': RowField(users.c.email, joins=('user',)),
+    'phone': RowField(students.c.phone),
+    'address': RowField(students.c.address),
+    'enrollment_date': RowField(students.c.enrollment_date, convert=_isoformat),
+    'is_active': RowField(students.c.is_active),
+    'created_at': RowField(students.c.created_at, convert=_isoformat),
+}, joins=(
+    ('user', users, users.c.id == students.c.user_id, False),
+))
+
+TEACHERS = RowShape(teachers, {
+    'id': RowField(teachers.c.id),
+    'user_id': RowField(teachers.c.user_id),
+    'employee_id': RowField(teachers.c.employee_id),
+    'first_name': RowField(users.c.first_name, joins=('user',)),
+    'last_name': RowField(users.c.last_name, joins=('user',)),
+    'email': RowField(users.c.email, joins=('user',)),
+    'specialization': RowField(teachers.c.specialization),
+    'phone': RowField(teachers.c.phone),
+    'office_number': RowField(teachers.c.office_number),
+    'joining_date': RowField(teachers.c.joining_date, convert=_isoformat),
+    'is_active': RowField(teachers.c.is_active),
+    'created_at': RowField(teachers.c.created_at, convert=_isoformat),
+}, joins=(
+    ('user', users, users.c.id == teachers.c.user_id, False),
+))
+
+COURSES = RowShape(courses, {
+    'id': RowField(courses.c.id),
+    'course_code': RowField(courses.c.course_code),
+    'course_name': RowField(courses.c.course_name),
+    'description': RowField(courses.c.description),
+    'teacher_id': RowField(courses.c.teacher_id),
+    'teacher_name': RowField(_full_name(users), joins=('teacher', 'teacher_user')),
+    'credits': RowField(courses.c.credits),
+    'semester': RowField(courses.c.semester),
+    'max_students': RowField(courses.c.max_students),
+    # Every enrollment row, active or not, like len(course.enrollments)
+    'enrolled_students': RowField(
+        select(func.count()).where(enrollments.c.course_id == courses.c.id).scalar_subquery()
+    ),
+    'is_active': RowField(courses.c.is_active),
+    'created_at': RowField(courses.c.created_at, convert=_isoformat),
+}, joins=(
+    ('teacher', teachers, teachers.c.id == courses.c.teacher_id, False),
+    ('teacher_user', users, users.c.id == teachers.c.user_id, False),
+))
+
+ATTENDANCE = RowShape(attendance, {
+    'id': RowField(attendance.c.id),
+    'student_id': RowField(attendance.c.student_id),
+    'student_name': RowField(
+        _full_name(users), joins=('student', 'student_user'),
+        key=attendance.c.student_id, lookup=_student_names,
+    ),
+    'course_id': RowField(attendance.c.course_id),
+    'course_name': RowField(
+        courses.c.course_name, joins=('course',),
+        key=attendance.c.course_id, lookup=_course_names,
+    ),
+    'teacher_id': RowField(attendance.c.teacher_id),
+    'attendance_date': RowField(attendance.c.attendance_date, convert=_isoformat),
+    'status': RowField(attendance.c.status),
+    'remarks': RowField(remarks.c.remarks, joins=('remark',)),
+}, joins=(
+    ('student', students, students.c.id == attendance.c.student_id, False),
+    ('student_user', users, users.c.id == students.c.user_id, False),
+    ('course', courses, courses.c.id == attendance.c.course_id, False),
+    ('remark', remarks, remarks.c.attendance_id == attendance.c.id, True),
+))
@@ -0,0 +1,437 @@
+"""
+Report kinds run as background jobs (see jobs.py and job_worker.py)
+
+Each kind validates its parameters when the job is submitted, in the API
+process, and runs later in a job worker with a JobContext for progress,
+cancellation and the output file. Rows are written as they are read, and
+large tables are read in chunks, so no report holds a whole table in memory.
+
+The compliance report covers every course, so it is split into slices of
+courses run on a process pool (REPORT_PROCESSES); see compliance_rows().
+With sharded attendance (sharding.py) every slice reads its counts from
+the one shard all of its courses are on.
+"""
+import csv
+import heapq
+import io
+import json
+import multiprocessing
+import os
+import tempfile
+import zipfile
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import date
+
+from flask import current_app
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
+
+from models import db, Attendance, AttendanceRemark, Course, Enrollment, Student, Teacher, User
+import sharding
+
+ReportKind = namedtuple('ReportKind', ('roles', 'validate', 'run', 'description'))
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'json': 'application/json',
+    'zip': 'application/zip',
+}
+
+SUMMARY_COLUMNS = ('present', 'absent', 'late', 'total', 'attendance_percentage')
+
+# Compliance slices per pool process; more than one evens out uneven courses
+SLICES_PER_PROCESS = 4
+
+# Rows per fetch when streaming grouped counts and rosters
+STREAM_ROWS = 10000
+
+
+class RowWriter:
+    """Stream rows to a CSV file or a JSON array of objects"""
+
+    def __init__(self, path, output_format, columns):
+        self.file = open(path, 'w', encoding='utf-8', newline='')
+        self.format = output_format
+        self.columns = columns
+        self.count = 0
+        if output_format == 'csv':
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(columns)
+        else:
+            self.file.write('[')
+
+    def write(self, values):
+        if self.format == 'csv':
+            self.writer.writerow(values)
+        else:
+            prefix = ',\n' if self.count else '\n'
+            self.file.write(prefix + json.dumps(dict(zip(self.columns, values)), default=str))
+        self.count += 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.format == 'json':
+            self.file.write('\n]\n')
+        self.file.close()
+
+
+def _output_format(params, allowed=('csv', 'json')):
+    output_format = params.get('format', 'csv')
+    if output_format not in allowed:
+        raise ValueError(f"format must be one of: {', '.join(allowed)}")
+    return output_format
+
+
+def _optional_date(params, name):
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value).isoformat()
+    except (TypeError, ValueError):
+        raise ValueError(f'Invalid {name}: {value}')
+
+
+def summarise(counts):
+    """{status: count} -> present, absent, late, total, percentage"""
+    present = counts.get('present', 0)
+    absent = counts.get('absent', 0)
+    late = counts.get('late', 0)
+    total = present + absent + late
+    percentage = round(present / total * 100, 2) if total > 0 else 0
+    return present, absent, late, total, percentage
+
+
+def _status_counts(session, course_ids, from_date=None, to_date=None):
+    """{(course_id, student_id): {status: count}} from one grouped query"""
+    query = session.query(
+        Attendance.course_id, Attendance.student_id, Attendance.status, db.func.count()
+    ).filter(Attendance.course_id.in_(course_ids))
+    if from_date:
+        query = query.filter(Attendance.attendance_date >= date.fromisoformat(from_date))
+    if to_date:
+        query = query.filter(Attendance.attendance_date <= date.fromisoformat(to_date))
+    counts = {}
+    for course_id, student_id, status, count in query.group_by(
+        Attendance.course_id, Attendance.student_id, Attendance.status
+    ):
+        counts.setdefault((course_id, student_id), {})[status] = count
+    return counts
+
+
+def _roster(course_ids):
+    """Active enrollments of the given courses with student names, by course then roll number"""
+    return (
+        db.session.query(Enrollment.course_id, Student.id, Student.roll_number, User.first_name, User.last_name, User.email)
+        .join(Student, Student.id == Enrollment.student_id)
+        .join(User, User.id == Student.user_id)
+        .filter(Enrollment.course_id.in_(course_ids), Enrollment.is_active == True)
+        .order_by(Enrollment.course_id, Student.roll_number)
+        .all()
+    )
+
+
+# ==================== COURSE TERM REPORT ====================
+
+def validate_course_term(params, principal):
+    course_id = params.get('course_id')
+    if not course_id:
+        raise ValueError('course_id is required')
+    course = db.session.get(Course, course_id)
+    if not course:
+        raise ValueError('Course not found')
+    if principal.role != 'admin' and (not principal.teacher or course.teacher_id != principal.teacher.id):
+        raise PermissionError('Unauthorized to report on this course')
+    return {
+        'course_id': course.id,
+        'from_date': _optional_date(params, 'from_date'),
+        'to_date': _optional_date(params, 'to_date'),
+        'format': _output_format(params),
+    }
+
+
+def run_course_term(job, params):
+    course = db.session.get(Course, params['course_id'])
+    if not course:
+        raise ValueError('Course no longer exists')
+    job.progress(0.1, 'Counting attendance')
+    counts = _status_counts(sharding.session_for(course.id), [course.id], params['from_date'], params['to_date'])
+    roster = _roster([course.id])
+    job.progress(0.5, f'Writing {len(roster)} students')
+
+    output_format = params['format']
+    columns = ('roll_number', 'student_name', 'email') + SUMMARY_COLUMNS
+    with RowWriter(job.output_path(output_format), output_format, columns) as writer:
+        for _, student_id, roll_number, first_name, last_name, email in roster:
+            writer.write((roll_number, f'{first_name} {last_name}', email) + summarise(counts.get((course.id, student_id), {})))
+    return f'{course.course_code}-term-report.{output_format}', CONTENT_TYPES[output_format]
+
+
+# ==================== INSTITUTION COMPLIANCE REPORT ====================
+
+def validate_compliance(params, principal):
+    cutoff = params.get('cutoff', current_app.config['REPORT_ELIGIBILITY_CUTOFF'])
+    if not isinstance(cutoff, (int, float)) or not 0 <= cutoff <= 100:
+        raise ValueError('cutoff must be a percentage between 0 and 100')
+    return {
+        'cutoff': cutoff,
+        'from_date': _optional_date(params, 'from_date'),
+        'to_date': _optional_date(params, 'to_date'),
+        'format': _output_format(params),
+    }
+
+
+COMPLIANCE_COLUMNS = (
+    ('course_code', 'course_name', 'semester', 'roll_number', 'student_name') + SUMMARY_COLUMNS + ('eligible',)
+)
+
+
+def partition_courses(weights, count):
+    """Split {course_id: weight} into at most `count` slices of similar total weight
+
+    Heaviest course first into the lightest slice, so one big course does
+    not end up sharing a slice with several others.
+    """
+    slices = [(0, index, []) for index in range(max(1, min(count, len(weights))))]
+    heapq.heapify(slices)
+    for course_id, weight in sorted(weights.items(), key=lambda item: item[1], reverse=True):
+        total, index, course_ids = heapq.heappop(slices)
+        course_ids.append(course_id)
+        heapq.heappush(slices, (total + max(weight, 1), index, course_ids))
+    return [(total, course_ids) for total, _, course_ids in sorted(slices, key=lambda s: s[1]) if course_ids]
+
+
+def compliance_slice(database, course_ids, params, path, attendance_database=None):
+    """Write one slice's report rows, sorted by course code and roll number, as JSON lines
+
+    Runs in a process-pool worker with its own engine (`database` is a URL),
+    or in-process with an existing Engine. Attendance for the whole slice is
+    read with one grouped query, from `attendance_database` (the courses'
+    shard, given the same way) when it is not on `database`. Rows are
+    sorted here rather than by the database so every slice uses the same
+    (Python) collation for the merge. Returns the number of rows written.
+    """
+    engine = _engine(database)
+    attendance_engine = _engine(attendance_database) if attendance_database is not None else engine
+    try:
+        with Session(engine) as session, Session(attendance_engine) as attendance_session:
+            counts_query = select(
+                Attendance.course_id, Attendance.student_id, Attendance.status, func.count()
+            ).where(Attendance.course_id.in_(course_ids))
+            if params['from_date']:
+                counts_query = counts_query.where(Attendance.attendance_date >= date.fromisoformat(params['from_date']))
+            if params['to_date']:
+                counts_query = counts_query.where(Attendance.attendance_date <= date.fromisoformat(params['to_date']))
+            counts = {}
+            for course_id, student_id, status, count in attendance_session.execute(counts_query.group_by(
+                Attendance.course_id, Attendance.student_id, Attendance.status
+            ).execution_options(yield_per=STREAM_ROWS)):
+                counts.setdefault((course_id, student_id), {})[status] = count
+
+            roster = session.execute(
+                select(
+                    Course.id, Course.course_code, Course.course_name, Course.semester,
+                    Student.id, Student.roll_number, User.first_name, User.last_name,
+                )
+                .join(Enrollment, Enrollment.course_id == Course.id)
+                .join(Student, Student.id == Enrollment.student_id)
+                .join(User, User.id == Student.user_id)
+                .where(Course.id.in_(course_ids), Enrollment.is_active == True)
+                .execution_options(yield_per=STREAM_ROWS)
+            )
+            rows = []
+            for course_id, code, name, semester, student_id, roll_number, first_name, last_name in roster:
+                summary = summarise(counts.get((course_id, student_id), {}))
+                rows.append(
+                    (code, name, semester, roll_number, f'{first_name} {last_name}')
+                    + summary + (summary[-1] >= params['cutoff'],)
+                )
+        rows.sort(key=_row_order)
+        with open(path, 'w', encoding='utf-8') as out:
+            for row in rows:
+                out.write(json.dumps(row) + '\n')
+        return len(rows)
+    finally:
+        for source, source_engine in ((database, engine), (attendance_database, attendance_engine)):
+            if isinstance(source, str):
+                source_engine.dispose()
+
+
+def _engine(database):
+    return create_engine(database, poolclass=NullPool) if isinstance(database, str) else database
+
+
+def _url(database):
+    return database if isinstance(database, str) else database.url.render_as_string(hide_password=False)
+
+
+def _row_order(row):
+    return row[0], row[3]
+
+
+def _slice_rows(path):
+    with open(path, encoding='utf-8') as lines:
+        for line in lines:
+            yield json.loads(line)
+
+
+def compliance_rows(database, weights, params, processes, scratch_dir, progress=None, shards=None):
+    """Report rows for the given courses ({course_id: weight}), in course code order
+
+    Courses are split into about SLICES_PER_PROCESS slices per process
+    and the slices run on a process pool, each writing a sorted file to
+    `scratch_dir`; the files are then merged. With one process (or an
+    in-memory database, which other processes cannot open) the slices run
+    here on `database`, which may then be an Engine. `shards` maps course
+    ids to the database holding their attendance (given like `database`)
+    when it is sharded; no slice spans two shards.
+    """
+    url = _url(database)
+    sources = [url] + ([_url(shard) for shard in set(shards.values())] if shards else [])
+    in_process = processes <= 1 or any(make_url(source).database in (None, '', ':memory:') for source in sources)
+    slice_count = 1 if in_process else processes * SLICES_PER_PROCESS
+
+    groups = {}
+    for course_id, weight in weights.items():
+        groups.setdefault(shards.get(course_id) if shards else None, {})[course_id] = weight
+    all_weight = sum(weights.values()) or 1
+    slices = [
+        (weight, course_ids, attendance_database)
+        for attendance_database, group in groups.items()
+        for weight, course_ids in partition_courses(group, round(slice_count * sum(group.values()) / all_weight) or 1)
+    ]
+    paths = [os.path.join(scratch_dir, f'slice-{index}.jsonl') for index in range(len(slices))]
+    total_weight = sum(weight for weight, _, _ in slices) or 1
+    done_weight = 0
+    total_rows = 0
+
+    if in_process:
+        for (weight, course_ids, attendance_database), path in zip(slices, paths):
+            total_rows += compliance_slice(database, course_ids, params, path, attendance_database)
+            done_weight += weight
+            if progress:
+                progress(0.9 * done_weight / total_weight, f'{done_weight} of {total_weight} enrollments')
+    else:
+        context = multiprocessing.get_context('spawn')
+        executor = ProcessPoolExecutor(max_workers=processes, mp_context=context)
+        try:
+            pending = {
+                executor.submit(
+                    compliance_slice, url, course_ids, params, path,
+                    _url(attendance_database) if attendance_database is not None else None,
+                ): weight
+                for (weight, course_ids, attendance_database), path in zip(slices, paths)
+            }
+            while pending:
+                finished, _ = wait(pending, timeout=1.0, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    total_rows += future.result()
+                    done_weight += pending.pop(future)
+                if progress:
+                    progress(0.9 * done_weight / total_weight, f'{done_weight} of {total_weight} enrollments')
+        except BaseException:
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        executor.shutdown()
+
+    merged = heapq.merge(*(_slice_rows(path) for path in paths), key=_row_order)
+    for written, row in enumerate(merged, 1):
+        if progress and written % STREAM_ROWS == 0:
+            progress(0.9 + 0.1 * written / max(total_rows, 1), 'Merging')
+        yield row
+
+
+def run_compliance(job, params):
+    """Every active course's students against the eligibility cutoff"""
+    # Active enrollments per course, to balance the slices
+    weights = dict(
+        db.session.query(Course.id, db.func.count(Enrollment.id))
+        .outerjoin(Enrollment, db.and_(Enrollment.course_id == Course.id, Enrollment.is_active == True))
+        .filter(Course.is_active == True)
+        .group_by(Course.id)
+        .all()
+    )
+    shards = {
+        course_id: sharding.engine(sharding.shard_for(course_id)) for course_id in weights
+    } if sharding.enabled() else None
+    processes = current_app.config['REPORT_PROCESSES'] or os.cpu_count() or 1
+    output_format = params['format']
+    path = job.output_path(output_format)
+
+    # Slices cancelled mid-write may still be finishing in the pool
+    with tempfile.TemporaryDirectory(dir=job.results_dir, ignore_cleanup_errors=True) as scratch_dir:
+        with RowWriter(path, output_format, COMPLIANCE_COLUMNS) as writer:
+            for row in compliance_rows(db.engine, weights, params, processes, scratch_dir, job.progress, shards):
+                writer.write(row)
+    return f'compliance-report-{date.today().isoformat()}.{output_format}', CONTENT_TYPES[output_format]
+
+
+# ==================== FULL EXPORT ====================
+
+def _columns(model, exclude=()):
+    return [getattr(model, column.key) for column in model.__table__.columns if column.key not in exclude]
+
+
+def _export_tables():
+    """(file name, statement, sessions to read it from) per exported table"""
+    main = [db.session]
+    return (
+        ('users', select(*_columns(User, exclude=('password_hash',))).order_by(User.id), main),
+        ('students', select(*_columns(Student)).order_by(Student.id), main),
+        ('teachers', select(*_columns(Teacher)).order_by(Teacher.id), main),
+        ('courses', select(*_columns(Course)).order_by(Course.id), main),
+        ('enrollments', select(*_columns(Enrollment)).order_by(Enrollment.id), main),
+        # One shard after the other when attendance is sharded
+        ('attendance', select(*_columns(Attendance), AttendanceRemark.remarks).outerjoin(
+            AttendanceRemark, AttendanceRemark.attendance_id == Attendance.id
+        ).order_by(Attendance.id), sharding.sessions_for()),
+    )
+
+
+def validate_export(params, principal):
+    return {}
+
+
+def run_export(job, params):
+    """One CSV per table in a zip archive"""
+    tables = _export_tables()
+    total = sum(
+        session.execute(select(db.func.count()).select_from(statement.subquery())).scalar()
+        for _, statement, sessions in tables for session in sessions
+    ) or 1
+    chunk_rows = current_app.config['REPORT_EXPORT_CHUNK_ROWS']
+    written = 0
+
+    with zipfile.ZipFile(job.output_path('zip'), 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, statement, sessions in tables:
+            with io.TextIOWrapper(archive.open(f'{name}.csv', 'w'), encoding='utf-8', newline='') as text:
+                writer = csv.writer(text)
+                writer.writerow([column.name for column in statement.selected_columns])
+                for session in sessions:
+                    result = session.execute(statement.execution_options(yield_per=chunk_rows))
+                    for rows in result.partitions():
+                        writer.writerows(rows)
+                        written += len(rows)
+                        job.progress(written / total, f'Exporting {name}')
+    return f'export-{date.today().isoformat()}.zip', CONTENT_TYPES['zip']
+
+
+REPORT_KINDS = {
+    'course_term_report': ReportKind(
+        ('teacher', 'admin'), validate_course_term, run_course_term,
+        'Per-student attendance totals for one course',
+    ),
+    'compliance_report': ReportKind(
+        ('admin',), validate_compliance, run_compliance,
+        'Every enrollment against the attendance eligibility cutoff',
+    ),
+    'full_export': ReportKind(
+        ('admin',), validate_export, run_export,
+        'All users, students, teachers, courses, enrollments and attendance as CSV in a zip',
+    ),
+}
@@ -0,0 +1,154 @@
+"""
+JWT revocation for StudentTracker
+
+Revoked token ids (jti) are persisted in `revoked_tokens`. Each worker
+mirrors them in a Bloom filter, so the common case - a token that was never
+revoked - is answered from memory. A filter hit is confirmed against the
+unexpired revocations this worker has seen and, failing that, with a
+primary key lookup (a false positive, roughly 1 in 1000).
+
+The filter is topped up from `revoked_at` every REVOCATION_REFRESH_SECONDS
+and rebuilt from unexpired rows when it fills up, since Bloom filters
+cannot forget expired entries. `revoked_at` is stamped by whichever app
+host handled the logout and the row may commit after later-stamped ones,
+so each top-up re-reads the last REVOCATION_OVERLAP_SECONDS before the
+newest revocation seen. Ids the filter already holds are not added again,
+so the overlap does not count towards its capacity.
+"""
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app, jsonify
+
+import metrics
+from models import db, RevokedToken
+
+FALSE_POSITIVE_RATE = 0.001
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings"""
+
+    def __init__(self, capacity, error_rate=FALSE_POSITIVE_RATE):
+        self.capacity = capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        # Kirsch-Mitzenmacher: derive k positions from two 64-bit hashes
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hash_count)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class RevocationList:
+    """Per-worker view of `revoked_tokens`"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.bloom = None
+        self.recent = {}  # jti -> expires_at
+        self.watermark = None
+        self.refreshed_at = 0.0
+
+    def rebuild(self, capacity):
+        """Reload every unexpired revocation into a fresh filter"""
+        started = datetime.utcnow()
+        bloom = BloomFilter(capacity)
+        rows = db.session.query(RevokedToken.jti).filter(RevokedToken.expires_at > started)
+        for (jti,) in rows.execution_options(yield_per=10000):
+            bloom.add(jti)
+        recent = {jti: expires_at for jti, expires_at in self.recent.items() if expires_at > started}
+        self.bloom, self.recent, self.watermark = bloom, recent, started
+        self.refreshed_at = time.monotonic()
+
+    def refresh(self):
+        """Pick up revocations made since the last refresh (possibly by other workers)"""
+        config = current_app.config
+        if self.bloom is not None and time.monotonic() - self.refreshed_at < config['REVOCATION_REFRESH_SECONDS']:
+            return
+        with self._lock:
+            if self.bloom is None or self.bloom.count >= self.bloom.capacity:
+                self.rebuild(config['REVOCATION_BLOOM_CAPACITY'])
+                return
+            if time.monotonic() - self.refreshed_at < config['REVOCATION_REFRESH_SECONDS']:
+                return
+            since = self.watermark - timedelta(seconds=config['REVOCATION_OVERLAP_SECONDS'])
+            rows = (
+                db.session.query(RevokedToken.jti, RevokedToken.expires_at, RevokedToken.revoked_at)
+                .filter(RevokedToken.revoked_at >= since)
+                .all()
+            )
+            for jti, expires_at, revoked_at in rows:
+                self._remember(jti, expires_at)
+                self.watermark = max(self.watermark, revoked_at)
+            self.refreshed_at = time.monotonic()
+
+    def _remember(self, jti, expires_at):
+        if jti not in self.bloom:
+            self.bloom.add(jti)
+        self.recent[jti] = expires_at
+
+    def add(self, jti, expires_at):
+        with self._lock:
+            if self.bloom is not None:
+                self._remember(jti, expires_at)
+
+    def is_revoked(self, jti):
+        self.refresh()
+        # A hit is an answer without a database lookup
+        if jti not in self.bloom:
+            metrics.cache_result('revocation', True)
+            return False
+        if jti in self.recent:
+            metrics.cache_result('revocation', True)
+            return True
+        metrics.cache_result('revocation', False)
+        return db.session.get(RevokedToken, jti) is not None
+
+
+revocation_list = RevocationList()
+
+
+def revoke_token(decoded_token):
+    """Persist the revocation of a decoded JWT and apply it to this worker"""
+    jti = decoded_token['jti']
+    expires_at = datetime.fromtimestamp(decoded_token['exp'], timezone.utc).replace(tzinfo=None)
+    if db.session.get(RevokedToken, jti) is None:
+        db.session.add(RevokedToken(
+            jti=jti,
+            token_type=decoded_token['type'],
+            user_id=decoded_token['sub'],
+            expires_at=expires_at,
+        ))
+        db.session.commit()
+    revocation_list.add(jti, expires_at)
+
+
+def init_app(jwt):
+    """Register the blocklist check with the JWTManager"""
+
+    @jwt.token_in_blocklist_loader
+    def token_in_blocklist_callback(jwt_header, jwt_payload):
+        return revocation_list.is_revoked(jwt_payload['jti'])
+
+    @jwt.revoked_token_loader
+    def revoked_token_callback(jwt_header, jwt_payload):
+        return jsonify({
+            'success': False,
+            'message': 'Token has been revoked'
+        }), 401
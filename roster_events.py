@@ -0,0 +1,317 @@
+"""
+Live attendance roster updates (server-sent events)
+
+Whenever attendance for a course changes, the changed rows are published as
+a delta on that course's channel: it is appended to a small SQLite event
+log shared by all workers on the host (a stand-in for a real broker such
+as Redis pub/sub), which a poller thread in every worker tails to fan the
+deltas out to its subscribers - open `/api/attendance/course/<id>/stream`
+responses. Local and remote deltas alike are delivered from the log, so
+every subscriber gets them in id order; publishing wakes this worker's
+poller so local ones still go out straight away.
+
+Event ids are the log's row ids, so a reconnecting client that sends
+Last-Event-ID is replayed whatever it missed while the log still holds it.
+
+Each stream holds a server thread for up to ROSTER_EVENTS_MAX_STREAM_SECONDS,
+so a worker serves at most ROSTER_EVENTS_MAX_STREAMS at once and answers
+further ones with 503 and Retry-After, keeping threads free for the API.
+"""
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from flask import Response, current_app
+
+from utils import api_response
+from workers import worker_name
+
+# Published events are kept this long for Last-Event-ID replay
+RETENTION_SECONDS = 600
+
+# Deltas buffered per subscriber before it is told to reload instead
+SUBSCRIBER_QUEUE_SIZE = 256
+
+# Most events replayed for one reconnect before falling back to a reload
+REPLAY_LIMIT = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel TEXT NOT NULL,
+    origin TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_events_created ON events (created_at);
+"""
+
+
+class EventLog:
+    """Append-only event log in a SQLite file (one connection per thread)"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            # Events are ephemeral; losing the last few on power loss is fine
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.executescript(SCHEMA)
+            self._local.connection = connection
+        return connection
+
+    def append(self, channel, origin, payload):
+        cursor = self._connection().execute(
+            "INSERT INTO events (channel, origin, payload, created_at) VALUES (?, ?, ?, ?)",
+            (channel, origin, payload, time.time()),
+        )
+        return cursor.lastrowid
+
+    def after(self, last_id, channel=None, limit=1000):
+        """Events with id > last_id, oldest first, as (id, channel, origin, payload)"""
+        if channel is None:
+            return self._connection().execute(
+                "SELECT id, channel, origin, payload FROM events WHERE id > ? ORDER BY id LIMIT ?",
+                (last_id, limit),
+            ).fetchall()
+        return self._connection().execute(
+            "SELECT id, channel, origin, payload FROM events WHERE id > ? AND channel = ? ORDER BY id LIMIT ?",
+            (last_id, channel, limit),
+        ).fetchall()
+
+    def oldest_id(self):
+        row = self._connection().execute("SELECT MIN(id) FROM events").fetchone()
+        return row[0] or 0
+
+    def latest_id(self):
+        row = self._connection().execute("SELECT MAX(id) FROM events").fetchone()
+        return row[0] or 0
+
+    def purge(self):
+        self._connection().execute(
+            "DELETE FROM events WHERE created_at < ?", (time.time() - RETENTION_SECONDS,)
+        )
+
+
+class Subscription:
+    """One open stream: a bounded queue of (event_id, payload)"""
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.overflowed = False
+
+    def offer(self, event_id, payload):
+        try:
+            self.queue.put_nowait((event_id, payload))
+        except queue.Full:
+            # A slow client; it reloads the roster once it catches up
+            self.overflowed = True
+
+
+class RosterHub:
+    """Per-worker channel -> subscriptions registry"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._channels = {}
+
+    def subscribe(self, channel, limit=None):
+        """A new subscription, or None when `limit` streams are already open"""
+        subscription = Subscription(channel)
+        with self._lock:
+            if limit is not None and sum(len(subscribers) for subscribers in self._channels.values()) >= limit:
+                return None
+            self._channels.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._channels.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._channels[subscription.channel]
+
+    def deliver(self, channel, event_id, payload):
+        with self._lock:
+            subscribers = list(self._channels.get(channel, ()))
+        for subscription in subscribers:
+            subscription.offer(event_id, payload)
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._channels.values())
+
+
+hub = RosterHub()
+
+_log = None
+_poller_pid = None
+_poller_lock = threading.Lock()
+# Set by publish() so this worker's poller delivers local events at once
+_wake = threading.Event()
+
+
+def event_log(app=None):
+    global _log
+    if _log is None:
+        config = (app or current_app).config
+        _log = EventLog(config['ROSTER_EVENTS_PATH'])
+    return _log
+
+
+def attendance_delta(attendance_id, student_id, attendance_date, status=None, remarks=None):
+    """Compact row sent to clients; status None marks a deleted record"""
+    return {
+        'id': attendance_id,
+        'student_id': student_id,
+        'attendance_date': attendance_date.isoformat() if hasattr(attendance_date, 'isoformat') else attendance_date,
+        'status': status,
+        'remarks': remarks,
+    }
+
+
+def publish(course_id, records, app=None):
+    """Publish changed attendance rows for a course (call after commit)
+
+    Failures are logged and swallowed: the change itself is already stored
+    and clients still converge on their next reload. Subscribers get the
+    delta from the poller, in log order.
+    """
+    if not records:
+        return None
+    app = app or current_app._get_current_object()
+    if not app.config.get('ROSTER_EVENTS_ENABLED', True):
+        return None
+    payload = json.dumps({'course_id': course_id, 'records': records})
+    try:
+        event_id = event_log(app).append(course_id, worker_name(), payload)
+    except sqlite3.Error:
+        app.logger.exception('Could not publish roster event')
+        return None
+    _wake.set()
+    return event_id
+
+
+def _poller(app, last_id):
+    """Tail the shared log and deliver its events to this worker's subscribers"""
+    interval = app.config['ROSTER_EVENTS_POLL_INTERVAL']
+    purged_at = time.monotonic()
+    while True:
+        try:
+            for event_id, channel, _, payload in event_log(app).after(last_id):
+                last_id = event_id
+                hub.deliver(channel, event_id, payload)
+            if time.monotonic() - purged_at > RETENTION_SECONDS / 10:
+                event_log(app).purge()
+                purged_at = time.monotonic()
+        except Exception:
+            app.logger.exception('Roster event poller error')
+        _wake.wait(interval)
+        _wake.clear()
+
+
+def ensure_poller(app):
+    """Start this process's poller thread (once per worker after fork)"""
+    global _poller_pid
+    if _poller_pid == os.getpid():
+        return
+    with _poller_lock:
+        if _poller_pid == os.getpid():
+            return
+        # Read before returning, so events published after the caller
+        # subscribes are not skipped by a thread that starts late
+        last_id = event_log(app).latest_id()
+        _poller_pid = os.getpid()
+        threading.Thread(target=_poller, args=(app, last_id), name='roster-events', daemon=True).start()
+
+
+def _matches(record, attendance_date):
+    return attendance_date is None or record['attendance_date'] == attendance_date
+
+
+def _format(event_id, event, data):
+    return f'id: {event_id}\nevent: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+def _events(app, subscription, last_event_id, attendance_date):
+    config = app.config
+    keepalive = config['ROSTER_EVENTS_KEEPALIVE_SECONDS']
+    deadline = time.monotonic() + config['ROSTER_EVENTS_MAX_STREAM_SECONDS']
+    sent_id = 0
+    try:
+        yield f"retry: {int(config['ROSTER_EVENTS_RETRY_MS'])}\n\n"
+
+        # Subscribed already, so nothing published from here on is missed;
+        # the queue gets events in id order, so ids guard against sending a
+        # replayed event twice
+        if last_event_id is not None:
+            replay = event_log(app).after(last_event_id, channel=subscription.channel, limit=REPLAY_LIMIT)
+            if len(replay) == REPLAY_LIMIT or last_event_id < event_log(app).oldest_id() - 1:
+                # Missed more than the log can replay: reload the roster
+                sent_id = event_log(app).latest_id()
+                yield _format(sent_id, 'resync', {})
+                replay = []
+            for event_id, _, _, payload in replay:
+                sent_id = event_id
+                records = [r for r in json.loads(payload)['records'] if _matches(r, attendance_date)]
+                if records:
+                    yield _format(event_id, 'attendance', {'records': records})
+
+        while time.monotonic() < deadline:
+            try:
+                event_id, payload = subscription.queue.get(timeout=keepalive)
+            except queue.Empty:
+                yield ': keepalive\n\n'
+                continue
+            if subscription.overflowed:
+                subscription.overflowed = False
+                with subscription.queue.mutex:
+                    subscription.queue.queue.clear()
+                yield _format(event_id, 'resync', {})
+                sent_id = event_id
+                continue
+            if event_id <= sent_id:
+                continue
+            sent_id = event_id
+            records = [r for r in json.loads(payload)['records'] if _matches(r, attendance_date)]
+            if records:
+                yield _format(event_id, 'attendance', {'records': records})
+    finally:
+        hub.unsubscribe(subscription)
+
+
+def stream_response(course_id, last_event_id=None, attendance_date=None):
+    """text/event-stream response of attendance deltas for one course
+
+    The generator does not need the request context, so the request is torn
+    down (session released, admission slot freed) as soon as the response
+    starts; the stream ends after ROSTER_EVENTS_MAX_STREAM_SECONDS and the
+    client reconnects with Last-Event-ID.
+    """
+    app = current_app._get_current_object()
+    ensure_poller(app)
+    subscription = hub.subscribe(course_id, app.config['ROSTER_EVENTS_MAX_STREAMS'])
+    if subscription is None:
+        response, status_code = api_response('Too many live streams open, please retry', status_code=503)
+        response.headers['Retry-After'] = str(max(1, app.config['ROSTER_EVENTS_RETRY_MS'] // 1000))
+        return response, status_code
+    response = Response(
+        _events(app, subscription, last_event_id, attendance_date),
+        mimetype='text/event-stream',
+    )
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    # Also covers a response closed before its generator ever ran
+    response.call_on_close(lambda: hub.unsubscribe(subscription))
+    return response
@@ -1,11 +1,20 @@
 """
 Administrator routes for managing users, students, and teachers
 """
-from flask import Blueprint, request
+from datetime import datetime
+from flask import Blueprint, current_app, request, send_file
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from models import db, User, Student, Teacher, UserRole
 from auth import hash_password, require_admin
 from utils import api_response, handle_exceptions, validate_email, paginate
+from search_index import people_index, index_user, search_database, sync_index
+from admission import admission
+from delta_sync import sync_window, initial_watermark, EXPIRED_MESSAGE
+from fieldsets import requested_fields, load_options
+from analytics import analytics_for, GROUPINGS
+import readers
+import profiling
+import metrics
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/api/admin')
 
@@ -20,21 +29,20 @@ def list_users():
     per_page = request.args.get('per_page', 20, type=int)
     role = request.args.get('role', None, type=str)
     
-    query = User.query
+    conditions = []
     
     if role:
         valid_roles = [r.value for r in UserRole]
         if role not in valid_roles:
             return api_response('Invalid role', status_code=400)
-        query = query.filter_by(role=role)
+        conditions.append(readers.users.c.role == role)
     
-    total = query.count()
-    users = query.offset((page - 1) * per_page).limit(per_page).all()
+    total, users = readers.USERS.page(db.session.connection(), conditions, page, per_page)
     
     return api_response(
         'Users retrieved',
         {
-            'users': [user.to_dict() for user in users],
+            'users': users,
             'total': total,
             'page': page,
             'per_page': per_page,
@@ -83,7 +91,10 @@ def update_user(user_id):
     if 'password' in data:
         user.password_hash = hash_password(data['password'])
     
+    # Student rows show the user's name, so they count as changed for ?since=
+    Student.query.filter_by(user_id=user.id).update({'updated_at': datetime.utcnow()})
     db.session.commit()
+    index_user(user.id)
     
     return api_response('User updated', user.to_dict(), status_code=200)
 
@@ -99,6 +110,7 @@ def delete_user(user_id):
     
     user.is_active = False
     db.session.commit()
+    index_user(user.id)
     
     return api_response('User deactivated', status_code=200)
 
@@ -108,21 +120,38 @@ def delete_user(user_id):
 @require_admin
 @handle_exceptions
 def list_students():
-    """List all students"""
+    """List all students, or with ?since= only those changed"""
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 20, type=int)
-    
-    total = Student.query.count()
-    students = Student.query.offset((page - 1) * per_page).limit(per_page).all()
+    fields = requested_fields(Student)
+    
+    window = sync_window()
+    if window:
+        if window.expired:
+            return api_response(EXPIRED_MESSAGE, status_code=410)
+        query = Student.query.options(*load_options(Student, fields, columns=('is_active', 'updated_at')))
+        students = window.rows(query, Student)
+        return api_response(
+            'Student changes retrieved',
+            window.response(
+                [student.to_dict(fields) for student in students if student.is_active],
+                [student.id for student in students if not student.is_active],
+            ),
+            status_code=200
+        )
+    
+    watermark = initial_watermark()
+    total, students = readers.STUDENTS.page(db.session.connection(), [], page, per_page, fields)
     
     return api_response(
         'Students retrieved',
         {
-            'students': [student.to_dict() for student in students],
+            'students': students,
             'total': total,
             'page': page,
             'per_page': per_page,
-            'pages': (total + per_page - 1) // per_page
+            'pages': (total + per_page - 1) // per_page,
+            'watermark': watermark,
         },
         status_code=200
     )
@@ -132,12 +161,13 @@ def list_students():
 @handle_exceptions
 def get_student(student_id):
     """Get student details"""
-    student = Student.query.get(student_id)
+    fields = requested_fields(Student)
+    student = Student.query.options(*load_options(Student, fields)).filter_by(id=student_id).first()
     
     if not student:
         return api_response('Student not found', status_code=404)
     
-    return api_response('Student retrieved', student.to_dict(), status_code=200)
+    return api_response('Student retrieved', student.to_dict(fields), status_code=200)
 
 @admin_bp.route('/students/<student_id>', methods=['PUT'])
 @require_admin
@@ -159,6 +189,7 @@ def update_student(student_id):
         student.is_active = data['is_active']
     
     db.session.commit()
+    index_user(student.user_id)
     
     return api_response('Student updated', student.to_dict(), status_code=200)
 
@@ -174,6 +205,7 @@ def delete_student(student_id):
     
     student.is_active = False
     db.session.commit()
+    index_user(student.user_id)
     
     return api_response('Student deactivated', status_code=200)
 
@@ -186,14 +218,14 @@ def list_teachers():
     """List all teachers"""
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 20, type=int)
+    fields = requested_fields(Teacher)
     
-    total = Teacher.query.count()
-    teachers = Teacher.query.offset((page - 1) * per_page).limit(per_page).all()
+    total, teachers = readers.TEACHERS.page(db.session.connection(), [], page, per_page, fields)
     
     return api_response(
         'Teachers retrieved',
         {
-            'teachers': [teacher.to_dict() for teacher in teachers],
+            'teachers': teachers,
             'total': total,
             'page': page,
             'per_page': per_page,
@@ -207,12 +239,13 @@ def list_teachers():
 @handle_exceptions
 def get_teacher(teacher_id):
     """Get teacher details"""
-    teacher = Teacher.query.get(teacher_id)
+    fields = requested_fields(Teacher)
+    teacher = Teacher.query.options(*load_options(Teacher, fields)).filter_by(id=teacher_id).first()
     
     if not teacher:
         return api_response('Teacher not found', status_code=404)
     
-    return api_response('Teacher retrieved', teacher.to_dict(), status_code=200)
+    return api_response('Teacher retrieved', teacher.to_dict(fields), status_code=200)
 
 @admin_bp.route('/teachers/<teacher_id>', methods=['PUT'])
 @require_admin
@@ -236,6 +269,7 @@ def update_teacher(teacher_id):
         teacher.is_active = data['is_active']
     
     db.session.commit()
+    index_user(teacher.user_id)
     
     return api_response('Teacher updated', teacher.to_dict(), status_code=200)
 
@@ -251,9 +285,42 @@ def delete_teacher(teacher_id):
     
     teacher.is_active = False
     db.session.commit()
+    index_user(teacher.user_id)
     
     return api_response('Teacher deactivated', status_code=200)
 
+# ==================== SEARCH ====================
+
+@admin_bp.route('/search', methods=['GET'])
+@require_admin
+@handle_exceptions
+def search_people():
+    """Search users, students and teachers by name, email, roll number or employee ID"""
+    query = request.args.get('q', '', type=str).strip()
+    limit = min(request.args.get('limit', 20, type=int), 100)
+    role = request.args.get('role', None, type=str)
+    
+    if not query:
+        return api_response('Query parameter q is required', status_code=400)
+    
+    metrics.cache_result('people_search', people_index.ready)
+    if people_index.ready:
+        sync_index()
+        results = [
+            dict(document, score=score)
+            for score, document in people_index.search(query, limit=limit, role=role)
+        ]
+        source = 'index'
+    else:
+        results = search_database(query, limit=limit, role=role)
+        source = 'database'
+    
+    return api_response(
+        'Search results',
+        {'results': results, 'total': len(results), 'source': source},
+        status_code=200
+    )
+
 # ==================== DASHBOARD ====================
 
 @admin_bp.route('/dashboard', methods=['GET'])
@@ -274,3 +341,104 @@ def dashboard():
     }
     
     return api_response('Dashboard stats', stats, status_code=200)
+
+# ==================== ANALYTICS ====================
+
+@admin_bp.route('/analytics/distribution', methods=['GET'])
+@require_admin
+@handle_exceptions
+def analytics_distribution():
+    """Percentile bands of student attendance % per department, semester or course"""
+    group_by = request.args.get('group_by', 'department', type=str)
+    if group_by not in GROUPINGS:
+        return api_response(f"group_by must be one of: {', '.join(GROUPINGS)}", status_code=400)
+    at_risk = request.args.get('at_risk', current_app.config['ANALYTICS_AT_RISK_PERCENT'], type=float)
+    
+    result = analytics_for(request.args)
+    return api_response(
+        'Attendance distribution',
+        {**result.distribution(group_by, at_risk), 'scan': result.meta()},
+        status_code=200
+    )
+
+@admin_bp.route('/analytics/trends', methods=['GET'])
+@require_admin
+@handle_exceptions
+def analytics_trends():
+    """Daily marks with rolling 7 and 30 day present rates"""
+    days = min(max(request.args.get('days', 90, type=int), 1), current_app.config['ANALYTICS_MAX_TREND_DAYS'])
+    
+    result = analytics_for(request.args)
+    return api_response(
+        'Attendance trends',
+        {**result.aggregator.trends((7, 30), days), 'scan': result.meta()},
+        status_code=200
+    )
+
+@admin_bp.route('/analytics/weekdays', methods=['GET'])
+@require_admin
+@handle_exceptions
+def analytics_weekdays():
+    """Attendance rates by day of the week"""
+    result = analytics_for(request.args)
+    return api_response(
+        'Attendance by weekday',
+        {**result.aggregator.weekdays(), 'scan': result.meta()},
+        status_code=200
+    )
+
+@admin_bp.route('/admission', methods=['GET'])
+@require_admin
+@handle_exceptions
+def admission_stats():
+    """Admission control counters for this worker (admitted, rate limited, shed)"""
+    return api_response('Admission stats', admission.stats(), status_code=200)
+
+@admin_bp.route('/profiles', methods=['GET'])
+@require_admin
+@handle_exceptions
+def list_profiles():
+    """Stored request profiles, newest first (see profiling.py)"""
+    limit = min(request.args.get('limit', 50, type=int), current_app.config['PROFILE_MAX_FILES'])
+    directory = current_app.config['PROFILE_DIR']
+    profiles = []
+    for profile_id in profiling.list_ids(directory)[:limit]:
+        metadata = profiling.load_metadata(directory, profile_id)
+        if metadata:
+            metadata.pop('sql', None)
+            profiles.append(metadata)
+    
+    return api_response(
+        'Profiles retrieved',
+        {'profiles': profiles, 'enabled': current_app.config['PROFILING_ENABLED']},
+        status_code=200
+    )
+
+@admin_bp.route('/profiles/<profile_id>', methods=['GET'])
+@require_admin
+@handle_exceptions
+def get_profile(profile_id):
+    """One profile's request details and SQL totals"""
+    metadata = profiling.load_metadata(current_app.config['PROFILE_DIR'], profile_id)
+    
+    if not metadata:
+        return api_response('Profile not found', status_code=404)
+    
+    return api_response('Profile retrieved', metadata, status_code=200)
+
+@admin_bp.route('/profiles/<profile_id>/folded', methods=['GET'])
+@require_admin
+@handle_exceptions
+def download_profile(profile_id):
+    """Collapsed stacks for flamegraph.pl or speedscope"""
+    path = profiling.folded_path(current_app.config['PROFILE_DIR'], profile_id)
+    
+    if not path:
+        return api_response('Profile not found', status_code=404)
+    
+    return send_file(
+        path,
+        mimetype='text/plain',
+        as_attachment=True,
+        download_name=f'{profile_id}.folded',
+    )
@@ -2,22 +2,28 @@
 Attendance tracking routes (Teacher only)
 """
 from flask import Blueprint, request
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required
 from datetime import datetime, date
 from models import db, Attendance, Student, Course, Teacher, Enrollment, User, UserRole
-from auth import require_teacher
+from auth import require_teacher, load_principal
 from utils import api_response, handle_exceptions
+from idempotency import idempotent
+import write_behind
+import roster_events
+import sharding
+import readers
+from delta_sync import sync_window, initial_watermark, record_deletion, EXPIRED_MESSAGE
+from fieldsets import requested_fields
 
 attendance_bp = Blueprint('attendance', __name__, url_prefix='/api/attendance')
 
 @attendance_bp.route('', methods=['POST'])
 @require_teacher
+@idempotent
 @handle_exceptions
 def mark_attendance():
     """Mark attendance for students in a course"""
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    teacher = Teacher.query.filter_by(user_id=current_user_id).first()
+    teacher = load_principal().teacher
     
     if not teacher:
         return api_response('Teacher profile not found', status_code=404)
@@ -38,8 +44,24 @@ def mark_attendance():
     if course.teacher_id != teacher.id:
         return api_response('Unauthorized to mark attendance for this course', status_code=403)
     
+    # Deferred mode: validate, journal and acknowledge; a flusher writes later
+    if write_behind.wants_async():
+        records, errors = write_behind.validate_records(course.id, data['attendance_records'])
+        if not records:
+            return api_response('No valid attendance records', {'errors': errors}, status_code=400)
+        ticket_id = write_behind.enqueue(teacher.user_id, course.id, teacher.id, records)
+        response_data = {
+            'ticket_id': ticket_id,
+            'queued_count': len(records),
+            'status_url': f'/api/attendance/tickets/{ticket_id}',
+        }
+        if errors:
+            response_data['errors'] = errors
+        return api_response('Attendance queued', response_data, status_code=202)
+    
     attendance_records = []
     errors = []
+    session = sharding.session_for(course.id)
     
     for record in data['attendance_records']:
         try:
@@ -73,7 +95,7 @@ def mark_attendance():
             # Check if attendance already exists for this date
             attendance_date = datetime.fromisoformat(record.get('attendance_date', datetime.now().isoformat())).date()
             
-            existing = Attendance.query.filter_by(
+            existing = session.query(Attendance).filter_by(
                 student_id=record['student_id'],
                 course_id=data['course_id'],
                 attendance_date=attendance_date
@@ -83,6 +105,8 @@ def mark_attendance():
                 # Update existing record
                 existing.status = record['status']
                 existing.remarks = record.get('remarks', '')
+                # Remarks live in a side table; make ?since= see the change
+                existing.updated_at = datetime.utcnow()
                 attendance_records.append(existing)
             else:
                 # Create new record
@@ -94,18 +118,23 @@ def mark_attendance():
                     status=record['status'],
                     remarks=record.get('remarks', '')
                 )
-                db.session.add(attendance)
+                session.add(attendance)
                 attendance_records.append(attendance)
         
         except Exception as e:
             errors.append(f"Error processing record: {str(e)}")
     
-    db.session.commit()
+    sharding.commit(session)
+    sharding.attach_related(attendance_records)
     
     response_data = {
         'marked_count': len(attendance_records),
         'records': [record.to_dict() for record in attendance_records],
     }
+    roster_events.publish(course.id, [
+        roster_events.attendance_delta(r['id'], r['student_id'], r['attendance_date'], r['status'], r['remarks'])
+        for r in response_data['records']
+    ])
     
     if errors:
         response_data['errors'] = errors
@@ -116,13 +145,25 @@ def mark_attendance():
         status_code=201 if not errors else 207
     )
 
+@attendance_bp.route('/tickets/<ticket_id>', methods=['GET'])
+@require_teacher
+@handle_exceptions
+def get_attendance_ticket(ticket_id):
+    """Status of an attendance submission queued with ?async=1"""
+    ticket = write_behind.journal().get(ticket_id)
+    
+    if not ticket or ticket['owner_user_id'] != load_principal().id:
+        return api_response('Ticket not found', status_code=404)
+    
+    del ticket['owner_user_id']
+    return api_response('Ticket status', ticket, status_code=200)
+
 @attendance_bp.route('/course/<course_id>', methods=['GET'])
 @require_teacher
 @handle_exceptions
 def get_course_attendance(course_id):
-    """Get attendance records for a course"""
-    current_user_id = get_jwt_identity()
-    teacher = Teacher.query.filter_by(user_id=current_user_id).first()
+    """Get attendance records for a course, or with ?since= only the changes"""
+    teacher = load_principal().teacher
     
     course = Course.query.get(course_id)
     
@@ -138,39 +179,91 @@ def get_course_attendance(course_id):
     from_date = request.args.get('from_date', None, type=str)
     to_date = request.args.get('to_date', None, type=str)
     
-    query = Attendance.query.filter_by(course_id=course_id)
+    session = sharding.session_for(course.id)
+    query = session.query(Attendance).filter_by(course_id=course.id)
+    conditions = [readers.attendance.c.course_id == course.id]
     
     if from_date:
         from_date_obj = datetime.fromisoformat(from_date).date()
         query = query.filter(Attendance.attendance_date >= from_date_obj)
+        conditions.append(readers.attendance.c.attendance_date >= from_date_obj)
     
     if to_date:
         to_date_obj = datetime.fromisoformat(to_date).date()
         query = query.filter(Attendance.attendance_date <= to_date_obj)
-    
-    total = query.count()
-    records = query.offset((page - 1) * per_page).limit(per_page).all()
+        conditions.append(readers.attendance.c.attendance_date <= to_date_obj)
+    
+    fields = requested_fields(Attendance)
+    
+    window = sync_window()
+    if window:
+        if window.expired:
+            return api_response(EXPIRED_MESSAGE, status_code=410)
+        records = window.rows(query.options(*sharding.load_options(fields, columns=('updated_at',))), Attendance)
+        sharding.attach_related(records, fields)
+        return api_response(
+            'Attendance changes retrieved',
+            window.response(
+                [record.to_dict(fields) for record in records],
+                window.deleted('attendance', course.id),
+            ),
+            status_code=200
+        )
+    
+    watermark = initial_watermark()
+    # Student and course names are on the main database when sharded
+    remote = sharding.enabled()
+    total, records = readers.ATTENDANCE.page(session.connection(), conditions, page, per_page, fields, remote)
+    if remote:
+        readers.ATTENDANCE.resolve(db.session.connection(), records, fields)
     
     return api_response(
         'Attendance records retrieved',
         {
-            'records': [record.to_dict() for record in records],
+            'records': records,
             'total': total,
             'page': page,
             'per_page': per_page,
-            'pages': (total + per_page - 1) // per_page
+            'pages': (total + per_page - 1) // per_page,
+            'watermark': watermark,
         },
         status_code=200
     )
 
 
+@attendance_bp.route('/course/<course_id>/stream', methods=['GET'])
+@require_teacher
+@handle_exceptions
+def stream_course_attendance(course_id):
+    """Server-sent events with the attendance rows of a course as they change
+
+    Optional ?date=YYYY-MM-DD limits the stream to one day's roster.
+    """
+    teacher = load_principal().teacher
+    
+    course = Course.query.get(course_id)
+    
+    if not course:
+        return api_response('Course not found', status_code=404)
+    
+    if course.teacher_id != teacher.id:
+        return api_response('Unauthorized to view attendance', status_code=403)
+    
+    attendance_date = request.args.get('date')
+    if attendance_date:
+        attendance_date = date.fromisoformat(attendance_date).isoformat()
+    
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    last_event_id = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+    
+    return roster_events.stream_response(course.id, last_event_id, attendance_date)
+
 @attendance_bp.route('/course/<course_id>/today', methods=['GET'])
 @require_teacher
 @handle_exceptions
 def get_course_today_attendance(course_id):
     """Get list of enrolled students for a course and attendance for a given date (defaults to today)"""
-    current_user_id = get_jwt_identity()
-    teacher = Teacher.query.filter_by(user_id=current_user_id).first()
+    teacher = load_principal().teacher
 
     course = Course.query.get(course_id)
     if not course:
@@ -197,10 +290,11 @@ def get_course_today_attendance(course_id):
     total = len(enrollments)
     paginated_enrollments = enrollments[(page-1)*per_page:page*per_page]
     
+    session = sharding.session_for(course.id)
     students = []
     for enrollment in paginated_enrollments:
         student = enrollment.student
-        existing = Attendance.query.filter_by(
+        existing = session.query(Attendance).filter_by(
             student_id=student.id,
             course_id=course_id,
             attendance_date=today
@@ -231,8 +325,7 @@ def get_course_today_attendance(course_id):
 @handle_exceptions
 def get_student_attendance(student_id):
     """Get attendance records for a student"""
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
+    user = load_principal().user
     
     student = Student.query.get(student_id)
     
@@ -240,25 +333,50 @@ def get_student_attendance(student_id):
         return api_response('Student not found', status_code=404)
     
     # Check authorization - student can only see their own records
-    if user.role == UserRole.STUDENT.value and student.user_id != current_user_id:
+    if user.role == UserRole.STUDENT.value and student.user_id != user.id:
         return api_response('Unauthorized to view attendance', status_code=403)
     
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 50, type=int)
     course_id = request.args.get('course_id', None, type=str)
-    
-    query = Attendance.query.filter_by(student_id=student_id)
-    
-    if course_id:
-        query = query.filter_by(course_id=course_id)
-    
-    total = query.count()
-    records = query.offset((page - 1) * per_page).limit(per_page).all()
-    
-    # Calculate statistics
-    present_count = Attendance.query.filter_by(student_id=student_id, status='present').count()
-    absent_count = Attendance.query.filter_by(student_id=student_id, status='absent').count()
-    late_count = Attendance.query.filter_by(student_id=student_id, status='late').count()
+    fields = requested_fields(Attendance)
+    
+    offset = (page - 1) * per_page
+    shard_offset, shard_limit = sharding.page_bounds(offset, per_page, course_id)
+    # The merge orders on the date, so it is loaded whatever ?fields= says
+    options = sharding.load_options(fields, columns=('attendance_date',))
+    
+    def read(session):
+        query = session.query(Attendance).filter_by(student_id=student_id)
+        if course_id:
+            query = query.filter_by(course_id=course_id)
+        records = (
+            query.options(*options)
+            .order_by(Attendance.attendance_date.desc(), Attendance.id.desc())
+            .offset(shard_offset).limit(shard_limit)
+            .all()
+        )
+        # Statistics: one pass grouped on the status code, same filter as the records
+        counts = query.with_entities(Attendance.status, db.func.count()).group_by(Attendance.status).all()
+        return records, counts
+    
+    # A student's attendance is spread over every course's shard
+    results = sharding.fan_out(read, course_id)
+    records = sharding.merge_page(
+        [shard_records for shard_records, _ in results],
+        key=lambda record: (record.attendance_date, record.id),
+        offset=offset, limit=per_page, reverse=True,
+    )
+    sharding.attach_related(records, fields)
+    
+    counts = {}
+    for _, shard_counts in results:
+        for status, count in shard_counts:
+            counts[status] = counts.get(status, 0) + count
+    total = sum(counts.values())
+    present_count = counts.get('present', 0)
+    absent_count = counts.get('absent', 0)
+    late_count = counts.get('late', 0)
     total_classes = present_count + absent_count + late_count
     
     attendance_percentage = (present_count / total_classes * 100) if total_classes > 0 else 0
@@ -266,7 +384,7 @@ def get_student_attendance(student_id):
     return api_response(
         'Student attendance retrieved',
         {
-            'records': [record.to_dict() for record in records],
+            'records': [record.to_dict(fields) for record in records],
             'statistics': {
                 'total_classes': total_classes,
                 'present': present_count,
@@ -291,15 +409,14 @@ def get_student_monthly(student_id):
 
     Query params: year (int), month (1-12)
     """
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
+    user = load_principal().user
 
     student = Student.query.get(student_id)
     if not student:
         return api_response('Student not found', status_code=404)
 
     # Authorization: student can view own, teachers/admins can view
-    if user.role == UserRole.STUDENT.value and student.user_id != current_user_id:
+    if user.role == UserRole.STUDENT.value and student.user_id != user.id:
         return api_response('Unauthorized to view attendance', status_code=403)
 
     # Parse year/month
@@ -311,16 +428,29 @@ def get_student_monthly(student_id):
     from calendar import monthrange
     _, num_days = monthrange(year, month)
 
+    # The whole month in one range read per shard; the first mark of a day wins
+    def read(session):
+        return (
+            session.query(Attendance.attendance_date, Attendance.status)
+            .filter(
+                Attendance.student_id == student_id,
+                Attendance.attendance_date.between(date(year, month, 1), date(year, month, num_days)),
+            )
+            .order_by(Attendance.attendance_date, Attendance.id)
+            .all()
+        )
+    
+    marks = {}
+    for shard_marks in sharding.fan_out(read):
+        for day_date, status in shard_marks:
+            marks.setdefault(day_date, status)
+
     days = []
     values = []
     raw = []
     for d in range(1, num_days + 1):
         day_date = date(year, month, d)
-        rec = Attendance.query.filter_by(student_id=student_id, attendance_date=day_date).first()
-        if rec:
-            status = rec.status
-        else:
-            status = 'not_marked'
+        status = marks.get(day_date, 'not_marked')
 
         # numeric mapping for histogram: present=1, late=0.5, absent=0, not_marked=0
         mapping = {'present': 1, 'late': 0.5, 'absent': 0, 'not_marked': 0}
@@ -337,10 +467,9 @@ def get_student_monthly(student_id):
 @handle_exceptions
 def update_attendance(attendance_id):
     """Update an attendance record"""
-    current_user_id = get_jwt_identity()
-    teacher = Teacher.query.filter_by(user_id=current_user_id).first()
+    teacher = load_principal().teacher
     
-    attendance = Attendance.query.get(attendance_id)
+    session, attendance = sharding.get_attendance(attendance_id)
     
     if not attendance:
         return api_response('Attendance record not found', status_code=404)
@@ -359,20 +488,25 @@ def update_attendance(attendance_id):
     
     if 'remarks' in data:
         attendance.remarks = data['remarks']
+        attendance.updated_at = datetime.utcnow()
+    
+    sharding.commit(session)
     
-    db.session.commit()
+    record = sharding.attach_related([attendance])[0].to_dict()
+    roster_events.publish(record['course_id'], [roster_events.attendance_delta(
+        record['id'], record['student_id'], record['attendance_date'], record['status'], record['remarks']
+    )])
     
-    return api_response('Attendance updated', attendance.to_dict(), status_code=200)
+    return api_response('Attendance updated', record, status_code=200)
 
 @attendance_bp.route('/<attendance_id>', methods=['DELETE'])
 @require_teacher
 @handle_exceptions
 def delete_attendance(attendance_id):
     """Delete an attendance record"""
-    current_user_id = get_jwt_identity()
-    teacher = Teacher.query.filter_by(user_id=current_user_id).first()
+    teacher = load_principal().teacher
     
-    attendance = Attendance.query.get(attendance_id)
+    session, attendance = sharding.get_attendance(attendance_id)
     
     if not attendance:
         return api_response('Attendance record not found', status_code=404)
@@ -381,8 +515,12 @@ def delete_attendance(attendance_id):
     if attendance.teacher_id != teacher.id:
         return api_response('Unauthorized to delete this record', status_code=403)
     
-    db.session.delete(attendance)
-    db.session.commit()
+    deleted = roster_events.attendance_delta(attendance.id, attendance.student_id, attendance.attendance_date)
+    course_id = attendance.course_id
+    record_deletion('attendance', attendance.id, course_id)
+    session.delete(attendance)
+    sharding.commit(session)
+    roster_events.publish(course_id, [deleted])
     
     return api_response('Attendance record deleted', status_code=200)
 
@@ -391,8 +529,7 @@ def delete_attendance(attendance_id):
 @handle_exceptions
 def get_attendance_summary(course_id):
     """Get attendance summary for a course"""
-    current_user_id = get_jwt_identity()
-    teacher = Teacher.query.filter_by(user_id=current_user_id).first()
+    teacher = load_principal().teacher
     
     course = Course.query.get(course_id)
     
@@ -406,32 +543,26 @@ def get_attendance_summary(course_id):
     # Get all enrolled students
     enrollments = Enrollment.query.filter_by(course_id=course_id, is_active=True).all()
     
+    # Per-student counts for the whole course, grouped on the status code
+    counts = {}
+    rows = (
+        sharding.session_for(course.id).query(Attendance.student_id, Attendance.status, db.func.count())
+        .filter(Attendance.course_id == course_id)
+        .group_by(Attendance.student_id, Attendance.status)
+        .all()
+    )
+    for student_id, status, count in rows:
+        counts.setdefault(student_id, {})[status] = count
+    
     summary = []
     for enrollment in enrollments:
         student = enrollment.student
+        student_counts = counts.get(student.id, {})
         
-        total_classes = Attendance.query.filter_by(
-            student_id=student.id,
-            course_id=course_id
-        ).count()
-        
-        present = Attendance.query.filter_by(
-            student_id=student.id,
-            course_id=course_id,
-            status='present'
-        ).count()
-        
-        absent = Attendance.query.filter_by(
-            student_id=student.id,
-            course_id=course_id,
-            status='absent'
-        ).count()
-        
-        late = Attendance.query.filter_by(
-            student_id=student.id,
-            course_id=course_id,
-            status='late'
-        ).count()
+        total_classes = sum(student_counts.values())
+        present = student_counts.get('present', 0)
+        absent = student_counts.get('absent', 0)
+        late = student_counts.get('late', 0)
         
         percentage = (present / total_classes * 100) if total_classes > 0 else 0
         
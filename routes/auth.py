@@ -2,14 +2,20 @@
 Authentication routes for user login and token refresh
 """
 from flask import Blueprint, request
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required, get_jwt, decode_token
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt.exceptions import PyJWTError
 from models import db, User, Student, Teacher, UserRole
-from auth import hash_password, verify_password, generate_tokens
+from auth import hash_password, verify_password, generate_tokens, load_principal
 from utils import api_response, handle_exceptions, validate_email
+from search_index import index_user
+from revocation import revoke_token
+from idempotency import idempotent
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/api/auth')
 
 @auth_bp.route('/register', methods=['POST'])
+@idempotent
 @handle_exceptions
 def register():
     """Register a new user"""
@@ -67,6 +73,7 @@ def register():
         db.session.add(teacher)
     
     db.session.commit()
+    index_user(user.id)
     
     tokens = generate_tokens(user.id, user.role)
     return api_response(
@@ -104,32 +111,54 @@ def login():
 @handle_exceptions
 def get_current_user():
     """Get current user information"""
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
+    principal = load_principal()
     
-    if not user:
+    if not principal:
         return api_response('User not found', status_code=404)
     
-    user_data = user.to_dict()
+    user_data = principal.user.to_dict()
     
     # Add role-specific data
-    if user.role == UserRole.STUDENT.value and user.student:
-        user_data['student'] = user.student.to_dict()
-    elif user.role == UserRole.TEACHER.value and user.teacher:
-        user_data['teacher'] = user.teacher.to_dict()
+    if principal.role == UserRole.STUDENT.value and principal.student:
+        user_data['student'] = principal.student.to_dict()
+    elif principal.role == UserRole.TEACHER.value and principal.teacher:
+        user_data['teacher'] = principal.teacher.to_dict()
     
     return api_response('Current user', user_data, status_code=200)
 
+@auth_bp.route('/logout', methods=['POST'])
+@jwt_required()
+@handle_exceptions
+def logout():
+    """Revoke the current access token (and the refresh token, if supplied)"""
+    data = request.get_json(silent=True) or {}
+    refresh_token = None
+    if data.get('refresh_token'):
+        # Checked before anything is revoked, so a bad request changes nothing
+        try:
+            refresh_token = decode_token(str(data['refresh_token']))
+        except (PyJWTError, JWTExtendedException):
+            return api_response('Invalid refresh token', status_code=400)
+        if refresh_token.get('type') != 'refresh':
+            return api_response('Invalid refresh token', status_code=400)
+        if refresh_token['sub'] != get_jwt()['sub']:
+            return api_response('Refresh token belongs to another user', status_code=400)
+    
+    revoke_token(get_jwt())
+    if refresh_token:
+        revoke_token(refresh_token)
+    
+    return api_response('Logged out', status_code=200)
+
 @auth_bp.route('/refresh', methods=['POST'])
 @jwt_required(refresh=True)
 @handle_exceptions
 def refresh():
     """Refresh access token"""
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
+    principal = load_principal()
     
-    if not user:
+    if not principal:
         return api_response('User not found', status_code=404)
     
-    tokens = generate_tokens(user.id, user.role)
+    tokens = generate_tokens(principal.id, principal.role)
     return api_response('Token refreshed', tokens, status_code=200)
@@ -0,0 +1,125 @@
+"""
+Batch route: several API calls in one round trip
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Blueprint, current_app, request
+from flask_jwt_extended import jwt_required
+
+from admission import pool_saturated
+from models import db
+from utils import api_response, handle_exceptions, SUBREQUEST_ENVIRON_KEY
+
+batch_bp = Blueprint('batch', __name__, url_prefix='/api/batch')
+
+# Sub-request headers taken from the batch request unless overridden
+FORWARDED_HEADERS = ('Authorization', 'Accept-Language', 'User-Agent')
+
+
+def _run(app, sub, headers, remote_addr):
+    """Dispatch one sub-request through the normal request pipeline
+
+    Runs in the caller's app context when there is one, so it shares the
+    batch request's g (resolved principal) and scoped DB session.
+    """
+    environ = {SUBREQUEST_ENVIRON_KEY: True, 'REMOTE_ADDR': remote_addr}
+    with app.test_request_context(
+        sub['path'], method=sub['method'], headers=headers, json=sub.get('body'), environ_overrides=environ,
+    ):
+        try:
+            response = app.full_dispatch_request()
+        except Exception as e:
+            db.session.rollback()
+            return {'id': sub.get('id'), 'status': 500, 'body': {'success': False, 'message': f'An error occurred: {e}'}}
+
+        if response.is_streamed:
+            response.close()
+            return {'id': sub.get('id'), 'status': 400, 'body': {'success': False, 'message': 'Streaming endpoints cannot be batched'}}
+        if response.status_code >= 400:
+            # Do not let a refused or failed sub-request's uncommitted writes
+            # ride along with the next one's commit
+            db.session.rollback()
+
+        result = {'id': sub.get('id'), 'status': response.status_code}
+        body = response.get_json(silent=True)
+        result['body'] = body if body is not None else response.get_data(as_text=True)
+        if 'Retry-After' in response.headers:
+            result['retry_after'] = response.headers['Retry-After']
+        return result
+
+
+def _run_isolated(app, sub, headers, remote_addr):
+    """_run in a fresh app context (own session and g) for a worker thread"""
+    with app.app_context():
+        return _run(app, sub, headers, remote_addr)
+
+
+def _validate(sub, index):
+    if not isinstance(sub, dict):
+        raise ValueError(f'Request {index}: must be an object')
+    path = sub.get('path')
+    if not isinstance(path, str) or not path.startswith('/api/'):
+        raise ValueError(f'Request {index}: path must start with /api/')
+    if path.split('?')[0].rstrip('/') == batch_bp.url_prefix:
+        raise ValueError(f'Request {index}: batches cannot be nested')
+    method = str(sub.get('method', 'GET')).upper()
+    if method not in ('GET', 'POST', 'PUT', 'DELETE'):
+        raise ValueError(f'Request {index}: unsupported method {method}')
+    if sub.get('headers') is not None and not isinstance(sub['headers'], dict):
+        raise ValueError(f'Request {index}: headers must be an object')
+    return dict(sub, method=method)
+
+
+@batch_bp.route('', methods=['POST'])
+@jwt_required()
+@handle_exceptions
+def run_batch():
+    """Run a list of sub-requests and return all their responses
+
+    Body: {"requests": [{"id", "method", "path", "body", "headers"}, ...],
+           "parallel": false}
+    Sub-requests run in order in this request's context, sharing its
+    authentication and database session. With "parallel": true, runs of
+    consecutive GETs are executed concurrently, each on its own connection.
+    """
+    data = request.get_json() or {}
+    subs = data.get('requests')
+    if not isinstance(subs, list) or not subs:
+        return api_response('requests must be a non-empty list', status_code=400)
+    max_requests = current_app.config['BATCH_MAX_REQUESTS']
+    if len(subs) > max_requests:
+        return api_response(f'At most {max_requests} requests per batch', status_code=400)
+    subs = [_validate(sub, index) for index, sub in enumerate(subs)]
+
+    app = current_app._get_current_object()
+    remote_addr = request.remote_addr
+    base_headers = {name: request.headers[name] for name in FORWARDED_HEADERS if name in request.headers}
+
+    def headers_for(sub):
+        headers = dict(base_headers)
+        headers.update({str(k): str(v) for k, v in (sub.get('headers') or {}).items()})
+        return headers
+
+    max_parallel = current_app.config['BATCH_MAX_PARALLEL']
+    parallel = bool(data.get('parallel')) and max_parallel > 1
+
+    results = []
+    index = 0
+    while index < len(subs):
+        # A run of consecutive reads can go in parallel; writes keep their order
+        end = index + 1
+        if parallel and subs[index]['method'] == 'GET':
+            while end < len(subs) and subs[end]['method'] == 'GET':
+                end += 1
+        group = subs[index:end]
+
+        if len(group) > 1 and not pool_saturated():
+            with ThreadPoolExecutor(max_workers=min(max_parallel, len(group))) as executor:
+                results.extend(executor.map(
+                    lambda sub: _run_isolated(app, sub, headers_for(sub), remote_addr), group
+                ))
+        else:
+            results.extend(_run(app, sub, headers_for(sub), remote_addr) for sub in group)
+        index = end
+
+    return api_response('Batch processed', {'responses': results}, status_code=200)
@@ -1,11 +1,20 @@
 """
 Course management routes
 """
-from flask import Blueprint, request
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import db, Course, Teacher, Enrollment, User, UserRole, Student
-from auth import require_admin, require_teacher
+from datetime import datetime
+import uuid
+from flask import Blueprint, request, current_app
+from flask_jwt_extended import jwt_required
+from sqlalchemy.orm import joinedload
+from db_types import uuid7
+from models import db, Course, Teacher, Enrollment, User, UserRole, Student, WaitlistEntry
+from auth import require_admin, require_teacher, load_principal
 from utils import api_response, handle_exceptions
+from idempotency import idempotent
+import waitlist
+import readers
+from delta_sync import sync_window, initial_watermark, EXPIRED_MESSAGE
+from fieldsets import requested_fields, load_options
 
 course_bp = Blueprint('course', __name__, url_prefix='/api/courses')
 
@@ -13,27 +22,46 @@ course_bp = Blueprint('course', __name__, url_prefix='/api/courses')
 @jwt_required()
 @handle_exceptions
 def list_courses():
-    """List all active courses"""
+    """List all active courses, or with ?since= only those changed"""
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 20, type=int)
     teacher_id = request.args.get('teacher_id', None, type=str)
-    
-    query = Course.query.filter_by(is_active=True)
+    fields = requested_fields(Course)
+    
+    window = sync_window()
+    if window:
+        if window.expired:
+            return api_response(EXPIRED_MESSAGE, status_code=410)
+        query = Course.query.options(*load_options(Course, fields, columns=('is_active', 'updated_at')))
+        if teacher_id:
+            query = query.filter_by(teacher_id=teacher_id)
+        courses = window.rows(query, Course)
+        return api_response(
+            'Course changes retrieved',
+            window.response(
+                [course.to_dict(fields) for course in courses if course.is_active],
+                [course.id for course in courses if not course.is_active],
+            ),
+            status_code=200
+        )
+    
+    watermark = initial_watermark()
+    conditions = [readers.courses.c.is_active == True]
     
     if teacher_id:
-        query = query.filter_by(teacher_id=teacher_id)
+        conditions.append(readers.courses.c.teacher_id == teacher_id)
     
-    total = query.count()
-    courses = query.offset((page - 1) * per_page).limit(per_page).all()
+    total, courses = readers.COURSES.page(db.session.connection(), conditions, page, per_page, fields)
     
     return api_response(
         'Courses retrieved',
         {
-            'courses': [course.to_dict() for course in courses],
+            'courses': courses,
             'total': total,
             'page': page,
             'per_page': per_page,
-            'pages': (total + per_page - 1) // per_page
+            'pages': (total + per_page - 1) // per_page,
+            'watermark': watermark,
         },
         status_code=200
     )
@@ -42,25 +70,48 @@ def list_courses():
 @jwt_required()
 @handle_exceptions
 def get_course(course_id):
-    """Get course details with enrolled students"""
-    course = Course.query.get(course_id)
+    """Get course details with enrolled students
+
+    With ?since= the enrollments changed since then come back as `changed`
+    and the student ids of those unenrolled as `deleted`.
+    """
+    fields = requested_fields(Course)
+    # The enrolled_students count is replaced by the list below
+    course_fields = (fields or set(Course.DICT_FIELDS)) - {'enrolled_students'}
+    
+    course = Course.query.options(*load_options(Course, course_fields)).filter_by(id=course_id).first()
     
     if not course:
         return api_response('Course not found', status_code=404)
     
-    course_data = course.to_dict()
+    course_data = course.to_dict(course_fields)
     
-    # Add enrolled students
-    enrollments = Enrollment.query.filter_by(course_id=course_id, is_active=True).all()
-    course_data['enrolled_students'] = [
-        {
+    def enrolled_student(enrollment):
+        return {
             'student_id': enrollment.student_id,
             'student_name': f"{enrollment.student.user.first_name} {enrollment.student.user.last_name}",
             'roll_number': enrollment.student.roll_number,
             'enrollment_date': enrollment.enrollment_date.isoformat()
         }
-        for enrollment in enrollments
-    ]
+    
+    window = sync_window()
+    if window:
+        if window.expired:
+            return api_response(EXPIRED_MESSAGE, status_code=410)
+        enrollments = window.rows(Enrollment.query.filter_by(course_id=course_id), Enrollment)
+        data = window.response(
+            [enrolled_student(enrollment) for enrollment in enrollments if enrollment.is_active],
+            [enrollment.student_id for enrollment in enrollments if not enrollment.is_active],
+        )
+        data['course'] = course_data
+        return api_response('Enrollment changes retrieved', data, status_code=200)
+    
+    course_data['watermark'] = initial_watermark()
+    
+    # Add enrolled students
+    if fields is None or 'enrolled_students' in fields:
+        enrollments = Enrollment.query.filter_by(course_id=course_id, is_active=True).all()
+        course_data['enrolled_students'] = [enrolled_student(enrollment) for enrollment in enrollments]
     
     return api_response('Course retrieved', course_data, status_code=200)
 
@@ -69,13 +120,13 @@ def get_course(course_id):
 @handle_exceptions
 def create_course():
     """Create a new course (teacher only)"""
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
+    principal = load_principal()
+    user = principal.user
     
     if user.role != UserRole.TEACHER.value:
         return api_response('Only teachers can create courses', status_code=403)
     
-    teacher = Teacher.query.filter_by(user_id=current_user_id).first()
+    teacher = principal.teacher
     if not teacher:
         return api_response('Teacher profile not found', status_code=404)
     
@@ -114,17 +165,18 @@ def create_course():
 @handle_exceptions
 def update_course(course_id):
     """Update course (teacher can only update their own courses)"""
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
+    principal = load_principal()
+    user = principal.user
     
-    course = Course.query.get(course_id)
+    # Locked: a larger max_students promotes from the waitlist
+    course = waitlist.lock_course(course_id)
     
     if not course:
         return api_response('Course not found', status_code=404)
     
     # Check authorization
     if user.role == UserRole.TEACHER.value:
-        teacher = Teacher.query.filter_by(user_id=current_user_id).first()
+        teacher = principal.teacher
         if course.teacher_id != teacher.id:
             return api_response('Unauthorized to update this course', status_code=403)
     elif user.role != UserRole.ADMIN.value:
@@ -145,6 +197,7 @@ def update_course(course_id):
     if 'is_active' in data:
         course.is_active = data['is_active']
     
+    waitlist.promote(course)
     db.session.commit()
     
     return api_response('Course updated', course.to_dict(), status_code=200)
@@ -154,8 +207,8 @@ def update_course(course_id):
 @handle_exceptions
 def delete_course(course_id):
     """Soft delete course"""
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
+    principal = load_principal()
+    user = principal.user
     
     course = Course.query.get(course_id)
     
@@ -164,7 +217,7 @@ def delete_course(course_id):
     
     # Check authorization
     if user.role == UserRole.TEACHER.value:
-        teacher = Teacher.query.filter_by(user_id=current_user_id).first()
+        teacher = principal.teacher
         if course.teacher_id != teacher.id:
             return api_response('Unauthorized to delete this course', status_code=403)
     elif user.role != UserRole.ADMIN.value:
@@ -177,16 +230,18 @@ def delete_course(course_id):
 
 @course_bp.route('/<course_id>/enroll', methods=['POST'])
 @jwt_required()
+@idempotent
 @handle_exceptions
 def enroll_student(course_id):
-    """Enroll student in a course"""
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
+    """Enroll student in a course, or join its waitlist when it is full"""
+    principal = load_principal()
+    user = principal.user
     
     if user.role != UserRole.STUDENT.value:
         return api_response('Only students can enroll', status_code=403)
     
-    course = Course.query.get(course_id)
+    # Locked until commit, so the capacity check below cannot go stale
+    course = waitlist.lock_course(course_id)
     
     if not course:
         return api_response('Course not found', status_code=404)
@@ -194,31 +249,32 @@ def enroll_student(course_id):
     if not course.is_active:
         return api_response('Course is not active', status_code=400)
     
-    student = Student.query.filter_by(user_id=current_user_id).first()
+    student = principal.student
     
-    # Check if already enrolled
+    # Check if already enrolled (locking read, like the checks below)
     existing = Enrollment.query.filter_by(
         student_id=student.id,
-        course_id=course_id
-    ).first()
+        course_id=course.id
+    ).with_for_update().populate_existing().first()
     
-    if existing:
-        if existing.is_active:
-            return api_response('Already enrolled in this course', status_code=409)
-        else:
-            # Re-activate enrollment
-            existing.is_active = True
-            db.session.commit()
-            return api_response('Re-enrolled in course', existing.to_dict(), status_code=200)
+    if existing and existing.is_active:
+        return api_response('Already enrolled in this course', status_code=409)
+    
+    entry = waitlist.entry_for(course.id, student.id, locked=True)
+    if entry:
+        return api_response('Already on the waitlist', waitlist.status(entry), status_code=409)
     
     # Check capacity
-    active_enrollments = Enrollment.query.filter_by(
-        course_id=course_id,
-        is_active=True
-    ).count()
+    if waitlist.seats_taken(course.id) >= course.max_students:
+        entry = waitlist.join(course.id, student.id)
+        db.session.commit()
+        return api_response('Course is full, added to the waitlist', waitlist.status(entry), status_code=202)
     
-    if active_enrollments >= course.max_students:
-        return api_response('Course is at full capacity', status_code=400)
+    if existing:
+        # Re-activate enrollment
+        existing.is_active = True
+        db.session.commit()
+        return api_response('Re-enrolled in course', existing.to_dict(), status_code=200)
     
     enrollment = Enrollment(
         student_id=student.id,
@@ -234,29 +290,233 @@ def enroll_student(course_id):
         status_code=201
     )
 
+@course_bp.route('/<course_id>/enroll/bulk', methods=['POST'])
+@require_teacher
+@idempotent
+@handle_exceptions
+def bulk_enroll(course_id):
+    """Enroll a cohort (student ids and/or roll numbers) in one transaction
+    
+    All or nothing: if the new seats do not fit in max_students nobody is
+    enrolled. Students already enrolled are reported, not counted twice.
+    """
+    principal = load_principal()
+    
+    data = request.get_json() or {}
+    student_ids = data.get('student_ids') or []
+    roll_numbers = data.get('roll_numbers') or []
+    if not isinstance(student_ids, list) or not isinstance(roll_numbers, list):
+        return api_response('student_ids and roll_numbers must be lists', status_code=400)
+    if not student_ids and not roll_numbers:
+        return api_response('Provide student_ids or roll_numbers', status_code=400)
+    limit = current_app.config['BULK_ENROLL_MAX_STUDENTS']
+    if len(student_ids) + len(roll_numbers) > limit:
+        return api_response(f'At most {limit} students per request', status_code=400)
+    
+    # Locked like a single enrollment, so the capacity check holds until commit
+    course = waitlist.lock_course(course_id)
+    
+    if not course:
+        return api_response('Course not found', status_code=404)
+    
+    if principal.role != UserRole.ADMIN.value and course.teacher_id != principal.teacher.id:
+        return api_response('Unauthorized to enroll students in this course', status_code=403)
+    
+    if not course.is_active:
+        return api_response('Course is not active', status_code=400)
+    
+    # Resolve ids and roll numbers to active students with one query
+    valid_ids, not_found = set(), []
+    for value in student_ids:
+        try:
+            valid_ids.add(str(uuid.UUID(str(value))))
+        except ValueError:
+            not_found.append(value)
+    roll_numbers = {str(value) for value in roll_numbers}
+    conditions = []
+    if valid_ids:
+        conditions.append(Student.id.in_(valid_ids))
+    if roll_numbers:
+        conditions.append(Student.roll_number.in_(roll_numbers))
+    found = (
+        db.session.query(Student.id, Student.roll_number)
+        .filter(db.or_(*conditions), Student.is_active == True)
+        .all()
+    ) if conditions else []
+    not_found += sorted(valid_ids - {row.id for row in found})
+    not_found += sorted(roll_numbers - {row.roll_number for row in found})
+    students = {row.id for row in found}
+    
+    # Split into already enrolled, soft-deleted (reactivate) and new; locking
+    # reads, so they and the seat count see what was committed before the lock
+    current = {
+        row.student_id: row
+        for row in db.session.query(Enrollment.id, Enrollment.student_id, Enrollment.is_active).filter(
+            Enrollment.course_id == course.id,
+            Enrollment.student_id.in_(students),
+        ).with_for_update()
+    } if students else {}
+    already_enrolled = sorted(sid for sid, row in current.items() if row.is_active)
+    reactivate = [row.id for row in current.values() if not row.is_active]
+    new_students = sorted(students - current.keys())
+    
+    available = course.max_students - waitlist.seats_taken(course.id)
+    needed = len(reactivate) + len(new_students)
+    if needed > available:
+        return api_response(
+            'Not enough seats for this cohort',
+            {'requested': needed, 'available': max(available, 0), 'not_found': not_found},
+            status_code=409
+        )
+    
+    now = datetime.utcnow()
+    if reactivate:
+        db.session.execute(
+            db.update(Enrollment).where(Enrollment.id.in_(reactivate)).values(is_active=True, updated_at=now)
+        )
+    if new_students:
+        db.session.execute(db.insert(Enrollment), [
+            {
+                'id': str(uuid7()),
+                'student_id': student_id,
+                'course_id': course.id,
+                'enrollment_date': now,
+                'is_active': True,
+                'created_at': now,
+                'updated_at': now,
+            }
+            for student_id in new_students
+        ])
+    if needed:
+        # Enrolled now, so no longer waiting
+        waitlist.remove(course.id, WaitlistEntry.query.filter(
+            WaitlistEntry.course_id == course.id,
+            WaitlistEntry.student_id.in_(students),
+        ).with_for_update().populate_existing().all())
+    db.session.commit()
+    
+    return api_response(
+        'Cohort enrolled',
+        {
+            'enrolled_count': len(new_students),
+            'reactivated_count': len(reactivate),
+            'already_enrolled': already_enrolled,
+            'not_found': not_found,
+            'available_seats': available - needed,
+        },
+        status_code=200
+    )
+
 @course_bp.route('/<course_id>/unenroll', methods=['POST'])
 @jwt_required()
 @handle_exceptions
 def unenroll_student(course_id):
-    """Unenroll student from a course"""
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
+    """Unenroll student from a course; the freed seat goes to the head of the waitlist"""
+    principal = load_principal()
+    user = principal.user
     
     if user.role != UserRole.STUDENT.value:
         return api_response('Only students can unenroll', status_code=403)
     
-    student = Student.query.filter_by(user_id=current_user_id).first()
+    student = principal.student
+    
+    course = waitlist.lock_course(course_id)
+    
+    if not course:
+        return api_response('Course not found', status_code=404)
     
     enrollment = Enrollment.query.filter_by(
         student_id=student.id,
-        course_id=course_id,
+        course_id=course.id,
         is_active=True
-    ).first()
+    ).with_for_update().populate_existing().first()
     
     if not enrollment:
         return api_response('Not enrolled in this course', status_code=404)
     
     enrollment.is_active = False
+    promoted = waitlist.promote(course)
+    db.session.commit()
+    
+    return api_response('Unenrolled from course', {'promoted_from_waitlist': len(promoted)}, status_code=200)
+
+@course_bp.route('/<course_id>/waitlist', methods=['GET'])
+@require_teacher
+@handle_exceptions
+def get_waitlist(course_id):
+    """Waitlist of a course in promotion order (teacher of the course or admin)"""
+    principal = load_principal()
+    
+    course = Course.query.get(course_id)
+    
+    if not course:
+        return api_response('Course not found', status_code=404)
+    
+    if principal.role != UserRole.ADMIN.value and course.teacher_id != principal.teacher.id:
+        return api_response('Unauthorized to view this waitlist', status_code=403)
+    
+    page = request.args.get('page', 1, type=int)
+    per_page = request.args.get('per_page', 50, type=int)
+    
+    query = WaitlistEntry.query.filter_by(course_id=course.id)
+    total = query.count()
+    entries = (
+        query.options(joinedload(WaitlistEntry.student).joinedload(Student.user))
+        .order_by(WaitlistEntry.sequence)
+        .offset((page - 1) * per_page)
+        .limit(per_page)
+        .all()
+    )
+    
+    return api_response(
+        'Waitlist retrieved',
+        {
+            'entries': [
+                dict(
+                    entry.to_dict(),
+                    position=(page - 1) * per_page + index + 1,
+                    student_name=f"{entry.student.user.first_name} {entry.student.user.last_name}",
+                    roll_number=entry.student.roll_number,
+                )
+                for index, entry in enumerate(entries)
+            ],
+            'total': total,
+            'page': page,
+            'per_page': per_page,
+            'pages': (total + per_page - 1) // per_page,
+        },
+        status_code=200
+    )
+
+@course_bp.route('/<course_id>/waitlist/me', methods=['GET'])
+@jwt_required()
+@handle_exceptions
+def get_my_waitlist_position(course_id):
+    """The caller's place on a course's waitlist"""
+    student = load_principal().student
+    
+    entry = waitlist.entry_for(course_id, student.id) if student else None
+    
+    if not entry:
+        return api_response('Not on the waitlist', status_code=404)
+    
+    return api_response('Waitlist position', waitlist.status(entry), status_code=200)
+
+@course_bp.route('/<course_id>/waitlist/me', methods=['DELETE'])
+@jwt_required()
+@handle_exceptions
+def leave_waitlist(course_id):
+    """Leave a course's waitlist"""
+    student = load_principal().student
+    
+    # The entries behind move up, under the same lock as joins and promotions
+    course = waitlist.lock_course(course_id) if student else None
+    entry = waitlist.entry_for(course.id, student.id, locked=True) if course else None
+    
+    if not entry:
+        return api_response('Not on the waitlist', status_code=404)
+    
+    waitlist.remove(course.id, [entry])
     db.session.commit()
     
-    return api_response('Unenrolled from course', status_code=200)
+    return api_response('Left the waitlist', status_code=200)
@@ -0,0 +1,132 @@
+"""
+Background job routes: submit reports, poll progress, download, cancel
+"""
+import os
+
+from flask import Blueprint, current_app, request, send_file
+from flask_jwt_extended import jwt_required
+from auth import load_principal
+from utils import api_response, handle_exceptions
+from idempotency import idempotent
+from jobs import job_queue, public_job
+from reports import REPORT_KINDS
+
+jobs_bp = Blueprint('jobs', __name__, url_prefix='/api/jobs')
+
+
+def _owned_job(job_id):
+    """The caller's job, or None (other users' jobs look missing)"""
+    job = job_queue().get(job_id)
+    principal = load_principal()
+    if not job or not principal or job['owner_user_id'] != principal.id:
+        return None
+    return job
+
+
+@jobs_bp.route('/kinds', methods=['GET'])
+@jwt_required()
+@handle_exceptions
+def list_job_kinds():
+    """Report kinds the caller may submit"""
+    principal = load_principal()
+    role = principal.role if principal else None
+    kinds = [
+        {'kind': name, 'description': kind.description}
+        for name, kind in REPORT_KINDS.items() if role in kind.roles
+    ]
+    return api_response('Job kinds', kinds, status_code=200)
+
+
+@jobs_bp.route('', methods=['POST'])
+@jwt_required()
+@idempotent
+@handle_exceptions
+def create_job():
+    """Queue a report; body {"kind": ..., "params": {...}}"""
+    principal = load_principal()
+    if not principal:
+        return api_response('User not found', status_code=404)
+
+    data = request.get_json() or {}
+    kind = REPORT_KINDS.get(data.get('kind'))
+    if not kind:
+        return api_response(f"kind must be one of: {', '.join(REPORT_KINDS)}", status_code=400)
+    if principal.role not in kind.roles:
+        return api_response('Insufficient permissions', status_code=403)
+
+    params = data.get('params') or {}
+    if not isinstance(params, dict):
+        return api_response('params must be an object', status_code=400)
+    params = kind.validate(params, principal)
+
+    queue = job_queue()
+    if queue.active_count(principal.id) >= current_app.config['JOB_MAX_ACTIVE_PER_USER']:
+        return api_response('Too many unfinished jobs; wait for one to finish or cancel it', status_code=429)
+
+    job_id = queue.enqueue(principal.id, data['kind'], params)
+    return api_response('Job queued', public_job(queue.get(job_id)), status_code=202)
+
+
+@jobs_bp.route('', methods=['GET'])
+@jwt_required()
+@handle_exceptions
+def list_jobs():
+    """The caller's most recent jobs, newest first"""
+    principal = load_principal()
+    if not principal:
+        return api_response('User not found', status_code=404)
+
+    limit = min(request.args.get('limit', 20, type=int), 100)
+    jobs = job_queue().for_owner(principal.id, limit)
+    return api_response('Jobs retrieved', [public_job(job) for job in jobs], status_code=200)
+
+
+@jobs_bp.route('/<job_id>', methods=['GET'])
+@jwt_required()
+@handle_exceptions
+def get_job(job_id):
+    """Status and progress of a job"""
+    job = _owned_job(job_id)
+    if not job:
+        return api_response('Job not found', status_code=404)
+
+    return api_response('Job status', public_job(job), status_code=200)
+
+
+@jobs_bp.route('/<job_id>/download', methods=['GET'])
+@jwt_required()
+@handle_exceptions
+def download_job_result(job_id):
+    """The finished report file"""
+    job = _owned_job(job_id)
+    if not job:
+        return api_response('Job not found', status_code=404)
+
+    if job['status'] != 'succeeded':
+        return api_response(f"Job is {job['status']}, no result to download", status_code=409)
+    if not os.path.exists(job['result_path']):
+        return api_response('Result has expired', status_code=410)
+
+    return send_file(
+        job['result_path'],
+        mimetype=job['content_type'],
+        as_attachment=True,
+        download_name=job['result_name'],
+        conditional=True,
+    )
+
+
+@jobs_bp.route('/<job_id>/cancel', methods=['POST'])
+@jwt_required()
+@handle_exceptions
+def cancel_job(job_id):
+    """Cancel a queued job, or stop a running one at its next progress update"""
+    job = _owned_job(job_id)
+    if not job:
+        return api_response('Job not found', status_code=404)
+
+    if job['status'] not in ('queued', 'running'):
+        return api_response(f"Job is already {job['status']}", status_code=409)
+
+    job = job_queue().cancel(job_id)
+    return api_response('Cancellation requested', public_job(job), status_code=202)
@@ -0,0 +1,167 @@
+"""
+Student self-service routes
+"""
+from flask import Blueprint, current_app
+from flask_jwt_extended import jwt_required
+from models import db, Attendance, AttendanceRemark, Course, Enrollment, Teacher, User
+from auth import load_principal
+from utils import api_response, handle_exceptions
+import sharding
+
+student_bp = Blueprint('student', __name__, url_prefix='/api/students')
+
+
+def _status_count(status):
+    # Cast, since MySQL's SUM() is a DECIMAL, which would be serialised as a string
+    return db.cast(
+        db.func.coalesce(db.func.sum(db.case((Attendance.status == status, 1), else_=0)), 0),
+        db.Integer,
+    )
+
+
+def _percentage(present, total):
+    return round(present / total * 100, 2) if total > 0 else 0
+
+
+def _course_counts(session, student_id):
+    """{course_id: (present, absent, late, last marked)} in one grouped query"""
+    rows = (
+        session.query(
+            Attendance.course_id,
+            _status_count('present'), _status_count('absent'), _status_count('late'),
+            db.func.max(Attendance.attendance_date),
+        )
+        .filter(Attendance.student_id == student_id)
+        .group_by(Attendance.course_id)
+    )
+    return {course_id: tuple(counts) for course_id, *counts in rows}
+
+
+def _recent_marks(session, student_id, limit):
+    """The latest `limit` marks per course, in one windowed query"""
+    position = db.func.row_number().over(
+        partition_by=Attendance.course_id,
+        order_by=(Attendance.attendance_date.desc(), Attendance.id.desc()),
+    ).label('position')
+    ranked = (
+        session.query(
+            Attendance.id, Attendance.course_id, Attendance.attendance_date, Attendance.status, position,
+        )
+        .filter(Attendance.student_id == student_id)
+        .subquery()
+    )
+    rows = (
+        session.query(ranked.c.id, ranked.c.course_id, ranked.c.attendance_date, ranked.c.status, AttendanceRemark.remarks)
+        .outerjoin(AttendanceRemark, AttendanceRemark.attendance_id == ranked.c.id)
+        .filter(ranked.c.position <= limit)
+        .order_by(ranked.c.course_id, ranked.c.position)
+        .all()
+    )
+    marks = {}
+    for attendance_id, course_id, attendance_date, status, remarks in rows:
+        marks.setdefault(course_id, []).append({
+            'id': attendance_id,
+            'attendance_date': attendance_date.isoformat(),
+            'status': status,
+            'remarks': remarks,
+        })
+    return marks
+
+
+@student_bp.route('/me/overview', methods=['GET'])
+@jwt_required()
+@handle_exceptions
+def get_my_overview():
+    """Active enrollments with per-course attendance and recent marks"""
+    principal = load_principal()
+    student = principal.student if principal else None
+
+    if not student:
+        return api_response('Student profile not found', status_code=404)
+
+    course_columns = (
+        Course.id, Course.course_code, Course.course_name, Course.semester, Course.credits,
+        User.first_name, User.last_name, Enrollment.enrollment_date,
+    )
+    enrollments = (
+        db.session.query(*course_columns)
+        .select_from(Enrollment)
+        .join(Course, Course.id == Enrollment.course_id)
+        .join(Teacher, Teacher.id == Course.teacher_id)
+        .join(User, User.id == Teacher.user_id)
+        .filter(Enrollment.student_id == student.id, Enrollment.is_active == True)
+        .order_by(Course.course_code)
+    )
+    limit = current_app.config['STUDENT_OVERVIEW_RECENT_MARKS']
+
+    if sharding.enabled():
+        # Attendance is on the shards: one grouped query and one windowed
+        # query per shard, matched up with the enrollments here
+        counts, recent = {}, {}
+        for shard_counts, shard_recent in sharding.fan_out(
+            lambda session: (_course_counts(session, student.id), _recent_marks(session, student.id, limit))
+        ):
+            counts.update(shard_counts)
+            recent.update(shard_recent)
+        rows = [tuple(row) + counts.get(row[0], (0, 0, 0, None)) for row in enrollments]
+    else:
+        # One row per active enrollment; the attendance join is per course so
+        # every count below comes out of the same grouped scan
+        rows = (
+            enrollments.add_columns(
+                _status_count('present'), _status_count('absent'), _status_count('late'),
+                db.func.max(Attendance.attendance_date),
+            )
+            .outerjoin(Attendance, db.and_(
+                Attendance.student_id == Enrollment.student_id,
+                Attendance.course_id == Enrollment.course_id,
+            ))
+            .group_by(*course_columns)
+            .all()
+        )
+        recent = _recent_marks(db.session, student.id, limit) if rows else {}
+
+    courses = []
+    overall = {'present': 0, 'absent': 0, 'late': 0}
+    for (course_id, code, name, semester, credits, first_name, last_name, enrolled_on,
+         present, absent, late, last_marked) in rows:
+        total = present + absent + late
+        overall['present'] += present
+        overall['absent'] += absent
+        overall['late'] += late
+        courses.append({
+            'course_id': course_id,
+            'course_code': code,
+            'course_name': name,
+            'semester': semester,
+            'credits': credits,
+            'teacher_name': f"{first_name} {last_name}",
+            'enrollment_date': enrolled_on.isoformat(),
+            'total_classes': total,
+            'present': present,
+            'absent': absent,
+            'late': late,
+            'attendance_percentage': _percentage(present, total),
+            'last_marked': last_marked.isoformat() if last_marked else None,
+            'recent_marks': recent.get(course_id, []),
+        })
+
+    total_classes = sum(overall.values())
+    return api_response(
+        'Student overview retrieved',
+        {
+            'student': {
+                'id': student.id,
+                'roll_number': student.roll_number,
+                'name': f"{principal.user.first_name} {principal.user.last_name}",
+            },
+            'courses': courses,
+            'statistics': {
+                'courses': len(courses),
+                'total_classes': total_classes,
+                **overall,
+                'attendance_percentage': _percentage(overall['present'], total_classes),
+            },
+        },
+        status_code=200
+    )
@@ -0,0 +1,356 @@
+"""
+In-memory people search for StudentTracker
+
+Each worker keeps a prefix + trigram index of users with their student or
+teacher profile. It is built in the background when the worker serves its
+first request, patched directly by the write endpoints of that worker, and
+caught up from `updated_at` every few seconds so changes made through other
+workers show up too. Until it is ready, searches go to the database.
+"""
+import bisect
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from flask import current_app
+
+from models import db, User, Student, Teacher
+
+# Candidates examined per query; keeps very short or very common prefixes
+# from turning a search into a scan of the whole index
+MAX_CANDIDATES = 2000
+
+# Trigram posting lists longer than this share of the index are too common
+# to narrow anything down and are skipped
+COMMON_TRIGRAM_RATIO = 0.05
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def document_tokens(document):
+    """Lower-cased search keys of one person"""
+    tokens = set()
+    for field in ('first_name', 'last_name', 'roll_number', 'employee_id'):
+        value = document.get(field)
+        if value:
+            tokens.update(value.lower().split())
+    email = (document.get('email') or '').lower()
+    if email:
+        tokens.add(email)
+        tokens.add(email.split('@')[0])
+    return tokens
+
+
+def document_trigrams(document):
+    """Trigrams of the name only; fuzzy matching emails or roll numbers is noise"""
+    name = f"{document.get('first_name') or ''} {document.get('last_name') or ''}".lower()
+    return set().union(*(_trigrams(part) for part in name.split())) if name.strip() else set()
+
+
+def _sort_key(document):
+    return f"{document['last_name']}\x00{document['first_name']}".lower()
+
+
+class PeopleIndex:
+    """Prefix and trigram index over people documents keyed by user id
+
+    The prefix index is one sorted list of (token, name, user_id) entries, so
+    the people whose keys start with a term form a contiguous range that is
+    already ordered by matched key and then by name - the ranking order.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._documents = {}
+        self._document_tokens = {}
+        self._prefixes = []
+        self._trigrams = defaultdict(set)
+        self.ready = False
+        self.watermark = None
+        self.synced_at = 0.0
+        self._owner_pid = None
+
+    def __len__(self):
+        return len(self._documents)
+
+    def load(self, documents):
+        """Replace the whole index; sorts once instead of inserting one by one"""
+        prefixes = []
+        trigrams = defaultdict(set)
+        document_map = {}
+        token_map = {}
+        for document in documents:
+            user_id = document['user_id']
+            tokens = document_tokens(document)
+            sort_key = _sort_key(document)
+            document_map[user_id] = document
+            token_map[user_id] = tokens
+            prefixes.extend((token, sort_key, user_id) for token in tokens)
+            for trigram in document_trigrams(document):
+                trigrams[trigram].add(user_id)
+        prefixes.sort()
+        with self._lock:
+            self._documents = document_map
+            self._document_tokens = token_map
+            self._prefixes = prefixes
+            self._trigrams = trigrams
+
+    def upsert(self, document):
+        """Add or replace one person"""
+        user_id = document['user_id']
+        with self._lock:
+            self._remove(user_id)
+            tokens = document_tokens(document)
+            sort_key = _sort_key(document)
+            self._documents[user_id] = document
+            self._document_tokens[user_id] = tokens
+            for token in tokens:
+                bisect.insort(self._prefixes, (token, sort_key, user_id))
+            for trigram in document_trigrams(document):
+                self._trigrams[trigram].add(user_id)
+
+    def _remove(self, user_id):
+        document = self._documents.pop(user_id, None)
+        if document is None:
+            return
+        sort_key = _sort_key(document)
+        for token in self._document_tokens.pop(user_id):
+            entry = (token, sort_key, user_id)
+            position = bisect.bisect_left(self._prefixes, entry)
+            if position < len(self._prefixes) and self._prefixes[position] == entry:
+                del self._prefixes[position]
+        for trigram in document_trigrams(document):
+            self._trigrams[trigram].discard(user_id)
+
+    def _range(self, term):
+        """Slice bounds of the entries whose token starts with term"""
+        low = bisect.bisect_left(self._prefixes, (term,))
+        high = bisect.bisect_left(self._prefixes, (term + '\uffff',), low)
+        return low, high
+
+    def _prefix_search(self, terms, limit, role):
+        # Walk the narrowest term's range; the others are checked per person
+        ranges = {term: self._range(term) for term in terms}
+        driver = min(terms, key=lambda term: ranges[term][1] - ranges[term][0])
+        low, high = ranges[driver]
+
+        scored = {}
+        for position in range(low, min(high, low + MAX_CANDIDATES)):
+            user_id = self._prefixes[position][2]
+            if user_id in scored:
+                continue
+            document = self._documents[user_id]
+            if role and document['role'] != role:
+                continue
+            tokens = self._document_tokens[user_id]
+            score = 0
+            for term in terms:
+                if term in tokens:
+                    score += 2
+                elif any(token.startswith(term) for token in tokens):
+                    score += 1
+                else:
+                    break
+            else:
+                scored[user_id] = score
+                if len(scored) >= limit and position >= bisect.bisect_left(
+                        self._prefixes, (driver + '\x00',), low, high):
+                    # past the exact-key matches with enough results
+                    break
+        return scored
+
+    def _trigram_search(self, query, limit, role):
+        wanted = _trigrams(query.replace(' ', ''))
+        if not wanted:
+            return {}
+        common = max(len(self._documents) * COMMON_TRIGRAM_RATIO, MAX_CANDIDATES)
+        postings = sorted(
+            (self._trigrams[t] for t in wanted if t in self._trigrams and len(self._trigrams[t]) <= common),
+            key=len,
+        )
+        # Anyone sharing half the trigrams appears in one of the rarest ones
+        candidates = set()
+        for posting in postings[:len(wanted) // 2 + 1]:
+            for user_id in posting:
+                candidates.add(user_id)
+                if len(candidates) >= MAX_CANDIDATES:
+                    break
+            else:
+                continue
+            break
+
+        wanted_postings = [self._trigrams.get(t, ()) for t in wanted]
+        scored = {}
+        for user_id in candidates:
+            document = self._documents[user_id]
+            if role and document['role'] != role:
+                continue
+            shared = sum(1 for posting in wanted_postings if user_id in posting)
+            if shared * 2 >= len(wanted):
+                scored[user_id] = round(shared / len(wanted), 3)
+        return scored
+
+    def search(self, query, limit=20, role=None):
+        """Ranked (score, document) pairs
+
+        Every term has to prefix-match one of the person's keys; an exact key
+        match scores 2 and a prefix 1 per term. Only when nothing matches that
+        way does trigram similarity on names (score below 1) catch misspellings.
+        """
+        terms = query.lower().split()
+        if not terms:
+            return []
+
+        with self._lock:
+            scored = self._prefix_search(terms, limit, role)
+            if not scored:
+                scored = self._trigram_search(' '.join(terms), limit, role)
+            results = [(score, self._documents[user_id]) for user_id, score in scored.items()]
+
+        results.sort(key=lambda item: (-item[0], _sort_key(item[1])))
+        return results[:limit]
+
+
+people_index = PeopleIndex()
+
+
+def _people_query():
+    return (
+        db.select(
+            User.id, User.role, User.first_name, User.last_name, User.email, User.is_active,
+            Student.id, Student.roll_number, Teacher.id, Teacher.employee_id,
+            User.updated_at, Student.updated_at, Teacher.updated_at,
+            Student.is_active, Teacher.is_active,
+        )
+        .select_from(User)
+        .outerjoin(Student, Student.user_id == User.id)
+        .outerjoin(Teacher, Teacher.user_id == User.id)
+    )
+
+
+def _to_document(row):
+    return {
+        'user_id': row[0],
+        'role': row[1],
+        'first_name': row[2],
+        'last_name': row[3],
+        'email': row[4],
+        # Deactivating the user or their student/teacher profile both count
+        'is_active': bool(row[5]) and row[13] is not False and row[14] is not False,
+        'student_id': row[6],
+        'roll_number': row[7],
+        'teacher_id': row[8],
+        'employee_id': row[9],
+    }
+
+
+def _changed_at(row):
+    return max(value for value in row[10:13] if value is not None)
+
+
+def build_index(app):
+    """Load every person into the index (runs in a background thread)"""
+    with app.app_context():
+        # Same clock as the models' updated_at defaults; anything written
+        # while the build runs is picked up again by the next sync
+        started = datetime.utcnow()
+        documents = [
+            _to_document(row)
+            for row in db.session.execute(_people_query().execution_options(yield_per=5000))
+        ]
+        people_index.load(documents)
+        people_index.watermark = started
+        people_index.synced_at = time.monotonic()
+        people_index.ready = True
+        db.session.remove()
+
+
+def sync_index():
+    """Apply people changed since the last sync (e.g. by other workers)"""
+    if not people_index.ready:
+        return
+    interval = current_app.config.get('SEARCH_INDEX_SYNC_SECONDS', 5)
+    if time.monotonic() - people_index.synced_at < interval:
+        return
+    people_index.synced_at = time.monotonic()
+    # >= so rows written in the same clock tick as the watermark are not lost
+    query = _people_query().where(db.or_(
+        User.updated_at >= people_index.watermark,
+        Student.updated_at >= people_index.watermark,
+        Teacher.updated_at >= people_index.watermark,
+    ))
+    for row in db.session.execute(query):
+        people_index.upsert(_to_document(row))
+        if _changed_at(row) > people_index.watermark:
+            people_index.watermark = _changed_at(row)
+
+
+def index_user(user_id):
+    """Refresh one person after a write in this worker"""
+    if not people_index.ready:
+        return
+    row = db.session.execute(_people_query().where(User.id == user_id)).first()
+    if row:
+        people_index.upsert(_to_document(row))
+
+
+def search_database(query, limit=20, role=None):
+    """Fallback while the index is cold: FULLTEXT on MySQL, LIKE prefix elsewhere
+
+    User input never reaches the patterns unescaped: the boolean-mode query
+    is built from word characters only (FULLTEXT splits on the rest anyway)
+    and LIKE wildcards are escaped (autoescape).
+    """
+    terms = query.split()
+    statement = _people_query()
+    if db.engine.dialect.name == 'mysql':
+        conditions = [
+            Student.roll_number.startswith(query, autoescape=True),
+            Teacher.employee_id.startswith(query, autoescape=True),
+        ]
+        words = re.findall(r'\w+', query)
+        if words:
+            boolean_query = ' '.join(f'+{word}*' for word in words)
+            conditions.append(
+                db.text("MATCH (users.first_name, users.last_name, users.email) "
+                        "AGAINST (:terms IN BOOLEAN MODE)").bindparams(terms=boolean_query)
+            )
+        statement = statement.where(db.or_(*conditions))
+    else:
+        for term in terms:
+            statement = statement.where(db.or_(
+                User.first_name.istartswith(term, autoescape=True),
+                User.last_name.istartswith(term, autoescape=True),
+                User.email.istartswith(term, autoescape=True),
+                Student.roll_number.istartswith(term, autoescape=True),
+                Teacher.employee_id.istartswith(term, autoescape=True),
+            ))
+    if role:
+        statement = statement.where(User.role == role)
+    statement = statement.order_by(User.last_name, User.first_name).limit(limit)
+    return [_to_document(row) for row in db.session.execute(statement)]
+
+
+def init_app(app):
+    """Start building the index in each worker process on its first request"""
+    if not app.config.get('SEARCH_INDEX_ENABLED', True):
+        return
+
+    @app.before_request
+    def _ensure_people_index():
+        pid = os.getpid()
+        if people_index._owner_pid == pid:
+            return
+        with people_index._lock:
+            if people_index._owner_pid == pid:
+                return
+            people_index._owner_pid = pid
+            people_index.ready = False
+        threading.Thread(
+            target=build_index, args=(app,), name='people-index-build', daemon=True
+        ).start()
@@ -0,0 +1,286 @@
+"""
+Horizontal sharding of attendance across several databases
+
+With ATTENDANCE_SHARDS set (a list of database URLs), the attendance and
+attendance_remarks tables live on those databases instead of the main one;
+users, students, courses, enrollments and everything else stay where they
+are. All attendance of a course is on one shard: the one
+ATTENDANCE_SHARD_PINS assigns it (to keep a campus's courses on its own
+database), otherwise crc32 of the course id modulo the number of shards.
+
+Course-scoped reads and writes go to the course's shard. Student-scoped
+reads fan out to every shard in parallel and merge the results. Rows read
+from a shard cannot join or lazy-load their student or course, which are
+on the main database: load_options() leaves those relationships out and
+attach_related() fills them in with one IN query each.
+
+Without ATTENDANCE_SHARDS the helpers hand out the main db.session, so
+callers have one code path for both layouts. The shard list and the pins
+must not change once attendance has been written; `python sharding.py`
+copies existing attendance from the main database onto the shards.
+"""
+import heapq
+import os
+import sys
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from flask import current_app, g
+from sqlalchemy import inspect, select
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+import fieldsets
+from models import db, Attendance, AttendanceRemark, Course, Student
+
+# Tables that live on the shards
+SHARDED_TABLES = (Attendance.__table__, AttendanceRemark.__table__)
+
+# Attendance relationships to rows on the main database
+REMOTE_RELATIONS = ('student', 'course', 'teacher')
+
+
+def bind_key(index):
+    return f'attendance_shard_{index}'
+
+
+def _course_key(course_id):
+    return str(uuid.UUID(str(course_id)))
+
+
+def init_app(app):
+    """Add a SQLALCHEMY_BINDS entry per shard (call before db.init_app)"""
+    shards = app.config.get('ATTENDANCE_SHARDS') or []
+    pins = {}
+    for course_id, index in (app.config.get('ATTENDANCE_SHARD_PINS') or {}).items():
+        if not isinstance(index, int) or not 0 <= index < len(shards):
+            raise ValueError(f'ATTENDANCE_SHARD_PINS: no shard {index!r} for course {course_id}')
+        pins[_course_key(course_id)] = index
+    app.config['ATTENDANCE_SHARD_PINS'] = pins
+
+    if shards:
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        binds.update({bind_key(index): url for index, url in enumerate(shards)})
+        app.config['SQLALCHEMY_BINDS'] = binds
+
+    @app.teardown_appcontext
+    def _close_shard_sessions(exception=None):
+        for session in g.pop('attendance_shard_sessions', {}).values():
+            session.close()
+
+
+def enabled():
+    return bool(current_app.config['ATTENDANCE_SHARDS'])
+
+
+def shard_count():
+    return len(current_app.config['ATTENDANCE_SHARDS'])
+
+
+def shard_for(course_id):
+    """Index of the shard holding a course's attendance"""
+    key = _course_key(course_id)
+    pinned = current_app.config['ATTENDANCE_SHARD_PINS'].get(key)
+    if pinned is not None:
+        return pinned
+    return zlib.crc32(uuid.UUID(key).bytes) % shard_count()
+
+
+def engine(index):
+    return db.engines[bind_key(index)]
+
+
+def shard_session(index):
+    """This app context's session on one shard (closed on teardown)"""
+    sessions = g.setdefault('attendance_shard_sessions', {})
+    if index not in sessions:
+        # Not expired on commit: rows are serialised after commit, and a
+        # refresh could not reach their relationships on the main database
+        sessions[index] = Session(bind=engine(index), expire_on_commit=False)
+    return sessions[index]
+
+
+def session_for(course_id):
+    """Session to read and write a course's attendance with"""
+    if not enabled():
+        return db.session
+    return shard_session(shard_for(course_id))
+
+
+def sessions_for(course_id=None):
+    """Sessions covering one course's attendance, or all attendance"""
+    if course_id:
+        return [session_for(course_id)]
+    if not enabled():
+        return [db.session]
+    return [shard_session(index) for index in range(shard_count())]
+
+
+def commit(session):
+    """Commit attendance changes, then anything pending on the main
+    database (e.g. a deletion tombstone)
+
+    Two databases, so not atomic: the attendance change is committed first.
+    """
+    session.commit()
+    if session is not db.session:
+        db.session.commit()
+
+
+def fan_out(read, course_id=None):
+    """[read(session)] for each shard involved, run on the shards in parallel
+
+    Each parallel read gets its own short-lived session, so whatever it
+    returns must already be loaded (rows come back detached).
+    """
+    if course_id or not enabled():
+        return [read(session) for session in sessions_for(course_id)]
+
+    engines = [engine(index) for index in range(shard_count())]
+
+    def run(shard_engine):
+        with Session(bind=shard_engine, expire_on_commit=False) as session:
+            return read(session)
+
+    with ThreadPoolExecutor(max_workers=len(engines)) as executor:
+        return list(executor.map(run, engines))
+
+
+def page_bounds(offset, limit, course_id=None):
+    """(offset, limit) each shard reads so merge_page() can cut one page
+
+    Every shard has to supply offset + limit rows, so deep pages cost
+    more with more shards.
+    """
+    if len(sessions_for(course_id)) == 1:
+        return offset, limit
+    return 0, offset + limit
+
+
+def merge_page(pages, key, offset, limit, reverse=False):
+    """One page out of per-shard pages sorted by `key` (see page_bounds)"""
+    if len(pages) == 1:
+        return pages[0]
+    return list(islice(heapq.merge(*pages, key=key, reverse=reverse), offset, offset + limit))
+
+
+def get_attendance(attendance_id):
+    """(session, record) for an attendance id, record None if not found"""
+    for session in sessions_for():
+        record = session.get(Attendance, attendance_id)
+        if record is not None:
+            return session, record
+    return db.session, None
+
+
+def load_options(fields=None, columns=()):
+    """fieldsets.load_options for Attendance, minus relationships a shard cannot load"""
+    return fieldsets.load_options(Attendance, fields, columns, exclude=REMOTE_RELATIONS if enabled() else ())
+
+
+def attach_related(records, fields=None):
+    """Set the student (with user) and course of shard rows from the main database"""
+    if not enabled() or not records:
+        return records
+    specs = Attendance.DICT_FIELDS.values() if fields is None else [Attendance.DICT_FIELDS[name] for name in fields]
+    relations = {path.split('.')[0] for spec in specs for path in spec.relations}
+
+    if 'student' in relations:
+        students = {
+            student.id: student
+            for student in Student.query.options(joinedload(Student.user)).filter(
+                Student.id.in_({record.student_id for record in records})
+            )
+        }
+        for record in records:
+            set_committed_value(record, 'student', students.get(record.student_id))
+    if 'course' in relations:
+        courses = {
+            course.id: course
+            for course in Course.query.filter(Course.id.in_({record.course_id for record in records}))
+        }
+        for record in records:
+            set_committed_value(record, 'course', courses.get(record.course_id))
+    return records
+
+
+def create_schema():
+    """Create the sharded tables on every shard that lacks them
+
+    Foreign keys to tables on the main database are left out.
+    """
+    if not enabled():
+        return
+    table_names = {table.name for table in SHARDED_TABLES}
+    for shard in range(shard_count()):
+        with engine(shard).begin() as connection:
+            existing = set(inspect(connection).get_table_names())
+            for table in SHARDED_TABLES:
+                if table.name in existing:
+                    continue
+                local_keys = [
+                    constraint for constraint in table.foreign_key_constraints
+                    if constraint.referred_table.name in table_names
+                ]
+                connection.execute(CreateTable(table, include_foreign_key_constraints=local_keys))
+                for index in table.indexes:
+                    connection.execute(CreateIndex(index))
+
+
+def distribute(chunk_rows=5000):
+    """Copy attendance (and remarks) from the main database onto the shards
+
+    Rows already on their shard are skipped, so an interrupted copy can be
+    run again. Returns the number of rows copied.
+    """
+    attendance = Attendance.__table__
+    remarks = AttendanceRemark.__table__
+    copied = 0
+    last_id = None
+    while True:
+        statement = select(attendance).order_by(attendance.c.id).limit(chunk_rows)
+        if last_id is not None:
+            statement = statement.where(attendance.c.id > last_id)
+        rows = [dict(row._mapping) for row in db.session.execute(statement)]
+        if not rows:
+            return copied
+        last_id = rows[-1]['id']
+
+        by_shard = {}
+        for row in rows:
+            by_shard.setdefault(shard_for(row['course_id']), []).append(row)
+        notes = {
+            row.attendance_id: row.remarks
+            for row in db.session.execute(select(remarks).where(remarks.c.attendance_id.in_([row['id'] for row in rows])))
+        }
+        for index, shard_rows in by_shard.items():
+            with engine(index).begin() as connection:
+                present = set(connection.execute(
+                    select(attendance.c.id).where(attendance.c.id.in_([row['id'] for row in shard_rows]))
+                ).scalars())
+                new_rows = [row for row in shard_rows if row['id'] not in present]
+                if new_rows:
+                    connection.execute(attendance.insert(), new_rows)
+                    new_notes = [
+                        {'attendance_id': row['id'], 'remarks': notes[row['id']]}
+                        for row in new_rows if row['id'] in notes
+                    ]
+                    if new_notes:
+                        connection.execute(remarks.insert(), new_notes)
+                copied += len(new_rows)
+        print(f"Copied {copied} attendance rows")
+
+
+if __name__ == '__main__':
+    from app import create_app
+
+    app = create_app(sys.argv[1] if len(sys.argv) > 1 else os.getenv('FLASK_ENV', 'production'))
+    with app.app_context():
+        if not enabled():
+            sys.exit('ATTENDANCE_SHARDS is not set')
+        create_schema()
+        distribute()
+        print("Attendance copied to the shards; clear the main attendance tables once verified")
@@ -4,13 +4,10 @@
 # Install Python dependencies
 pip install -r requirements.txt
 
-# Initialize database
-python -c "
-from app import create_app, db
-app = create_app('production')
-with app.app_context():
-    db.create_all()
-    print('Database initialized successfully')
-"
+# Apply schema changes once, before any worker starts
+python migrate.py production
+
+# Fingerprint and precompress static assets
+python build_assets.py
 
 echo "Deployment complete!"
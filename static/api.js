@@ -98,6 +98,10 @@ class APIClient {
         return this.request('GET', '/auth/me');
     }
 
+    async logout() {
+        return this.request('POST', '/auth/logout', { refresh_token: this.refreshToken });
+    }
+
     async refreshAccessToken() {
         const response = await this.request('POST', '/auth/refresh', {});
         if (response && response.data) {
@@ -194,10 +198,29 @@ class APIClient {
         return this.request('POST', `/courses/${courseId}/enroll`, {});
     }
 
+    async bulkEnroll(courseId, { studentIds = [], rollNumbers = [] } = {}) {
+        return this.request('POST', `/courses/${courseId}/enroll/bulk`, {
+            student_ids: studentIds,
+            roll_numbers: rollNumbers
+        });
+    }
+
     async unenrollFromCourse(courseId) {
         return this.request('POST', `/courses/${courseId}/unenroll`, {});
     }
 
+    async getWaitlist(courseId, page = 1, perPage = 50) {
+        return this.request('GET', `/courses/${courseId}/waitlist?page=${page}&per_page=${perPage}`);
+    }
+
+    async getMyWaitlistPosition(courseId) {
+        return this.request('GET', `/courses/${courseId}/waitlist/me`);
+    }
+
+    async leaveWaitlist(courseId) {
+        return this.request('DELETE', `/courses/${courseId}/waitlist/me`);
+    }
+
     // ==================== Attendance ====================
 
     async markAttendance(data) {
@@ -217,6 +240,10 @@ class APIClient {
         return this.request('GET', url);
     }
 
+    async getMyOverview() {
+        return this.request('GET', '/students/me/overview');
+    }
+
     async updateAttendance(attendanceId, data) {
         return this.request('PUT', `/attendance/${attendanceId}`, data);
     }
@@ -228,6 +255,57 @@ class APIClient {
     async getAttendanceSummary(courseId) {
         return this.request('GET', `/attendance/course/${courseId}/summary`);
     }
+
+    // ==================== Batch ====================
+
+    /**
+     * Send several API calls in one round trip
+     * requests: [{id, method, path, body}] with paths relative to /api
+     * Returns {id: {status, body}}; independent GETs may run in parallel
+     */
+    async batch(requests, parallel = true) {
+        const response = await this.request('POST', '/batch', {
+            parallel,
+            requests: requests.map(r => ({ ...r, path: `/api${r.path}` })),
+        });
+        if (!response || !response.success) return null;
+        const results = {};
+        response.data.responses.forEach(r => { results[r.id] = r; });
+        return results;
+    }
+
+    // ==================== Delta sync ====================
+
+    /**
+     * Keep a cached list fresh with ?since= deltas
+     * cache: object holding {items: Map(id -> row), watermark}; pass {} at first
+     * endpoint: the full-list endpoint, e.g. '/courses?per_page=100'
+     * listKey: where the full response keeps its rows, e.g. 'courses'
+     */
+    async syncList(endpoint, cache, listKey, idKey = 'id') {
+        if (!cache.watermark) {
+            const full = await this.request('GET', endpoint);
+            if (!full || !full.success) return full;
+            cache.items = new Map(full.data[listKey].map(row => [row[idKey], row]));
+            cache.watermark = full.data.watermark;
+            return full;
+        }
+
+        const separator = endpoint.includes('?') ? '&' : '?';
+        let response;
+        do {
+            response = await this.request('GET', `${endpoint}${separator}since=${encodeURIComponent(cache.watermark)}`);
+            if (response && response.status_code === 410) {
+                cache.watermark = null;
+                return this.syncList(endpoint, cache, listKey, idKey);
+            }
+            if (!response || !response.success) return response;
+            response.data.changed.forEach(row => cache.items.set(row[idKey], row));
+            response.data.deleted.forEach(id => cache.items.delete(id));
+            cache.watermark = response.data.watermark;
+        } while (response.data.has_more);
+        return response;
+    }
 }
 
 // Create global API client instance
@@ -159,6 +159,7 @@ async function handleRegister(event) {
 }
 
 async function handleLogout() {
+    await api.logout();
     api.clearAuth();
     document.getElementById('dashboard-section').classList.remove('active');
     showAuthSection();
@@ -268,6 +269,31 @@ async function loadDashboard() {
                 </div>
             `;
         }
+    } else if (hasRole('teacher') && api.currentUser.teacher) {
+        // Course list, then every course summary in a single batch
+        const courses = await api.listCourses(1, 100, api.currentUser.teacher.id);
+        if (!courses || !courses.success || courses.data.courses.length === 0) {
+            statsGrid.innerHTML = '<p>Select a section from the menu to get started.</p>';
+            return;
+        }
+        const summaries = await api.batch(courses.data.courses.map(course => ({
+            id: course.id,
+            method: 'GET',
+            path: `/attendance/course/${course.id}/summary`,
+        }))) || {};
+        statsGrid.innerHTML = courses.data.courses.map(course => {
+            const result = summaries[course.id];
+            const rows = result && result.status === 200 ? result.body.data : [];
+            const average = rows.length
+                ? (rows.reduce((sum, row) => sum + row.attendance_percentage, 0) / rows.length).toFixed(1) + '%'
+                : 'N/A';
+            return `
+                <div class="stat-card">
+                    <h3>${course.course_name}</h3>
+                    <div class="stat-value">${average}</div>
+                </div>
+            `;
+        }).join('');
     } else {
         statsGrid.innerHTML = '<p>Select a section from the menu to get started.</p>';
     }
@@ -574,7 +600,9 @@ function searchCourses() {
 
 async function enrollInCourse(courseId) {
     const response = await api.enrollInCourse(courseId);
-    if (response && response.success) {
+    if (response && response.success && response.data?.position) {
+        showToast(`Course is full, you are number ${response.data.position} on the waitlist`);
+    } else if (response && response.success) {
         showToast('Enrolled successfully');
         loadCourses();
     } else {
@@ -602,15 +630,18 @@ function editCourse(courseId) {
 
 // ==================== Attendance ====================
 
+// Teacher's courses, refreshed with ?since= deltas after the first load
+const teacherCoursesCache = {};
+
 async function loadTeacherCourses() {
     const teacher = api.currentUser.teacher;
     if (!teacher) return;
 
-    const response = await api.listCourses(1, 100, teacher.id);
+    const response = await api.syncList(`/courses?page=1&per_page=100&teacher_id=${teacher.id}`, teacherCoursesCache, 'courses');
     const select = document.getElementById('attendance-course');
 
     if (response && response.success) {
-        const courses = response.data.courses;
+        const courses = [...teacherCoursesCache.items.values()];
         select.innerHTML = '<option value="">-- Select Course --</option>' +
             courses.map(course => `
                 <option value="${course.id}">${course.course_name}</option>
@@ -45,6 +45,85 @@ async function loadCourseStudents(page=1){
   currentPage = resp.data.page
   totalPages = resp.data.pages
   renderPage(resp.data.students)
+  followCourse(courseId, dateVal || localDate())
+}
+
+// Live updates: the server pushes changed attendance rows (server-sent
+// events); read over fetch so the Authorization header can be sent
+let liveStream = null
+let liveKey = null
+
+function localDate(){
+  const d = new Date()
+  return `${d.getFullYear()}-${String(d.getMonth()+1).padStart(2,'0')}-${String(d.getDate()).padStart(2,'0')}`
+}
+
+async function followCourse(id, day){
+  if (liveKey === `${id}|${day}`) return
+  if (liveStream) liveStream.abort()
+  const controller = new AbortController()
+  liveStream = controller
+  liveKey = `${id}|${day}`
+  let lastEventId = null
+  let retry = 3000
+  while (!controller.signal.aborted) {
+    try {
+      const headers = {'Accept': 'text/event-stream'}
+      const token = localStorage.getItem('accessToken')
+      if (token) headers['Authorization'] = `Bearer ${token}`
+      if (lastEventId) headers['Last-Event-ID'] = lastEventId
+      const res = await fetch(`/api/attendance/course/${id}/stream?date=${day}`, {headers, signal: controller.signal})
+      if (res.status === 401 || res.status === 403 || res.status === 404) break
+      // Worker at its stream limit: come back when it says
+      if (res.status === 503) retry = Math.max(retry, (parseInt(res.headers.get('Retry-After'), 10) || 0) * 1000)
+      if (res.ok) {
+        const reader = res.body.pipeThrough(new TextDecoderStream()).getReader()
+        let buffer = ''
+        while (true) {
+          const {value, done} = await reader.read()
+          if (done) break
+          buffer += value.replace(/\r\n/g, '\n')
+          let end
+          while ((end = buffer.indexOf('\n\n')) >= 0) {
+            const msg = parseEvent(buffer.slice(0, end))
+            buffer = buffer.slice(end + 2)
+            if (msg.retry) retry = msg.retry
+            if (msg.id) lastEventId = msg.id
+            if (msg.event) applyLiveEvent(msg)
+          }
+        }
+      }
+    } catch (e) {
+      if (controller.signal.aborted) return
+    }
+    await new Promise(r => setTimeout(r, retry))
+  }
+  if (liveStream === controller) liveKey = null
+}
+
+function parseEvent(block){
+  const msg = {event: null, data: '', id: null, retry: null}
+  block.split('\n').forEach(line => {
+    if (!line || line.startsWith(':')) return
+    const sep = line.indexOf(':')
+    const field = sep < 0 ? line : line.slice(0, sep)
+    const value = sep < 0 ? '' : line.slice(sep + 1).replace(/^ /, '')
+    if (field === 'event') msg.event = value
+    else if (field === 'data') msg.data += value
+    else if (field === 'id') msg.id = value
+    else if (field === 'retry') msg.retry = parseInt(value, 10) || null
+  })
+  return msg
+}
+
+function applyLiveEvent(msg){
+  // Missed too much (slow connection or long disconnect): reload the page
+  if (msg.event === 'resync') return loadCourseStudents(currentPage)
+  if (msg.event !== 'attendance') return
+  JSON.parse(msg.data).records.forEach(r => {
+    const tr = document.querySelector(`#studentsTable tbody tr[data-student-id="${r.student_id}"]`)
+    if (tr) tr.querySelector('select').value = r.status || 'not_marked'
+  })
 }
 
 function renderPage(students){
@@ -2,7 +2,15 @@
 Utility functions for StudentTracker application
 """
 from functools import wraps
-from flask import jsonify
+from flask import current_app, jsonify, request
+from sqlalchemy.exc import StatementError
+
+# WSGI environ flag on requests dispatched internally by /api/batch
+SUBREQUEST_ENVIRON_KEY = 'studenttracker.subrequest'
+
+def is_subrequest():
+    """True inside a sub-request of /api/batch"""
+    return request.environ.get(SUBREQUEST_ENVIRON_KEY, False)
 
 def api_response(message=None, data=None, status_code=200):
     """Generate a standardized API response"""
@@ -26,7 +34,14 @@ def handle_exceptions(fn):
             return api_response(str(e), status_code=400)
         except PermissionError as e:
             return api_response(str(e), status_code=403)
+        except StatementError as e:
+            # Bind-time validation, e.g. a malformed id in the URL
+            if isinstance(e.orig, ValueError):
+                return api_response(str(e.orig), status_code=400)
+            current_app.logger.exception('Unhandled error in %s', request.endpoint)
+            return api_response('An error occurred: ' + str(e), status_code=500)
         except Exception as e:
+            current_app.logger.exception('Unhandled error in %s', request.endpoint)
             return api_response('An error occurred: ' + str(e), status_code=500)
     return wrapper
 
@@ -0,0 +1,165 @@
+"""
+Course waitlists
+
+Enrolling in a full course puts the student on its waitlist instead of
+turning them away. Entries are ordered by a per-course sequence number.
+When a seat frees up (an unenrollment, or a larger max_students) the head
+of the waitlist is enrolled in that same transaction, so a freed seat is
+never up for grabs and there is nothing to poll for.
+
+A course's sequence numbers have no gaps: promotion removes entries from
+the head, and removing anyone else (remove()) moves the entries behind
+them up by one. A student's place in the queue is therefore their sequence
+minus the head's, and the head is one seek on the (course_id, sequence)
+index however long the queue is.
+
+Every change to a course's seats or waitlist starts by locking the course
+row (SELECT ... FOR UPDATE). That serialises enrollments per course: the
+seat count read under the lock cannot change before the commit, so a
+course is never overbooked, and the next sequence number is never handed
+out twice. SQLite ignores FOR UPDATE; there writers are serialised by the
+database lock instead (see benchmarks/waitlist_contention_benchmark.py).
+
+Reads of enrollments and waitlist entries made under the lock are locking
+reads too. On InnoDB (REPEATABLE READ) a plain SELECT sees the snapshot
+taken by the transaction's first read - usually loading the user, before
+the course lock was granted - and would miss what the previous holder of
+the lock committed. A locking read always sees the latest committed rows.
+"""
+from models import db, Course, Enrollment, WaitlistEntry
+
+
+def lock_course(course_id):
+    """The course, its row locked until the transaction ends (None if missing)"""
+    return Course.query.filter_by(id=course_id).with_for_update().populate_existing().first()
+
+
+def seats_taken(course_id):
+    """Active enrollments, counted with a locking read (course row locked by the caller)"""
+    seats = (
+        db.select(Enrollment.id)
+        .where(Enrollment.course_id == course_id, Enrollment.is_active == True)
+        .with_for_update(read=True)
+        .subquery()
+    )
+    return db.session.execute(db.select(db.func.count()).select_from(seats)).scalar()
+
+
+def entry_for(course_id, student_id, locked=False):
+    """A student's waitlist entry; locked=True under the course lock"""
+    query = WaitlistEntry.query.filter_by(course_id=course_id, student_id=student_id)
+    if locked:
+        query = query.with_for_update().populate_existing()
+    return query.first()
+
+
+def join(course_id, student_id):
+    """Put a student at the back of the waitlist (course row locked by the caller)"""
+    last = (
+        db.session.query(WaitlistEntry.sequence)
+        .filter(WaitlistEntry.course_id == course_id)
+        .order_by(WaitlistEntry.sequence.desc())
+        .limit(1)
+        .with_for_update(read=True)
+        .scalar()
+    )
+    entry = WaitlistEntry(course_id=course_id, student_id=student_id, sequence=(last or 0) + 1)
+    db.session.add(entry)
+    return entry
+
+
+def position(entry):
+    """1-based place in the queue, from the head's sequence number"""
+    head = (
+        db.session.query(db.func.min(WaitlistEntry.sequence))
+        .filter(WaitlistEntry.course_id == entry.course_id)
+        .scalar()
+    )
+    return entry.sequence - head + 1
+
+
+def remove(course_id, entries):
+    """Take entries off the waitlist, closing the gaps they leave
+
+    The course row is locked by the caller. Entries behind a removed one
+    are renumbered (none are when only the head goes), in two steps
+    through negative numbers: a single UPDATE could collide with the
+    (course_id, sequence) unique constraint midway.
+    """
+    if not entries:
+        return
+    removed = sorted(entry.sequence for entry in entries)
+    for entry in entries:
+        db.session.delete(entry)
+    db.session.flush()
+
+    behind = db.session.execute(
+        db.select(WaitlistEntry.id, WaitlistEntry.sequence)
+        .where(WaitlistEntry.course_id == course_id, WaitlistEntry.sequence > removed[0])
+        .order_by(WaitlistEntry.sequence)
+        .with_for_update()
+    ).all()
+    ahead = (
+        db.session.query(WaitlistEntry.id)
+        .filter(WaitlistEntry.course_id == course_id, WaitlistEntry.sequence < removed[0])
+        .limit(1)
+        .first()
+    )
+    start = removed[0] if ahead or not behind else behind[0].sequence
+    moves = [
+        {'id': row.id, 'sequence': -(start + index)}
+        for index, row in enumerate(behind)
+        if row.sequence != start + index
+    ]
+    if not moves:
+        return
+    db.session.execute(db.update(WaitlistEntry), moves)
+    db.session.execute(
+        db.update(WaitlistEntry)
+        .where(WaitlistEntry.course_id == course_id, WaitlistEntry.sequence < 0)
+        .values(sequence=-WaitlistEntry.sequence)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.expire_all()
+
+
+def status(entry):
+    return dict(entry.to_dict(), position=position(entry))
+
+
+def enroll(course_id, student_id):
+    """Active enrollment for a student, reactivating an earlier one if there is one"""
+    enrollment = (
+        Enrollment.query.filter_by(student_id=student_id, course_id=course_id)
+        .with_for_update().populate_existing().first()
+    )
+    if enrollment:
+        enrollment.is_active = True
+    else:
+        enrollment = Enrollment(student_id=student_id, course_id=course_id)
+        db.session.add(enrollment)
+    return enrollment
+
+
+def promote(course):
+    """Enroll waitlisted students into the free seats, head first
+
+    The caller holds the course row lock and commits. Returns the
+    enrollments made.
+    """
+    free = course.max_students - seats_taken(course.id)
+    if free <= 0 or not course.is_active:
+        return []
+    heads = (
+        WaitlistEntry.query.filter_by(course_id=course.id)
+        .order_by(WaitlistEntry.sequence)
+        .limit(free)
+        .with_for_update()
+        .populate_existing()
+        .all()
+    )
+    promoted = []
+    for entry in heads:
+        promoted.append(enroll(course.id, entry.student_id))
+        db.session.delete(entry)
+    return promoted
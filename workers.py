@@ -0,0 +1,43 @@
+"""
+Identity and liveness of the processes that share host-local queues
+
+The attendance journal (write_behind.py) and the job queue (jobs.py) record
+which process claimed an entry as "<host>:<pid>", so a claim left by a
+process that has died on this host can be recovered without waiting for
+its timeout.
+"""
+import os
+import platform
+
+
+def worker_name():
+    """This process as "<host>:<pid>\""""
+    return f'{platform.node()}:{os.getpid()}'
+
+
+def pid_alive(pid):
+    """Whether a process with this id is running on this host"""
+    if os.name == 'nt':
+        return True  # os.kill(pid, 0) would terminate the process there
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def claimant_alive(claimed_by):
+    """Whether the process named by a worker_name() claim may still be running
+
+    Claims from other hosts cannot be checked and count as alive; callers
+    rely on their claim timeout for those.
+    """
+    host, _, pid = (claimed_by or '').rpartition(':')
+    if host != platform.node():
+        return True
+    try:
+        return pid_alive(int(pid))
+    except ValueError:
+        return False
@@ -0,0 +1,441 @@
+"""
+Write-behind mode for attendance submissions
+
+With `POST /api/attendance?async=1` (or `Prefer: respond-async`) the
+submission is validated, appended to a local SQLite journal in WAL mode
+and answered with 202 and a ticket. A flusher thread in every worker claims
+queued tickets, merges them and applies them to the main database as a few
+batched upserts, then records each ticket's outcome for
+`GET /api/attendance/tickets/<id>`.
+
+The journal is shared by all workers on the host. When a flusher starts it
+first requeues tickets claimed by processes that no longer exist (or whose
+claim is older than ATTENDANCE_CLAIM_TIMEOUT), so a crash loses nothing
+that was acknowledged.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from flask import current_app, request
+
+from db_types import parse_uuid, uuid7
+from models import db, Attendance, AttendanceRemark, Enrollment
+import roster_events
+import sharding
+from workers import claimant_alive, worker_name
+
+MAX_ATTEMPTS = 5
+
+# What a failed ticket reports; the exception itself only goes to the log,
+# since it can quote other submissions' statements and values
+FLUSH_ERROR = 'Could not write this submission'
+
+# Applied tickets are kept this long for status queries
+RETENTION_SECONDS = 86400
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tickets (
+    id TEXT PRIMARY KEY,
+    owner_user_id TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    claimed_by TEXT,
+    claimed_at REAL,
+    result TEXT,
+    created_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS ix_tickets_status ON tickets (status, created_at);
+"""
+
+
+class AttendanceJournal:
+    """Durable ticket queue in a SQLite file (one connection per thread)"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=FULL')
+            connection.executescript(SCHEMA)
+            self._local.connection = connection
+        return connection
+
+    def append(self, owner_user_id, payload):
+        """Durably queue a submission and return its ticket id"""
+        ticket_id = str(uuid.uuid4())
+        self._connection().execute(
+            "INSERT INTO tickets (id, owner_user_id, payload, created_at) VALUES (?, ?, ?, ?)",
+            (ticket_id, owner_user_id, json.dumps(payload), time.time()),
+        )
+        return ticket_id
+
+    def claim(self, worker, limit):
+        """Take up to `limit` queued tickets, oldest first"""
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            rows = connection.execute(
+                "SELECT id, payload FROM tickets WHERE status = 'queued' ORDER BY created_at LIMIT ?",
+                (limit,),
+            ).fetchall()
+            connection.executemany(
+                "UPDATE tickets SET status = 'flushing', claimed_by = ?, claimed_at = ?, "
+                "attempts = attempts + 1 WHERE id = ?",
+                [(worker, time.time(), ticket_id) for ticket_id, _ in rows],
+            )
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        return [(ticket_id, json.loads(payload)) for ticket_id, payload in rows]
+
+    def finish(self, results):
+        """Record the outcome of flushed tickets: {ticket_id: result}"""
+        now = time.time()
+        self._connection().executemany(
+            "UPDATE tickets SET status = 'applied', result = ?, finished_at = ? WHERE id = ?",
+            [(json.dumps(result), now, ticket_id) for ticket_id, result in results.items()],
+        )
+
+    def release(self, ticket_ids, error):
+        """Put tickets back in the queue after a failed flush, or fail them for good"""
+        now = time.time()
+        self._connection().executemany(
+            "UPDATE tickets SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END, "
+            "claimed_by = NULL, result = ?, finished_at = ? WHERE id = ?",
+            [(MAX_ATTEMPTS, json.dumps({'error': error}), now, ticket_id) for ticket_id in ticket_ids],
+        )
+
+    def recover(self, claim_timeout):
+        """Requeue tickets whose flusher died mid-flush
+
+        Claims by processes on this host that no longer exist are released
+        at once; any claim older than `claim_timeout` is released too.
+        """
+        connection = self._connection()
+        stale = []
+        rows = connection.execute(
+            "SELECT id, claimed_by, claimed_at FROM tickets WHERE status = 'flushing'"
+        ).fetchall()
+        for ticket_id, claimed_by, claimed_at in rows:
+            if claimed_at < time.time() - claim_timeout or not claimant_alive(claimed_by):
+                stale.append((ticket_id,))
+        connection.executemany(
+            "UPDATE tickets SET status = 'queued', claimed_by = NULL WHERE id = ? AND status = 'flushing'",
+            stale,
+        )
+        return len(stale)
+
+    def purge(self):
+        self._connection().execute(
+            "DELETE FROM tickets WHERE status IN ('applied', 'failed') AND finished_at < ?",
+            (time.time() - RETENTION_SECONDS,),
+        )
+
+    def get(self, ticket_id):
+        row = self._connection().execute(
+            "SELECT owner_user_id, status, attempts, result, created_at, finished_at FROM tickets WHERE id = ?",
+            (ticket_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        owner_user_id, status, attempts, result, created_at, finished_at = row
+        return {
+            'ticket_id': ticket_id,
+            'owner_user_id': owner_user_id,
+            'status': status,
+            'attempts': attempts,
+            'result': json.loads(result) if result else None,
+            'created_at': datetime.utcfromtimestamp(created_at).isoformat(),
+            'finished_at': datetime.utcfromtimestamp(finished_at).isoformat() if finished_at else None,
+        }
+
+
+_journal = None
+_flusher_pid = None
+_flusher_lock = threading.Lock()
+_wakeup = threading.Event()
+
+
+def journal(app=None):
+    global _journal
+    if _journal is None:
+        config = (app or current_app).config
+        _journal = AttendanceJournal(config['ATTENDANCE_JOURNAL_PATH'])
+    return _journal
+
+
+def wants_async():
+    """True when the client asked for (and the server allows) deferred writes"""
+    if not current_app.config.get('ATTENDANCE_ASYNC_ENABLED', True):
+        return False
+    if request.args.get('async', '').lower() in ('1', 'true'):
+        return True
+    return 'respond-async' in request.headers.get('Prefer', '')
+
+
+def _canonical_id(value):
+    """The canonical string form of a UUID in any accepted form, or None"""
+    try:
+        return str(parse_uuid(value))
+    except ValueError:
+        return None
+
+
+def validate_records(course_id, records):
+    """Check a submission up front; returns (clean_records, errors)
+
+    Enrollment is checked with one set query instead of one per student.
+    Student ids are normalised the way the database column parses them, so
+    the same submission is accepted here and in synchronous mode.
+    """
+    valid_statuses = ('present', 'absent', 'late')
+    clean = []
+    errors = []
+    student_ids = {
+        _canonical_id(record.get('student_id')) for record in records if isinstance(record, dict)
+    } - {None}
+    enrolled = {
+        student_id for (student_id,) in db.session.query(Enrollment.student_id).filter(
+            Enrollment.course_id == course_id,
+            Enrollment.is_active == True,
+            Enrollment.student_id.in_(student_ids),
+        )
+    } if student_ids else set()
+    for record in records:
+        if not isinstance(record, dict) or not all(field in record for field in ['student_id', 'status']):
+            errors.append("Invalid record: missing fields")
+            continue
+        student_id = _canonical_id(record['student_id'])
+        if student_id is None:
+            errors.append(f"Invalid student_id: {record['student_id']}")
+            continue
+        if student_id not in enrolled:
+            errors.append(f"Student {record['student_id']} not enrolled in this course")
+            continue
+        if record['status'] not in valid_statuses:
+            errors.append(f"Invalid status: {record['status']}")
+            continue
+        try:
+            attendance_date = datetime.fromisoformat(
+                record.get('attendance_date', datetime.now().isoformat())
+            ).date()
+        except (TypeError, ValueError):
+            errors.append(f"Invalid attendance_date: {record.get('attendance_date')}")
+            continue
+        if not isinstance(record.get('remarks'), (str, type(None))):
+            errors.append(f"Invalid remarks for student {record['student_id']}: must be text")
+            continue
+        clean.append({
+            'student_id': student_id,
+            'status': record['status'],
+            'attendance_date': attendance_date.isoformat(),
+            'remarks': record.get('remarks') or '',
+        })
+    return clean, errors
+
+
+def enqueue(owner_user_id, course_id, teacher_id, records):
+    """Journal a validated submission and wake this worker's flusher"""
+    ticket_id = journal().append(owner_user_id, {
+        'course_id': course_id,
+        'teacher_id': teacher_id,
+        'records': records,
+    })
+    ensure_flusher(current_app._get_current_object())
+    _wakeup.set()
+    return ticket_id
+
+
+def apply_batch(tickets):
+    """Merge claimed tickets and write them with batched upserts
+
+    Later tickets win when several set the same (student, course, date).
+    With sharded attendance each shard's part is written and committed on
+    its own; a batch that fails half way is retried whole, which writes the
+    same values again on the shards already done.
+    Returns {ticket_id: result}.
+    """
+    merged = {}
+    for ticket_id, payload in tickets:
+        for record in payload['records']:
+            key = (record['student_id'], payload['course_id'], record['attendance_date'])
+            merged[key] = (payload['teacher_id'], record)
+
+    by_session = {}
+    for key, value in merged.items():
+        by_session.setdefault(sharding.session_for(key[1]), {})[key] = value
+    ids = {}
+    for session, shard_merged in by_session.items():
+        ids.update(_upsert(session, shard_merged))
+
+    deltas = {}
+    for key, (teacher_id, record) in merged.items():
+        deltas.setdefault(key[1], []).append(roster_events.attendance_delta(
+            ids[key], key[0], key[2], record['status'], record.get('remarks') or ''
+        ))
+    for course_id, records in deltas.items():
+        roster_events.publish(course_id, records)
+
+    return {
+        ticket_id: {'marked_count': len(payload['records'])}
+        for ticket_id, payload in tickets
+    }
+
+
+def _upsert(session, merged):
+    """Write merged records with one session and commit; returns {key: attendance id}"""
+    existing = {}
+    if merged:
+        rows = session.query(
+            Attendance.id, Attendance.student_id, Attendance.course_id, Attendance.attendance_date
+        ).filter(
+            Attendance.course_id.in_(list({key[1] for key in merged})),
+            Attendance.attendance_date.in_(list({datetime.fromisoformat(key[2]).date() for key in merged})),
+            Attendance.student_id.in_(list({key[0] for key in merged})),
+        )
+        for attendance_id, student_id, course_id, attendance_date in rows:
+            existing[(student_id, course_id, attendance_date.isoformat())] = attendance_id
+
+    now = datetime.utcnow()
+    inserts, updates, remarks = [], [], []
+    ids = {}
+    for key, (teacher_id, record) in merged.items():
+        attendance_id = existing.get(key)
+        if attendance_id:
+            updates.append({'id': attendance_id, 'status': record['status'], 'updated_at': now})
+        else:
+            attendance_id = str(uuid7())
+            inserts.append({
+                'id': attendance_id,
+                'student_id': key[0],
+                'course_id': key[1],
+                'teacher_id': teacher_id,
+                'attendance_date': datetime.fromisoformat(key[2]).date(),
+                'status': record['status'],
+                'created_at': now,
+                'updated_at': now,
+            })
+        ids[key] = attendance_id
+        remarks.append((attendance_id, record.get('remarks') or ''))
+
+    if inserts:
+        session.execute(db.insert(Attendance), inserts)
+    if updates:
+        session.execute(db.update(Attendance), updates)
+    if remarks:
+        session.query(AttendanceRemark).filter(
+            AttendanceRemark.attendance_id.in_([attendance_id for attendance_id, _ in remarks])
+        ).delete(synchronize_session=False)
+        non_empty = [{'attendance_id': a, 'remarks': text} for a, text in remarks if text]
+        if non_empty:
+            session.execute(db.insert(AttendanceRemark), non_empty)
+    session.commit()
+    return ids
+
+
+def _apply(app, tickets):
+    """apply_batch() in its own app context (fresh sessions); None if it failed"""
+    with app.app_context():
+        try:
+            return apply_batch(tickets)
+        except Exception:
+            db.session.rollback()
+            app.logger.exception('Could not flush attendance tickets %s', [ticket_id for ticket_id, _ in tickets])
+            return None
+        finally:
+            db.session.remove()
+
+
+def flush_once(app):
+    """Claim and apply one batch; returns the number of tickets flushed
+
+    When the merged batch fails, its tickets are retried one by one, so a
+    submission the database rejects fails alone instead of taking the
+    others claimed with it down too.
+    """
+    tickets = journal(app).claim(worker_name(), app.config['ATTENDANCE_FLUSH_BATCH'])
+    if not tickets:
+        return 0
+    results = _apply(app, tickets)
+    if results is not None:
+        journal(app).finish(results)
+        return len(tickets)
+    if len(tickets) == 1:
+        journal(app).release([tickets[0][0]], FLUSH_ERROR)
+        return 0
+    applied = 0
+    for ticket in tickets:
+        results = _apply(app, [ticket])
+        if results is None:
+            journal(app).release([ticket[0]], FLUSH_ERROR)
+        else:
+            journal(app).finish(results)
+            applied += 1
+    return applied
+
+
+def _flusher(app):
+    config = app.config
+    recovered_at = None
+    while True:
+        try:
+            # Recovery runs first thing after (re)start, then periodically
+            if recovered_at is None or time.monotonic() - recovered_at > config['ATTENDANCE_CLAIM_TIMEOUT']:
+                journal(app).recover(config['ATTENDANCE_CLAIM_TIMEOUT'])
+                journal(app).purge()
+                recovered_at = time.monotonic()
+            while flush_once(app):
+                pass
+        except Exception:
+            app.logger.exception('Attendance flusher error')
+        _wakeup.wait(config['ATTENDANCE_FLUSH_INTERVAL'])
+        _wakeup.clear()
+        # Let a burst accumulate briefly so it is written as one batch
+        time.sleep(config['ATTENDANCE_COALESCE_DELAY'])
+
+
+def ensure_flusher(app):
+    """Start this process's flusher thread (once per worker after fork)"""
+    global _flusher_pid
+    if _flusher_pid == os.getpid():
+        return
+    with _flusher_lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+        threading.Thread(target=_flusher, args=(app,), name='attendance-flusher', daemon=True).start()
+
+
+def start_flusher(app):
+    """Start the flusher at process startup (gunicorn post_fork, dev server)
+
+    It first replays what a previous run left in the journal, so a
+    restarted worker recovers without waiting for traffic.
+    """
+    if app.config.get('ATTENDANCE_ASYNC_ENABLED', True):
+        ensure_flusher(app)
+
+
+def init_app(app):
+    """Start the flusher on the first request of a process no startup hook
+    ran for (e.g. under wfastcgi, which starts processes for requests)"""
+    if not app.config.get('ATTENDANCE_ASYNC_ENABLED', True):
+        return
+
+    @app.before_request
+    def _start_attendance_flusher():
+        ensure_flusher(app)